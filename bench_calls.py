@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Colon-word call benchmark for rpyforth.
+
+Runs a loop that calls two small colon words per iteration, one returning
+through a mid-word EXIT and one through the EXIT compiled by ';', and
+reports colon-word calls per second.
+
+Usage:
+    python bench_calls.py [-n ITERATIONS] [EXECUTABLE ...]
+
+Each EXECUTABLE (e.g. ./rpyforth-c built before and after a change) is
+timed in turn.  Without one, the untranslated interpreter is run in
+process, which needs rpython importable (see forth.sh).
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Inlining is turned off so every STEP/BUMP really is a call.
+PROGRAM = """
+: STEP ( n -- n+1 ) DUP 0< 0= IF 1+ EXIT THEN 1- ;
+: BUMP ( n -- n' ) DUP 0< IF 1- THEN 1+ ;
+: BENCH ( iterations -- ) 0 SWAP 0 DO STEP BUMP LOOP DROP ;
+%d BENCH
+"""
+CALLS_PER_ITERATION = 2
+
+
+def run_in_process(source):
+    from rpyforth.inner_interp import InnerInterpreter
+    from rpyforth.outer_interp import OuterInterpreter
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.inline_threshold = 0
+    start = time.time()
+    for line in source.split('\n'):
+        outer.interpret_line(line)
+    return time.time() - start
+
+
+def run_executable(exe, source):
+    fd, path = tempfile.mkstemp(suffix='.fs')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(source)
+        start = time.time()
+        subprocess.check_call([exe, '--inline', '0', path])
+        return time.time() - start
+    finally:
+        os.remove(path)
+
+
+def report(label, iterations, elapsed):
+    calls = iterations * CALLS_PER_ITERATION
+    print("%-24s %10d calls %8.3f s %14.0f calls/s"
+          % (label, calls, elapsed, calls / elapsed))
+
+
+def main(argv):
+    iterations = None
+    if len(argv) > 2 and argv[1] == '-n':
+        iterations = int(argv[2])
+        argv = argv[:1] + argv[3:]
+    executables = argv[1:]
+    if not executables:
+        iterations = iterations or 20000
+        report("(untranslated)", iterations,
+               run_in_process(PROGRAM % iterations))
+        return 0
+    iterations = iterations or 10000000
+    for exe in executables:
+        report(exe, iterations, run_executable(exe, PROGRAM % iterations))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
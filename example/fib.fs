@@ -0,0 +1,3 @@
+\ Recursive Fibonacci: calls, no loops, so traces start at the entry of FIB
+: FIB ( n -- fib ) DUP 2 < IF EXIT THEN DUP 1- RECURSE SWAP 2 - RECURSE + ;
+32 FIB .
@@ -88,7 +88,7 @@ FVARIABLE TEMP
     ELSE DUP 96 < IF
       DROP 37            \ '%'
     ELSE
-      64                 \ '@'
+      DROP 64            \ '@'
     THEN THEN THEN THEN THEN THEN THEN THEN THEN
   THEN
 ;
@@ -0,0 +1,128 @@
+"""
+Compact bytecode encoding of code threads.
+
+A CodeThread keeps two parallel lists with one slot per word, so every word
+costs a Word pointer plus a (mostly ZERO) lits pointer.  A BytecodeThread
+packs the same definition into a single int array: each word is one opcode,
+and only operand words (Word.operand) are followed by an operand slot.
+
+Opcodes index the thread's own table of the distinct words it uses.  An
+operand slot holds an integer shifted left by one, or, with the low bit
+set, an index into a side pool of the values that are not small integers
+(floats, strings, xts, ...).  Branch operands are slot offsets in ops.
+
+``to_lists`` decodes a BytecodeThread back into the (code, lits) form the
+compiler passes and debugging tools work on.
+"""
+
+import sys
+
+from rpyforth.objects import Thread, W_IntObject, ZERO, wrap_int
+
+# integers that still fit in a slot after the tag shift
+INLINE_MAX = sys.maxint >> 1
+INLINE_MIN = -INLINE_MAX - 1
+
+
+class BytecodeThread(Thread):
+    _immutable_fields_ = ["ops[*]", "words[*]", "consts[*]"]
+
+    def __init__(self, ops, words, consts):
+        Thread.__init__(self)
+        self.ops = ops       # list of int: opcodes and tagged operands
+        self.words = words   # list of Words, indexed by opcode
+        self.consts = consts # list of W_Objects, the operand pool
+
+    def length(self):
+        return len(self.ops)
+
+    def word_at(self, ip):
+        return self.words[self.ops[ip]]
+
+    def next_ip(self, ip, w):
+        if w.operand:
+            return ip + 2
+        return ip + 1
+
+    def lit_at(self, i):
+        op = self.ops[i]
+        if op & 1:
+            return self.consts[op >> 1]
+        return wrap_int(op >> 1)
+
+    def int_at(self, i):
+        op = self.ops[i]
+        if op & 1:
+            w_lit = self.consts[op >> 1]
+            assert isinstance(w_lit, W_IntObject)
+            return w_lit.intval
+        return op >> 1
+
+    def is_inline_int(self, i):
+        return not (self.ops[i] & 1)
+
+    def to_lists(self):
+        n = len(self.ops)
+        old_index = [0] * (n + 1) # slot -> index in code
+        new_code = []
+        new_lits = []
+        ip = 0
+        while ip < n:
+            w = self.word_at(ip)
+            old_index[ip] = len(new_code)
+            new_code.append(w)
+            if w.operand:
+                new_lits.append(self.lit_at(ip + 1))
+            else:
+                new_lits.append(ZERO)
+            ip = self.next_ip(ip, w)
+        old_index[n] = len(new_code)
+        # the same fixed-size lists as CodeThread
+        code = [new_code[k] for k in range(len(new_code))]
+        lits = [new_lits[k] for k in range(len(new_lits))]
+        for i in range(len(code)):
+            if code[i].branch:
+                w_target = lits[i]
+                assert isinstance(w_target, W_IntObject)
+                lits[i] = wrap_int(old_index[w_target.intval])
+        return code, lits
+
+
+def fits_inline(x):
+    return INLINE_MIN <= x <= INLINE_MAX
+
+
+def encode_thread(code, lits):
+    """Encode the (code, lits) of a finished definition as bytecode."""
+    n = len(code)
+    new_index = [0] * (n + 1)
+    size = 0
+    for i in range(n):
+        new_index[i] = size
+        size += 2 if code[i].operand else 1
+    new_index[n] = size
+
+    ops = [0] * size
+    words = []
+    opcodes = {}
+    consts = []
+    for i in range(n):
+        w = code[i]
+        if w not in opcodes:
+            opcodes[w] = len(words)
+            words.append(w)
+        slot = new_index[i]
+        ops[slot] = opcodes[w]
+        if not w.operand:
+            continue
+        w_lit = lits[i]
+        if w.branch:
+            assert isinstance(w_lit, W_IntObject)
+            ops[slot + 1] = new_index[w_lit.intval] << 1
+        elif isinstance(w_lit, W_IntObject) and fits_inline(w_lit.intval):
+            ops[slot + 1] = w_lit.intval << 1
+        else:
+            ops[slot + 1] = (len(consts) << 1) | 1
+            consts.append(w_lit)
+    return BytecodeThread(ops, [words[k] for k in range(len(words))],
+                          [consts[k] for k in range(len(consts))])
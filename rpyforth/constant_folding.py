@@ -0,0 +1,251 @@
+"""
+Compile-time constant folding.
+
+At ``;``, after the peephole pass, a word whose inputs are all literals and
+which only touches the data stack is run on the spot, and the literals and
+the word are replaced by LITs of the values it leaves.  ``80 CONSTANT WIDTH
+: T WIDTH 2 * ;`` compiles T to ``LIT 160 EXIT``.  Folded results feed the
+words after them, so whole literal expressions collapse.  Literals that a
+branch may jump over are never combined with the words before the target.
+"""
+
+from rpyforth.objects import W_IntObject, W_FloatObject, CodeThread, ZERO
+from rpyforth.optimizer import branch_target, find_branch_targets, \
+    relocate_branches
+from rpyforth.stack_effects import ThreadEffect
+
+
+# Operand kinds of the primitives constant folding may evaluate at compile
+# time.  They have no side effects beyond the data stack.
+FOLD_INT = 0    # integer operands
+FOLD_FLOAT = 1  # float operands
+FOLD_ANY = 2    # stack shuffles, any operands
+FOLD_DIV = 3    # integer operands, top one is a divisor
+FOLD_FDIV = 4   # float operands, top one is a divisor
+
+PURE_PRIMITIVES = {
+    "0=": FOLD_INT, "0<": FOLD_INT, "0>": FOLD_INT, ">": FOLD_INT,
+    "<": FOLD_INT, "0<>": FOLD_INT, "=": FOLD_INT,
+    "MAX": FOLD_INT, "MIN": FOLD_INT, "RSHIFT": FOLD_INT, "LSHIFT": FOLD_INT,
+    "S>D": FOLD_INT, "BL": FOLD_INT, "+": FOLD_INT, "-": FOLD_INT,
+    "*": FOLD_INT, "ABS": FOLD_INT, "NEGATE": FOLD_INT, "1+": FOLD_INT,
+    "1-": FOLD_INT, "M*": FOLD_INT, "CELL": FOLD_INT, "CELL+": FOLD_INT,
+    "CELLS": FOLD_INT, "CHAR+": FOLD_INT, "CHARS": FOLD_INT,
+    "ALIGNED": FOLD_INT, "S>F": FOLD_INT, "(DUP*)": FOLD_INT,
+    "(OVER+)": FOLD_INT, "(LIT+)": FOLD_INT,
+    "(RAW+)": FOLD_INT, "(RAW-)": FOLD_INT, "(RAW*)": FOLD_INT,
+    "(RAW<)": FOLD_INT, "(RAW>)": FOLD_INT, "(RAW=)": FOLD_INT,
+    "MOD": FOLD_DIV,
+    "DUP": FOLD_ANY, "DROP": FOLD_ANY, "SWAP": FOLD_ANY, "OVER": FOLD_ANY,
+    "2DUP": FOLD_ANY, "2DROP": FOLD_ANY, "2SWAP": FOLD_ANY, "2OVER": FOLD_ANY,
+    "ROT": FOLD_ANY, "-ROT": FOLD_ANY, "2ROT": FOLD_ANY, "NIP": FOLD_ANY,
+    "2NIP": FOLD_ANY, "TUCK": FOLD_ANY, "FSWAP": FOLD_ANY,
+    "F*": FOLD_FLOAT, "F+": FOLD_FLOAT, "F-": FOLD_FLOAT, "F>": FOLD_FLOAT,
+    "FDUP": FOLD_FLOAT,
+    "(RAWF+)": FOLD_FLOAT, "(RAWF-)": FOLD_FLOAT, "(RAWF*)": FOLD_FLOAT,
+    "(RAWF>)": FOLD_FLOAT,
+    "F/": FOLD_FDIV, "(RAWF/)": FOLD_FDIV,
+}
+
+# Of the words above, those that read their lits slot, an integer.
+PURE_OPERAND_WORDS = ["(LIT+)"]
+
+
+# Branches a pure colon word may contain, provided they jump forward.
+PURE_BRANCHES = ["BRANCH", "0BRANCH", "(0=0BRANCH)", "(<0BRANCH)",
+                 "(>0BRANCH)", "(=0BRANCH)"]
+
+
+class ConstantFolder(object):
+    """Evaluates pure words whose inputs are all literals.
+
+    Evaluation runs on the live InnerInterpreter, above its current stack
+    contents, and leaves the stack as it found it.  Besides the primitives
+    in PURE_PRIMITIVES, a colon word is pure when it only uses literals,
+    non-dividing primitives, forward branches and other pure colon words,
+    all of either integer or float operands, and its stack effect checks.
+    It folds with that operand kind.
+    """
+
+    def __init__(self, dictionary, checker, inner):
+        self.kinds = {}
+        for name, kind in PURE_PRIMITIVES.items():
+            if name in dictionary:
+                self.kinds[dictionary[name]] = kind
+        self.branches = {}
+        for name in PURE_BRANCHES:
+            if name in dictionary:
+                self.branches[dictionary[name]] = None
+        self.checker = checker # stack_effects.StackChecker
+        self.inner = inner
+        self.wLIT = dictionary["LIT"]
+        self.wEXIT = dictionary["EXIT"]
+        self.operand_words = {}
+        for name in PURE_OPERAND_WORDS:
+            if name in dictionary:
+                self.operand_words[dictionary[name]] = None
+        self.thread_kinds = {} # CodeThread -> fold kind, -1 if impure
+
+    def thread_kind(self, thread):
+        """The operand kind a colon word's thread folds with, or -1."""
+        if thread in self.thread_kinds:
+            return self.thread_kinds[thread]
+        self.thread_kinds[thread] = -1 # recursion is not pure
+        kind = self._thread_kind(thread)
+        self.thread_kinds[thread] = kind
+        return kind
+
+    def _thread_kind(self, thread):
+        code, lits = thread.to_lists()
+        kind = FOLD_ANY
+        for i in range(len(code)):
+            w = code[i]
+            if w is self.wLIT:
+                w_lit = lits[i]
+                if isinstance(w_lit, W_IntObject):
+                    kind = join_kinds(kind, FOLD_INT)
+                elif isinstance(w_lit, W_FloatObject):
+                    kind = join_kinds(kind, FOLD_FLOAT)
+                else:
+                    return -1
+            elif w is self.wEXIT:
+                pass
+            elif w.branch:
+                # no loops, so evaluation always terminates
+                if w not in self.branches:
+                    return -1
+                if branch_target(lits[i]) <= i:
+                    return -1
+            elif w.operand and w not in self.operand_words:
+                return -1
+            elif w.prim is not None:
+                w_kind = self.kinds.get(w, -1)
+                if w_kind == -1 or w_kind == FOLD_DIV or w_kind == FOLD_FDIV:
+                    return -1
+                kind = join_kinds(kind, w_kind)
+            elif w.thread is None:
+                return -1
+            else:
+                kind = join_kinds(kind, self.thread_kind(w.thread))
+            if kind == -1:
+                return -1
+        return kind
+
+    def fold_kind(self, w):
+        """The operand kind w folds with, or -1 if it never folds."""
+        if w.branch:
+            return -1
+        if w.operand and w not in self.operand_words:
+            return -1
+        if w.prim is not None:
+            return self.kinds.get(w, -1)
+        if w.thread is not None:
+            return self.thread_kind(w.thread)
+        return -1
+
+    def operands_fit(self, kind, operands):
+        for w_x in operands:
+            if kind == FOLD_FLOAT or kind == FOLD_FDIV:
+                if not isinstance(w_x, W_FloatObject):
+                    return False
+            elif kind != FOLD_ANY:
+                if not isinstance(w_x, W_IntObject):
+                    return False
+        if kind == FOLD_DIV or kind == FOLD_FDIV:
+            w_top = operands[len(operands) - 1]
+            if isinstance(w_top, W_IntObject):
+                return w_top.intval != 0
+            if isinstance(w_top, W_FloatObject):
+                return w_top.floatval != 0.0
+        return True
+
+    def has_room(self, effect):
+        """Whether the data stack can hold an evaluation with effect."""
+        depth = effect.ds_out
+        if isinstance(effect, ThreadEffect):
+            depth = max(depth, effect.max_ds)
+        inner = self.inner
+        return inner.ds_ptr + effect.ds_in + depth <= len(inner.ds)
+
+    def evaluate(self, w, w_lit, operands, n_out):
+        """Run w, with w_lit in its lits slot, on operands."""
+        inner = self.inner
+        for w_x in operands:
+            # as LIT pushes them, which the (RAW...) variants rely on
+            if isinstance(w_x, W_IntObject):
+                inner.push_int(w_x.intval)
+            elif isinstance(w_x, W_FloatObject):
+                inner.push_float(w_x.floatval)
+            else:
+                inner.push_ds(w_x)
+        inner.execute_thread(CodeThread([w], [w_lit]), 0)
+        results = [ZERO] * n_out
+        for k in range(n_out - 1, -1, -1):
+            results[k] = inner.pop_ds()
+        return results
+
+
+def fold_constants(folder, code, lits):
+    """Replace pure words applied to literals by the literals they leave."""
+    n = len(code)
+    targets = find_branch_targets(code, lits)
+    wLIT = folder.wLIT
+    new_code = []
+    new_lits = []
+    new_index = [0] * (n + 1)
+    barrier = 0 # literals before this new ip may be jumped over
+    for i in range(n):
+        w = code[i]
+        if targets[i]:
+            barrier = len(new_code)
+        new_index[i] = len(new_code)
+        kind = folder.fold_kind(w)
+        if kind >= 0:
+            effect = folder.checker.effect_of(w)
+            if effect is not None and effect.rs_in == 0 and effect.rs_out == 0:
+                start = len(new_code) - effect.ds_in
+                if start >= barrier and folder.has_room(effect):
+                    operands = literal_operands(wLIT, new_code, new_lits,
+                                                start)
+                    if (operands is not None and
+                            folder.operands_fit(kind, operands)):
+                        results = folder.evaluate(w, lits[i], operands,
+                                                  effect.ds_out)
+                        assert start >= 0
+                        del new_code[start:]
+                        del new_lits[start:]
+                        for w_x in results:
+                            new_code.append(wLIT)
+                            new_lits.append(w_x)
+                        if w.tail:
+                            # the call returned to our caller
+                            new_code.append(folder.wEXIT)
+                            new_lits.append(ZERO)
+                        continue
+        new_code.append(w)
+        new_lits.append(lits[i])
+    new_index[n] = len(new_code)
+    # CodeThread wants fixed-size lists
+    code = [new_code[k] for k in range(len(new_code))]
+    lits = [new_lits[k] for k in range(len(new_lits))]
+    relocate_branches(code, lits, new_index)
+    return code, lits
+
+
+def join_kinds(kind1, kind2):
+    """The operand kind of a thread using words of kind1 and kind2."""
+    if kind1 == FOLD_ANY:
+        return kind2
+    if kind2 == FOLD_ANY or kind1 == kind2:
+        return kind1
+    return -1
+
+
+def literal_operands(wLIT, code, lits, start):
+    """The values of code[start:] if they are all LITs, else None."""
+    operands = []
+    for k in range(start, len(code)):
+        if code[k] is not wLIT:
+            return None
+        operands.append(lits[k])
+    return operands
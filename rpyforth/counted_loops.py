@@ -0,0 +1,150 @@
+"""
+Specialisation of DO loops with literal bounds.
+
+``LIT limit LIT start (DO)`` begins most counted loops, e.g. ``80 0 DO``.
+At ``;``, after the peephole pass, a loop with a small trip count whose
+body is straight-line primitive code is unrolled: the body is copied once
+per iteration, with I replaced by a literal of the index and J and K by I
+and J, so constant folding and type inference see the index as a literal.
+The entry of any other literal-bound loop becomes a single (LIT-DO)
+carrying both bounds in its lits slot as a W_LoopBounds.
+"""
+
+from rpyforth.objects import W_IntObject, W_LoopBounds, ZERO, wrap_int
+from rpyforth.optimizer import branch_target, find_branch_targets, \
+    relocate_branches
+
+
+# A loop is unrolled when it runs at most UNROLL_MAX_TRIPS times and the
+# copies of its body take at most UNROLL_MAX_WORDS words.
+UNROLL_MAX_TRIPS = 8
+UNROLL_MAX_WORDS = 32
+
+
+class LoopWords(object):
+    """The dictionary words the counted-loop pass looks for or emits."""
+    _immutable_fields_ = ['wLIT', 'wDO', 'wLOOP', 'wLIT_DO', 'wI', 'wJ', 'wK',
+                          'wEXIT', 'wUNLOOP', 'wEXECUTE']
+
+    def __init__(self, dictionary):
+        self.wLIT = dictionary["LIT"]
+        self.wDO = dictionary["(DO)"]
+        self.wLOOP = dictionary["(LOOP)"]
+        self.wLIT_DO = dictionary["(LIT-DO)"]
+        self.wI = dictionary["I"]
+        self.wJ = dictionary["J"]
+        self.wK = dictionary["K"]
+        self.wEXIT = dictionary["EXIT"]
+        self.wUNLOOP = dictionary["UNLOOP"]
+        self.wEXECUTE = dictionary["EXECUTE"]
+
+
+def is_literal_do(words, code, lits, targets, i):
+    """Whether code[i:i+3] is LIT limit LIT start (DO), entered at i."""
+    if i + 3 > len(code):
+        return False
+    if (code[i] is not words.wLIT or code[i + 1] is not words.wLIT or
+            code[i + 2] is not words.wDO):
+        return False
+    if targets[i + 1] or targets[i + 2]:
+        return False
+    return (isinstance(lits[i], W_IntObject) and
+            isinstance(lits[i + 1], W_IntObject))
+
+
+def unrollable_end(words, code, lits, targets, body, trips):
+    """Index of the (LOOP) closing the loop whose body starts at body, if
+    the loop may be unrolled for trips iterations, else -1."""
+    if trips <= 0 or trips > UNROLL_MAX_TRIPS:
+        return -1
+    for j in range(body, len(code)):
+        w = code[j]
+        if j > body and targets[j]:
+            return -1
+        if w is words.wLOOP:
+            if branch_target(lits[j]) != body:
+                return -1
+            if (j - body) * trips > UNROLL_MAX_WORDS:
+                return -1
+            return j
+        # the copies must not leave the loop, touch its parameters other
+        # than through I, J and K, or call code that may
+        if (w.prim is None or w.branch or w.tail or w is words.wEXIT or
+                w is words.wUNLOOP or w is words.wEXECUTE):
+            return -1
+    return -1
+
+
+def rewrite_loops(words, code, lits, unroll):
+    """Unroll the literal-bound loops that qualify when unroll is True,
+    else turn every literal-bound entry into (LIT-DO); returns (code, lits,
+    changed)."""
+    n = len(code)
+    targets = find_branch_targets(code, lits)
+    new_code = []
+    new_lits = []
+    new_index = [0] * (n + 1)
+    changed = False
+    i = 0
+    while i < n:
+        new_index[i] = len(new_code)
+        if not is_literal_do(words, code, lits, targets, i):
+            new_code.append(code[i])
+            new_lits.append(lits[i])
+            i += 1
+            continue
+        w_limit = lits[i]
+        w_start = lits[i + 1]
+        assert isinstance(w_limit, W_IntObject)
+        assert isinstance(w_start, W_IntObject)
+        limit = w_limit.intval
+        start = w_start.intval
+        body = i + 3
+        if not unroll:
+            new_index[i + 1] = new_index[i + 2] = len(new_code)
+            new_code.append(words.wLIT_DO)
+            new_lits.append(W_LoopBounds(limit, start))
+            changed = True
+            i = body
+            continue
+        end = unrollable_end(words, code, lits, targets, body, limit - start)
+        if end < 0:
+            new_code.append(code[i])
+            new_lits.append(lits[i])
+            i += 1
+            continue
+        for k in range(i + 1, end + 1):
+            new_index[k] = len(new_code)
+        for index in range(start, limit):
+            for j in range(body, end):
+                w = code[j]
+                if w is words.wI:
+                    new_code.append(words.wLIT)
+                    new_lits.append(wrap_int(index))
+                elif w is words.wJ:
+                    new_code.append(words.wI)
+                    new_lits.append(ZERO)
+                elif w is words.wK:
+                    new_code.append(words.wJ)
+                    new_lits.append(ZERO)
+                else:
+                    new_code.append(w)
+                    new_lits.append(lits[j])
+        changed = True
+        i = end + 1
+    new_index[n] = len(new_code)
+    # CodeThread wants fixed-size lists
+    code = [new_code[k] for k in range(len(new_code))]
+    lits = [new_lits[k] for k in range(len(new_lits))]
+    relocate_branches(code, lits, new_index)
+    return code, lits, changed
+
+
+def specialize_counted_loops(words, code, lits):
+    """Unroll small literal-bound loops, innermost first, then give the
+    remaining ones a (LIT-DO) entry."""
+    changed = True
+    while changed:
+        code, lits, changed = rewrite_loops(words, code, lits, True)
+    code, lits, _ = rewrite_loops(words, code, lits, False)
+    return code, lits
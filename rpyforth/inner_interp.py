@@ -1,33 +1,65 @@
+import struct
+
 from rpyforth.objects import (
     DECIMAL,
+    DEFERRED_WORD,
     Word,
     CodeThread,
     ZERO,
     W_Object,
     W_IntObject,
+    wrap_int,
     W_StringObject,
     W_PtrObject,
     W_FloatObject,
     CELL_SIZE_BYTES,
     CELL_SIZE,
+    LONG_BIT,
 )
 
 
 from rpython.rlib.rstruct.ieee import float_pack, float_unpack
 from rpython.rlib.rarithmetic import r_ulonglong, intmask
-from rpython.rlib.jit import JitDriver, promote, elidable, unroll_safe, promote_string
+from rpython.rtyper.lltypesystem import rffi, lltype
+from rpython.rlib.longlong2float import float2longlong, longlong2float
+from rpython.rlib.objectmodel import we_are_translated
+from rpython.rlib.jit import (
+    JitDriver, promote, elidable, unroll_safe, promote_string, dont_look_inside)
 from rpython.rlib.rfile import create_stdio
 
 STACK_SIZE = 64  # Increased for deeper nesting
+FRAME_STACK_SIZE = 256  # initial call depth, grows on demand
 BUF_SIZE = 1024
 HEAP_CELL_COUNT = 65536
 HEAP_SIZE_BYTES = HEAP_CELL_COUNT * CELL_SIZE_BYTES
 
-class Exit(Exception):
-    pass
+# ip a primitive returns to leave the current colon definition (EXIT)
+RETURN_IP = -1
+# ip a primitive returns to call the colon word in inner.callee (EXECUTE)
+CALL_IP = -2
+
+# Floats are kept unboxed on the data stack when their IEEE bits fit in a
+# cell: ds_int holds the bits and ds holds UNBOXED_FLOAT as the tag.
+UNBOXED_FLOATS = LONG_BIT == 64
+UNBOXED_FLOAT = W_Object()
+
+def float_to_bits(f):
+    if not we_are_translated():
+        # longlong2float goes through ll2ctypes untranslated, far too slowly
+        return struct.unpack("q", struct.pack("d", f))[0]
+    return intmask(float2longlong(f))
+
+def bits_to_float(x):
+    if not we_are_translated():
+        return struct.unpack("d", struct.pack("q", x))[0]
+    return longlong2float(rffi.cast(lltype.SignedLongLong, x))
 
 def get_printable_location(ip, thread):
-    return "ip=%d %s %s" % (ip, thread.code[ip].to_string(), thread.lits[ip].to_string())
+    w = thread.word_at(ip)
+    if w.operand:
+        w_lit = thread.lit_at(thread.next_ip(ip, w) - 1)
+        return "ip=%d %s %s" % (ip, w.to_string(), w_lit.to_string())
+    return "ip=%d %s" % (ip, w.to_string())
 
 jitdriver = JitDriver(
     greens=['ip', 'thread'],
@@ -37,18 +69,46 @@ jitdriver = JitDriver(
 )
 
 class InnerInterpreter(object):
-    _immutable_fields_ = ["cell_size", "cell_size_bytes", "base"]
-    _virtualizable_ = ["ds_ptr", "ds[*]", "rs_ptr", "rs[*]"]
-
-
-    def __init__(self):
-        # Pre-allocate larger stacks to reduce growth overhead
-        self.ds = [None] * STACK_SIZE # data stack
+    _immutable_fields_ = ["cell_size", "cell_size_bytes", "base", "cache_tos"]
+    _virtualizable_ = ["ds_ptr", "ds[*]", "ds_int[*]", "tos", "tos_int",
+                       "rs_ptr", "rs[*]", "ls_ptr", "ls[*]"]
+
+
+    def __init__(self, cache_tos=False):
+        # Pre-allocate larger stacks to reduce growth overhead.
+        # The data stack is two parallel arrays: ds holds boxed cells
+        # (floats, strings, xts, ...) and ds_int holds raw machine integers.
+        # A None in ds tags the slot as an unboxed integer and UNBOXED_FLOAT
+        # as an unboxed float; every slot at or above ds_ptr is kept None so
+        # push_int only has to write ds_int.
+        self.ds = [None] * STACK_SIZE # data stack (boxed cells)
+        self.ds_int = [0] * STACK_SIZE # data stack (unboxed integers)
         self.ds_ptr = 0
 
+        # With cache_tos the top cell (index ds_ptr - 1) lives in tos and
+        # tos_int instead of the arrays, tagged the same way.  Cells are
+        # then spilled with both arrays written, so the slots at or above
+        # ds_ptr - 1 may hold stale values and pops never clear them.
+        self.cache_tos = cache_tos
+        self.tos = None
+        self.tos_int = 0
+
         self.rs = [None] * STACK_SIZE  # return stack
         self.rs_ptr = 0
 
+        # Loop stack: the parameters of the active DO loops as raw
+        # integers, kept apart from rs so (LOOP), I, J and K index them
+        # without boxing.  Each loop takes two slots, limit then index.
+        self.ls = [0] * STACK_SIZE
+        self.ls_ptr = 0
+
+        # Return frames of colon word calls, (thread, ip) kept in two
+        # parallel arrays so execute_thread never recurses in Python.
+        self.frame_threads = [None] * FRAME_STACK_SIZE
+        self.frame_ips = [0] * FRAME_STACK_SIZE
+        self.fp = 0
+        self.callee = None # Word a primitive asks to call with CALL_IP
+
         self.mem = [0] * HEAP_SIZE_BYTES
         self.here = 0
         self.cell_size = CELL_SIZE
@@ -58,26 +118,401 @@ class InnerInterpreter(object):
         self.buf_ptr = 0
 
         self.base = DECIMAL
+        self.profiler = None # superinstructions.PairProfiler, if profiling
         self._pno_active = False      # inside <# ... #> or not
         self._pno_buf = []            # buffer for pno (pictured numeric output)
 
+    def _spill_tos(self, i):
+        assert i >= 0
+        self.ds[i] = self.tos
+        self.ds_int[i] = self.tos_int
+
+    def _fill_tos(self, i):
+        assert i >= 0
+        self.tos = self.ds[i]
+        self.tos_int = self.ds_int[i]
+
     def push_ds(self, w_x):
         ds_ptr = self.ds_ptr
-        self.ds[ds_ptr] = w_x
+        if self.cache_tos:
+            if ds_ptr > 0:
+                self._spill_tos(ds_ptr - 1)
+            self.tos = w_x
+        else:
+            self.ds[ds_ptr] = w_x
         self.ds_ptr = ds_ptr + 1
 
     def pop_ds(self):
         ds_ptr = self.ds_ptr - 1
         assert ds_ptr >= 0
+        self.ds_ptr = ds_ptr
+        if self.cache_tos:
+            w_x = self.tos
+            x = self.tos_int
+            if ds_ptr > 0:
+                self._fill_tos(ds_ptr - 1)
+            else:
+                self.tos = None
+            if w_x is None:
+                return wrap_int(x)
+            if w_x is UNBOXED_FLOAT:
+                return W_FloatObject(bits_to_float(x))
+            return w_x
         w_x = self.ds[ds_ptr]
+        if w_x is None:
+            return wrap_int(self.ds_int[ds_ptr])
         self.ds[ds_ptr] = None
-        self.ds_ptr = ds_ptr
+        if w_x is UNBOXED_FLOAT:
+            return W_FloatObject(bits_to_float(self.ds_int[ds_ptr]))
         return w_x
 
-    def top2_ds(self):
-        w_y = self.pop_ds()
-        w_x = self.pop_ds()
-        return w_x, w_y
+    def push_int(self, x):
+        ds_ptr = self.ds_ptr
+        if self.cache_tos:
+            if ds_ptr > 0:
+                self._spill_tos(ds_ptr - 1)
+            self.tos = None
+            self.tos_int = x
+        else:
+            self.ds_int[ds_ptr] = x
+        self.ds_ptr = ds_ptr + 1
+
+    def pop_int(self):
+        ds_ptr = self.ds_ptr - 1
+        assert ds_ptr >= 0
+        self.ds_ptr = ds_ptr
+        if self.cache_tos:
+            w_x = self.tos
+            x = self.tos_int
+            if ds_ptr > 0:
+                self._fill_tos(ds_ptr - 1)
+            else:
+                self.tos = None
+            if w_x is None:
+                return x
+            assert isinstance(w_x, W_IntObject)
+            return w_x.intval
+        w_x = self.ds[ds_ptr]
+        if w_x is None:
+            return self.ds_int[ds_ptr]
+        self.ds[ds_ptr] = None
+        assert isinstance(w_x, W_IntObject)
+        return w_x.intval
+
+    def top_int(self):
+        """Return the top cell as an integer, leaving it on the stack."""
+        i = self.ds_ptr - 1
+        assert i >= 0
+        if self.cache_tos:
+            w_x = self.tos
+            if w_x is None:
+                return self.tos_int
+        else:
+            w_x = self.ds[i]
+            if w_x is None:
+                return self.ds_int[i]
+        assert isinstance(w_x, W_IntObject)
+        return w_x.intval
+
+    def set_top_int(self, x):
+        """Replace the top cell with the integer x.
+
+        A binary operator written as pop_int, top_int, set_top_int touches
+        the stack arrays once when the top of stack is cached.
+        """
+        i = self.ds_ptr - 1
+        assert i >= 0
+        if self.cache_tos:
+            self.tos = None
+            self.tos_int = x
+        else:
+            self.ds[i] = None
+            self.ds_int[i] = x
+
+    def pop_raw_int(self):
+        """pop_int for a cell known to hold an unboxed integer."""
+        ds_ptr = self.ds_ptr - 1
+        assert ds_ptr >= 0
+        self.ds_ptr = ds_ptr
+        if self.cache_tos:
+            x = self.tos_int
+            if ds_ptr > 0:
+                self._fill_tos(ds_ptr - 1)
+            return x
+        return self.ds_int[ds_ptr]
+
+    def top_raw_int(self):
+        """top_int for a cell known to hold an unboxed integer."""
+        i = self.ds_ptr - 1
+        assert i >= 0
+        if self.cache_tos:
+            return self.tos_int
+        return self.ds_int[i]
+
+    def push_float(self, f):
+        if not UNBOXED_FLOATS:
+            self.push_ds(W_FloatObject(f))
+            return
+        ds_ptr = self.ds_ptr
+        if self.cache_tos:
+            if ds_ptr > 0:
+                self._spill_tos(ds_ptr - 1)
+            self.tos = UNBOXED_FLOAT
+            self.tos_int = float_to_bits(f)
+        else:
+            self.ds[ds_ptr] = UNBOXED_FLOAT
+            self.ds_int[ds_ptr] = float_to_bits(f)
+        self.ds_ptr = ds_ptr + 1
+
+    def pop_float(self):
+        ds_ptr = self.ds_ptr - 1
+        assert ds_ptr >= 0
+        self.ds_ptr = ds_ptr
+        if self.cache_tos:
+            w_x = self.tos
+            x = self.tos_int
+            if ds_ptr > 0:
+                self._fill_tos(ds_ptr - 1)
+            else:
+                self.tos = None
+        else:
+            w_x = self.ds[ds_ptr]
+            x = self.ds_int[ds_ptr]
+            self.ds[ds_ptr] = None
+        if w_x is UNBOXED_FLOAT:
+            return bits_to_float(x)
+        assert isinstance(w_x, W_FloatObject)
+        return w_x.floatval
+
+    def top_float(self):
+        """Return the top cell as a float, leaving it on the stack."""
+        i = self.ds_ptr - 1
+        assert i >= 0
+        if self.cache_tos:
+            w_x = self.tos
+            x = self.tos_int
+        else:
+            w_x = self.ds[i]
+            x = self.ds_int[i]
+        if w_x is UNBOXED_FLOAT:
+            return bits_to_float(x)
+        assert isinstance(w_x, W_FloatObject)
+        return w_x.floatval
+
+    def set_top_float(self, f):
+        """Replace the top cell with the float f, see set_top_int."""
+        i = self.ds_ptr - 1
+        assert i >= 0
+        if not UNBOXED_FLOATS:
+            w_f = W_FloatObject(f)
+            if self.cache_tos:
+                self.tos = w_f
+            else:
+                self.ds[i] = w_f
+            return
+        if self.cache_tos:
+            self.tos = UNBOXED_FLOAT
+            self.tos_int = float_to_bits(f)
+        else:
+            self.ds[i] = UNBOXED_FLOAT
+            self.ds_int[i] = float_to_bits(f)
+
+    def pop_raw_float(self):
+        """pop_float for a cell known to hold an unboxed float."""
+        ds_ptr = self.ds_ptr - 1
+        assert ds_ptr >= 0
+        self.ds_ptr = ds_ptr
+        if self.cache_tos:
+            x = self.tos_int
+            if ds_ptr > 0:
+                self._fill_tos(ds_ptr - 1)
+            else:
+                self.tos = None
+            return bits_to_float(x)
+        self.ds[ds_ptr] = None
+        return bits_to_float(self.ds_int[ds_ptr])
+
+    def top_raw_float(self):
+        """top_float for a cell known to hold an unboxed float."""
+        i = self.ds_ptr - 1
+        assert i >= 0
+        if self.cache_tos:
+            return bits_to_float(self.tos_int)
+        return bits_to_float(self.ds_int[i])
+
+    def set_top_raw_float(self, f):
+        """set_top_float for a cell known to hold an unboxed float."""
+        i = self.ds_ptr - 1
+        assert i >= 0
+        if self.cache_tos:
+            self.tos_int = float_to_bits(f)
+        else:
+            self.ds_int[i] = float_to_bits(f)
+
+    def push_flag(self, flag):
+        if flag:
+            self.push_int(-1)
+        else:
+            self.push_int(0)
+
+    def set_top_flag(self, flag):
+        if flag:
+            self.set_top_int(-1)
+        else:
+            self.set_top_int(0)
+
+    def copy_ds(self, src, dst):
+        """Copy the cell at index src to index dst without boxing it."""
+        assert src >= 0 and dst >= 0
+        self.ds[dst] = self.ds[src]
+        self.ds_int[dst] = self.ds_int[src]
+
+    def swap_ds(self, i, j):
+        """Exchange the cells at indices i and j without boxing them."""
+        assert i >= 0 and j >= 0
+        w_x = self.ds[i]
+        x = self.ds_int[i]
+        self.ds[i] = self.ds[j]
+        self.ds_int[i] = self.ds_int[j]
+        self.ds[j] = w_x
+        self.ds_int[j] = x
+
+    def dup_ds(self):
+        ds_ptr = self.ds_ptr
+        assert ds_ptr >= 1
+        if self.cache_tos:
+            self._spill_tos(ds_ptr - 1)
+        else:
+            self.copy_ds(ds_ptr - 1, ds_ptr)
+        self.ds_ptr = ds_ptr + 1
+
+    def over_ds(self):
+        ds_ptr = self.ds_ptr
+        assert ds_ptr >= 2
+        if self.cache_tos:
+            self._spill_tos(ds_ptr - 1)
+            self._fill_tos(ds_ptr - 2)
+        else:
+            self.copy_ds(ds_ptr - 2, ds_ptr)
+        self.ds_ptr = ds_ptr + 1
+
+    def swap_top_ds(self):
+        ds_ptr = self.ds_ptr
+        i = ds_ptr - 2
+        assert i >= 0
+        if self.cache_tos:
+            w_x = self.tos
+            x = self.tos_int
+            self._fill_tos(i)
+            self.ds[i] = w_x
+            self.ds_int[i] = x
+        else:
+            self.swap_ds(i, ds_ptr - 1)
+
+    @unroll_safe
+    def drop_ds(self, n):
+        ds_ptr = self.ds_ptr - n
+        assert ds_ptr >= 0
+        if self.cache_tos:
+            if ds_ptr > 0:
+                self._fill_tos(ds_ptr - 1)
+            else:
+                self.tos = None
+        else:
+            for i in range(ds_ptr, self.ds_ptr):
+                self.ds[i] = None
+        self.ds_ptr = ds_ptr
+
+    # The deeper shuffles below index the stack arrays directly.  With
+    # cache_tos the top cell is spilled first and reloaded afterwards, so
+    # they see every cell in the arrays.
+
+    def _flush_tos(self):
+        i = self.ds_ptr - 1
+        if self.cache_tos and i >= 0:
+            self._spill_tos(i)
+
+    def _reload_tos(self):
+        if self.cache_tos:
+            i = self.ds_ptr - 1
+            if i >= 0:
+                self._fill_tos(i)
+            else:
+                self.tos = None
+
+    def pick_ds(self, n):
+        """Copy the cell n below the top to the top (0 is DUP)."""
+        ds_ptr = self.ds_ptr
+        i = ds_ptr - 1 - n
+        assert i >= 0 and n >= 0
+        self._flush_tos()
+        self.copy_ds(i, ds_ptr)
+        self.ds_ptr = ds_ptr + 1
+        self._reload_tos()
+
+    @unroll_safe
+    def roll_ds(self, n):
+        """Move the cell n below the top to the top (2 is ROT)."""
+        top = self.ds_ptr - 1
+        i = top - n
+        assert i >= 0 and n >= 0 and top >= 0
+        self._flush_tos()
+        w_x = self.ds[i]
+        x = self.ds_int[i]
+        for k in range(i, top):
+            src = k + 1
+            assert src >= 0 and k >= 0
+            self.copy_ds(src, k)
+        self.ds[top] = w_x
+        self.ds_int[top] = x
+        self._reload_tos()
+
+    @unroll_safe
+    def unroll_ds(self, n):
+        """Move the top cell n cells down, the inverse of roll_ds."""
+        top = self.ds_ptr - 1
+        i = top - n
+        assert i >= 0 and n >= 0 and top >= 0
+        self._flush_tos()
+        w_x = self.ds[top]
+        x = self.ds_int[top]
+        for k in range(top, i, -1):
+            src = k - 1
+            assert src >= 0 and k >= 0
+            self.copy_ds(src, k)
+        self.ds[i] = w_x
+        self.ds_int[i] = x
+        self._reload_tos()
+
+    @unroll_safe
+    def drop_under_ds(self, keep, n):
+        """Remove the n cells below the top keep cells (1, 1 is NIP)."""
+        ds_ptr = self.ds_ptr - n
+        assert ds_ptr >= 0 and ds_ptr - keep >= 0 and keep >= 0
+        self._flush_tos()
+        for k in range(ds_ptr - keep, ds_ptr):
+            src = k + n
+            assert src >= 0 and k >= 0
+            self.copy_ds(src, k)
+        for k in range(ds_ptr, self.ds_ptr):
+            assert k >= 0
+            self.ds[k] = None
+        self.ds_ptr = ds_ptr
+        self._reload_tos()
+
+    @unroll_safe
+    def over2_ds(self, n):
+        """Copy the n cells below the top n cells to the top (1 is OVER)."""
+        ds_ptr = self.ds_ptr
+        assert ds_ptr - 2 * n >= 0 and n >= 0
+        self._flush_tos()
+        for k in range(n):
+            src = ds_ptr - 2 * n + k
+            dst = ds_ptr + k
+            assert src >= 0 and dst >= 0
+            self.copy_ds(src, dst)
+        self.ds_ptr = ds_ptr + n
+        self._reload_tos()
 
     def push_rs(self, w_x):
         rs_ptr = self.rs_ptr
@@ -92,6 +527,33 @@ class InnerInterpreter(object):
         self.rs_ptr = rs_ptr
         return w_x
 
+    def push_loop(self, limit, index):
+        ls_ptr = self.ls_ptr
+        self.ls[ls_ptr] = limit
+        self.ls[ls_ptr + 1] = index
+        self.ls_ptr = ls_ptr + 2
+
+    def drop_loop(self):
+        ls_ptr = self.ls_ptr - 2
+        assert ls_ptr >= 0
+        self.ls_ptr = ls_ptr
+
+    def loop_index(self, depth):
+        """The index of the loop depth levels out (0 is I, 1 is J)."""
+        i = self.ls_ptr - 1 - 2 * depth
+        assert i >= 0
+        return self.ls[i]
+
+    def loop_limit(self):
+        i = self.ls_ptr - 2
+        assert i >= 0
+        return self.ls[i]
+
+    def set_loop_index(self, index):
+        i = self.ls_ptr - 1
+        assert i >= 0
+        self.ls[i] = index
+
     def print_int(self, x):
         assert isinstance(x, W_IntObject)
         _, stdout, _ = create_stdio()
@@ -115,39 +577,48 @@ class InnerInterpreter(object):
         assert 0 <= addr < len(self.mem)
         assert addr + span <= len(self.mem)
 
-    @unroll_safe
     def cell_store(self, addr_obj, value_obj):
         assert isinstance(addr_obj, W_IntObject)
         assert isinstance(value_obj, W_IntObject)
-        addr = intmask(addr_obj.intval)
+        self.cell_store_int(addr_obj.intval, value_obj.intval)
+
+    @unroll_safe
+    def cell_store_int(self, addr, value):
+        addr = intmask(addr)
         self._ensure_addr(addr, self.cell_size_bytes)
-        masked = value_obj.intval
+        masked = value
         for offset in range(self.cell_size_bytes):
             self.mem[addr + offset] = masked & 0xFF
             masked >>= 8
 
-    @unroll_safe
     def cell_2store(self, addr_obj, value_obj, value2_obj):
         assert isinstance(addr_obj, W_IntObject)
         assert isinstance(value_obj, W_IntObject)
         assert isinstance(value2_obj, W_IntObject)
-        addr = intmask(addr_obj.intval)
+        self.cell_2store_int(addr_obj.intval, value_obj.intval,
+                             value2_obj.intval)
+
+    @unroll_safe
+    def cell_2store_int(self, addr, value, value2):
+        addr = intmask(addr)
         self._ensure_addr(addr, self.cell_size_bytes)
-        masked = value_obj.intval
+        masked = value
         for offset in range(self.cell_size_bytes):
             self.mem[addr + offset] = masked & 0xFF
             masked >>= 8
 
         addr2 = addr + self.cell_size_bytes
-        masked2 = value2_obj.intval
+        masked2 = value2
         for offset in range(self.cell_size_bytes):
             self.mem[addr2 + offset] = masked2 & 0xFF
             masked2 >>= 8
 
-    @unroll_safe
     def cell_fetch(self, addr_obj):
         assert isinstance(addr_obj, W_IntObject)
-        addr = addr_obj.intval
+        return wrap_int(self.cell_fetch_int(addr_obj.intval))
+
+    @unroll_safe
+    def cell_fetch_int(self, addr):
         self._ensure_addr(addr, self.cell_size_bytes)
         accum = 0
         for offset in range(self.cell_size_bytes):
@@ -156,28 +627,24 @@ class InnerInterpreter(object):
         if top_byte & 0x80:
             sign_adjust = 1 << (self.cell_size_bytes * 8)
             accum -= sign_adjust
-        return W_IntObject(accum)
+        return accum
 
     @unroll_safe
-    def float_store(self, addr_obj, value_obj):
+    def float_store(self, addr, floatval):
         """Store a float at the given address."""
-        assert isinstance(addr_obj, W_IntObject)
-        assert isinstance(value_obj, W_FloatObject)
-        addr = intmask(addr_obj.intval)
+        addr = intmask(addr)
         float_size = 8  # 64-bit float
         self._ensure_addr(addr, float_size)
         # float_pack returns an r_ulonglong representing the IEEE 754 bits
-        packed = float_pack(value_obj.floatval, 8)
+        packed = float_pack(floatval, 8)
         # Store the bytes in little-endian order
         for offset in range(float_size):
             byte_val = intmask((packed >> (offset * 8)) & 0xFF)
             self.mem[addr + offset] = byte_val
 
     @unroll_safe
-    def float_fetch(self, addr_obj):
+    def float_fetch(self, addr):
         """Fetch a float from the given address."""
-        assert isinstance(addr_obj, W_IntObject)
-        addr = addr_obj.intval
         float_size = 8  # 64-bit float
         self._ensure_addr(addr, float_size)
         # Read bytes and reconstruct the r_ulonglong
@@ -186,36 +653,100 @@ class InnerInterpreter(object):
             byte_val = r_ulonglong(self.mem[addr + offset])
             packed |= byte_val << (offset * 8)
         # float_unpack takes an r_ulonglong and returns a float
-        floatval = float_unpack(packed, 8)
-        return W_FloatObject(floatval)
+        return float_unpack(packed, 8)
+
+    def push_frame(self, thread, ip):
+        fp = self.fp
+        if fp == len(self.frame_threads):
+            self._grow_frames()
+        self.frame_threads[fp] = thread
+        self.frame_ips[fp] = ip
+        self.fp = fp + 1
+
+    def unwind_frames(self):
+        """Drop frames down to and including the innermost entry marker."""
+        fp = self.fp - 1
+        assert fp >= 0
+        while self.frame_threads[fp] is not None:
+            self.frame_threads[fp] = None
+            fp -= 1
+            assert fp >= 0
+        self.fp = fp
+
+    @dont_look_inside
+    def _grow_frames(self):
+        size = len(self.frame_threads)
+        self.frame_threads = self.frame_threads + [None] * size
+        self.frame_ips = self.frame_ips + [0] * size
 
     def execute_thread(self, thread, ip=0):
+        # Calls push a return frame and continue in the callee.  A frame
+        # with no thread marks where this execute_thread was entered, so
+        # returning to it hands control back to an outer execute_thread
+        # (EXECUTE, or the outer interpreter running a word) without a
+        # local that would have to be carried across the merge point.
+        self.push_frame(None, 0)
         while True:
             jitdriver.jit_merge_point(
                 ip=ip,
                 thread=thread,
                 self=self
             )
-            if ip >= len(thread.code):
-                break
-
-            # Promote the word to allow JIT to specialize on it
-            w = promote(thread.code[ip])
-            if w is None:
-                break
-            ip += 1
-
-            # Promote the primitive function pointer for better inlining
-            try:
+            returned = False
+            if ip >= thread.length():
+                returned = True
+            else:
+                # Promote the word to allow JIT to specialize on it
+                w = promote(thread.word_at(ip))
+                if w is None:
+                    self.unwind_frames()
+                    break
+                if self.profiler is not None:
+                    self.profiler.record(thread, ip, w)
+                ip = thread.next_ip(ip, w)
+                if w.kind == DEFERRED_WORD:
+                    w = promote(w.deferred_target())
+                    if w.operand:
+                        # reads its own lits slot, which we cannot supply
+                        self.execute_word_now(w)
+                        continue
+
+                # Promote the primitive function pointer for better inlining
                 prim = promote(w.prim)
                 if prim is not None:
+                    next_ip = ip
                     ip = prim(self, thread, ip)
+                    if ip == CALL_IP:
+                        self.push_frame(thread, next_ip)
+                        thread = promote(self.callee.thread)
+                        ip = 0
+                    returned = ip == RETURN_IP
                 else:
+                    # a tail call jumps to the callee and returns straight
+                    # to our caller, so it needs no frame of its own
+                    if not w.tail:
+                        self.push_frame(thread, ip)
                     # Promote the nested thread for better inlining of colon definitions
-                    nested_thread = promote(w.thread)
-                    self.execute_thread(nested_thread)
-            except Exit:
-                break
+                    callee = promote(w.thread)
+                    recursive = callee is thread
+                    thread = callee
+                    ip = 0
+                    if recursive:
+                        # a recursive word may have no backward branch for
+                        # _maybe_enter_jit, so its entry is where traces
+                        # start instead
+                        jitdriver.can_enter_jit(ip=ip, thread=thread,
+                                                self=self)
+
+            if returned:
+                fp = self.fp - 1
+                assert fp >= 0
+                thread = self.frame_threads[fp]
+                ip = self.frame_ips[fp]
+                self.frame_threads[fp] = None
+                self.fp = fp
+                if thread is None:
+                    break
 
     def execute_word_now(self, w):
         code = [w]
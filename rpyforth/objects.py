@@ -4,25 +4,55 @@ except ImportError:
     import struct
     LONG_BIT = struct.calcsize("P") * 8
 
-from rpython.rlib.jit import elidable
+from rpython.rlib.jit import elidable, unroll_safe
+from rpython.rlib.objectmodel import we_are_translated
+
+
+# Word.kind: how the word was defined.  Data words (CONSTANT_WORD,
+# VARIABLE_WORD, CREATED_WORD) push a single value, Word.data, which is also
+# the body >BODY returns.  A DEFERRED_WORD runs the word in Word.target.
+COLON_WORD = 0     # primitives and ':' definitions
+CONSTANT_WORD = 1  # CONSTANT, FCONSTANT
+VARIABLE_WORD = 2  # VARIABLE, FVARIABLE, 2VARIABLE
+CREATED_WORD = 3   # CREATE
+DEFERRED_WORD = 4  # DEFER
 
 
 class Word(object):
     """
     Dictionary entry for a Forth word.
     """
-    _immutable_fields_ = ['name', 'prim', 'immediate', 'thread']
+    _immutable_fields_ = ['name', 'prim', 'immediate', 'thread', 'branch',
+                          'operand', 'tail', 'kind', 'data', 'target?']
 
-    def __init__(self, name, prim=None, immediate=False, thread=None):
+    def __init__(self, name, prim=None, immediate=False, thread=None,
+                 branch=False, operand=False, tail=False, kind=COLON_WORD,
+                 data=None):
         self.name = name
         self.prim = prim # callable(vm) or None
         self.immediate = immediate # bool
         self.thread = thread # code thread
+        self.branch = branch # bool: lits slot holds a branch target ip
+        self.operand = operand or branch # bool: prim reads its lits slot
+        self.tail = tail # bool: jump to thread reusing the caller's frame
+        self.kind = kind # int: COLON_WORD, CONSTANT_WORD, ...
+        self.data = data # W_Object pushed by a data word, compiled as a LIT
+        # Word a DEFERRED_WORD currently runs, rebound by IS; quasi-immutable
+        # so the JIT calls it directly and drops traces when it changes
+        self.target = None
 
     @elidable
     def is_primitive(self):
         return self.prim is not None
 
+    @unroll_safe
+    def deferred_target(self):
+        """The word a DEFERRED_WORD runs, following deferred targets."""
+        w = self
+        while w.kind == DEFERRED_WORD:
+            w = w.target
+        return w
+
     def __repr__(self):
         return "<Word %s>" % (self.name)
 
@@ -31,13 +61,75 @@ class Word(object):
         return "<Word %s>" % (self.name)
 
 
-class CodeThread(object):
+class Thread(object):
+    """
+    Compiled body of a colon definition, run by execute_thread.
+
+    An ip indexes the thread's own encoding.  A word at ip continues at
+    next_ip(ip, w), and an operand word (Word.operand) finds its operand
+    at the slot just before that.
+    """
+
+    def __init__(self):
+        self.effect = None # stack_effects.ThreadEffect, once checked
+
+    def length(self):
+        raise NotImplementedError
+
+    def word_at(self, ip):
+        raise NotImplementedError
+
+    def next_ip(self, ip, w):
+        raise NotImplementedError
+
+    def lit_at(self, i):
+        """The operand at slot i as a W_Object."""
+        raise NotImplementedError
+
+    def int_at(self, i):
+        """The integer operand at slot i."""
+        raise NotImplementedError
+
+    def is_inline_int(self, i):
+        """Whether slot i holds an unboxed integer operand."""
+        raise NotImplementedError
+
+    def to_lists(self):
+        """The thread as parallel (code, lits) lists, see CodeThread."""
+        raise NotImplementedError
+
+
+class CodeThread(Thread):
     _immutable_fields_ = ["code[*]", "lits[*]"]
 
     def __init__(self, code, lits):
+        Thread.__init__(self)
         self.code = code # code (list of Words)
         self.lits = lits # literal values used by code[i]
 
+    def length(self):
+        return len(self.code)
+
+    def word_at(self, ip):
+        return self.code[ip]
+
+    def next_ip(self, ip, w):
+        return ip + 1
+
+    def lit_at(self, i):
+        return self.lits[i]
+
+    def int_at(self, i):
+        w_lit = self.lits[i]
+        assert isinstance(w_lit, W_IntObject)
+        return w_lit.intval
+
+    def is_inline_int(self, i):
+        return False
+
+    def to_lists(self):
+        return self.code, self.lits
+
 
 class W_Object(object):
     _immutable_fields_ = ['intval', 'floatval', 'strval', 'ptrval'] # OK??
@@ -99,30 +191,30 @@ class W_IntObject(W_Object):
     @elidable
     def add(self, other):
         assert isinstance(other, W_IntObject)
-        return W_IntObject(self.intval + other.intval)
+        return wrap_int(self.intval + other.intval)
 
     @elidable
     def sub(self, other):
         assert isinstance(other, W_IntObject)
-        return W_IntObject(self.intval - other.intval)
+        return wrap_int(self.intval - other.intval)
 
     @elidable
     def mul(self, other):
         assert isinstance(other, W_IntObject)
-        return W_IntObject(self.intval * other.intval)
+        return wrap_int(self.intval * other.intval)
 
     @elidable
     def div(self, other):
         assert isinstance(other, W_IntObject)
-        return W_IntObject(self.intval // other.intval)
+        return wrap_int(self.intval // other.intval)
 
     @elidable
     def neg(self):
-        return W_IntObject(-self.intval)
+        return wrap_int(-self.intval)
 
     @elidable
     def abs(self):
-        return W_IntObject(abs(self.intval))
+        return wrap_int(abs(self.intval))
 
     @elidable
     def lt(self, other):
@@ -137,15 +229,15 @@ class W_IntObject(W_Object):
     @elidable
     def mod(self, other):
         assert isinstance(other, W_IntObject)
-        return W_IntObject(self.intval % other.intval)
+        return wrap_int(self.intval % other.intval)
 
     @elidable
     def inc(self):
-        return W_IntObject(self.intval + 1)
+        return wrap_int(self.intval + 1)
 
     @elidable
     def dec(self):
-        return W_IntObject(self.intval - 1)
+        return wrap_int(self.intval - 1)
 
     @elidable
     def eq(self, other):
@@ -155,18 +247,18 @@ class W_IntObject(W_Object):
     
     @elidable
     def rshift(self, other):
-        return W_IntObject(self.intval >> other.intval)
+        return wrap_int(self.intval >> other.intval)
   
     @elidable
     def lshift(self, other):
-        return W_IntObject(self.intval << other.intval)
+        return wrap_int(self.intval << other.intval)
     
     @elidable
     def s_to_d(self):
         if self.intval >= 0:
-            return W_IntObject(0)
+            return wrap_int(0)
         else:
-            return W_IntObject(-1)
+            return wrap_int(-1)
 
 class W_PtrObject(W_Object):
     _immutable_fields_ = ['ptrval']
@@ -278,15 +370,88 @@ class W_WordObject(W_Object):
         return self.word
 
 
-ZERO = W_IntObject(0)
-TRUE = W_IntObject(-1)
+EXECUTE_CACHE_SIZE = 4 # targets an EXECUTE site tracks before megamorphic
+
+
+class W_CallSiteCache(W_Object):
+    """
+    Inline cache of a compiled EXECUTE, kept in its lits slot.
+
+    While the site has seen at most EXECUTE_CACHE_SIZE distinct words the
+    JIT specialises on the target word, with a guard and bridge per word.
+    Past that the site is megamorphic and calls through the xt unpromoted.
+    The list of words seen is quasi-immutable and only replaced on a miss,
+    so a hit on a promoted word folds away in a trace.
+    """
+    _immutable_fields_ = ['words?[*]', 'megamorphic?']
+
+    def __init__(self):
+        W_Object.__init__(self)
+        self.words = []
+        self.megamorphic = False
+
+    @unroll_safe
+    def lookup(self, w):
+        """Record w as a target; False once the site is megamorphic."""
+        for w_seen in self.words:
+            if w_seen is w:
+                return True
+        if len(self.words) == EXECUTE_CACHE_SIZE:
+            self.megamorphic = True
+            return False
+        self.words = self.words + [w]
+        return True
+
+    def __repr__(self):
+        return self.to_string()
+
+    def to_string(self):
+        return "<EXECUTE cache %d>" % len(self.words)
+
+
+class W_LoopBounds(W_Object):
+    """Limit and start of a DO loop with literal bounds, the operand of
+    (LIT-DO)."""
+    _immutable_fields_ = ['limit', 'start']
+
+    def __init__(self, limit, start):
+        W_Object.__init__(self)
+        self.limit = limit
+        self.start = start
+
+    def __repr__(self):
+        return self.to_string()
+
+    def to_string(self):
+        return "<DO %d %d>" % (self.limit, self.start)
+
+
+# Small integers are prebuilt once and shared, so boxing a loop counter or
+# a flag never allocates.  W_IntObject is immutable, and eq() compares by
+# value, so sharing instances is invisible to Forth code.
+SMALL_INT_MIN = -1024
+SMALL_INT_MAX = 65535
+SMALL_INTS = [W_IntObject(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+def wrap_int(intval):
+    """Return a W_IntObject for intval, reusing a cached one when small."""
+    if SMALL_INT_MIN <= intval <= SMALL_INT_MAX:
+        w_x = SMALL_INTS[intval - SMALL_INT_MIN]
+        if not we_are_translated():
+            assert w_x.intval == intval, "small int cache was mutated"
+        return w_x
+    return W_IntObject(intval)
+
+
+ZERO = wrap_int(0)
+TRUE = wrap_int(-1)
 
 # BASE
-HEX     = W_IntObject(16)
-DECIMAL = W_IntObject(10)
-OCTAL   = W_IntObject(8)
-BINARY  = W_IntObject(2)
+HEX     = wrap_int(16)
+DECIMAL = wrap_int(10)
+OCTAL   = wrap_int(8)
+BINARY  = wrap_int(2)
 
 # data space characteristics
 CELL_SIZE_BYTES = LONG_BIT // 8
-CELL_SIZE = W_IntObject(CELL_SIZE_BYTES)
+CELL_SIZE = wrap_int(CELL_SIZE_BYTES)
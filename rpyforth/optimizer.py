@@ -0,0 +1,258 @@
+"""Compile-time rewriting of code threads.
+
+The passes here run over the ``code``/``lits`` arrays of a colon definition
+when ``;`` finalises it, before the CodeThread is built: first the peephole
+pass, then counted-loop specialisation (rpyforth.counted_loops), then
+constant folding (rpyforth.constant_folding), then superinstruction
+fusion.  Rewrites may change the length of the thread, so every pass
+finishes by relocating the targets held in the lits slot of branch words
+(``Word.branch``).
+"""
+
+from rpyforth.objects import Word, W_IntObject, ZERO, wrap_int
+from rpyforth.superinstructions import PROFILED_SUPERINSTRUCTIONS
+
+
+# (pattern, fused word, index of the pattern word whose lit is kept or -1)
+SUPERINSTRUCTIONS = [
+    (["I", "J", "*"], "(IJ*)", -1),
+    (["LIT", "+"], "(LIT+)", 0),
+    (["LIT", "@"], "(LIT@)", 0),
+    (["LIT", "!"], "(LIT!)", 0),
+    (["LIT", "F@"], "(LITF@)", 0),
+    (["LIT", "F!"], "(LITF!)", 0),
+    (["DUP", "*"], "(DUP*)", -1),
+    (["OVER", "+"], "(OVER+)", -1),
+    (["F@", "F*"], "(F@F*)", -1),
+    (["<", "0BRANCH"], "(<0BRANCH)", 1),
+    ([">", "0BRANCH"], "(>0BRANCH)", 1),
+    (["=", "0BRANCH"], "(=0BRANCH)", 1),
+    (["F>", "0BRANCH"], "(F>0BRANCH)", 1),
+]
+
+
+class FusionRule(object):
+    """A sequence of words replaced by a single fused primitive."""
+    _immutable_fields_ = ['pattern[*]', 'fused', 'lit_index', 'int_lit']
+
+    def __init__(self, pattern, fused, lit_index, int_lit):
+        self.pattern = pattern      # list of Words
+        self.fused = fused          # Word
+        self.lit_index = lit_index  # int: pattern slot whose lit is kept, or -1
+        self.int_lit = int_lit      # bool: kept lit must be an integer
+
+    def matches(self, code, lits, i, targets):
+        n = len(self.pattern)
+        if i + n > len(code):
+            return False
+        for k in range(n):
+            if code[i + k] is not self.pattern[k]:
+                return False
+            # nothing may jump into the middle of the fused sequence
+            if k > 0 and targets[i + k]:
+                return False
+        if self.int_lit and not isinstance(lits[i + self.lit_index], W_IntObject):
+            return False
+        return True
+
+
+def make_fusion_rules(dictionary):
+    rules = []
+    for names, fused_name, lit_index in SUPERINSTRUCTIONS:
+        pattern = [dictionary[name] for name in names]
+        int_lit = lit_index >= 0 and names[lit_index] == "LIT"
+        rules.append(FusionRule(pattern, dictionary[fused_name], lit_index,
+                                int_lit))
+    for fused_name, _, names in PROFILED_SUPERINSTRUCTIONS:
+        pattern = [dictionary[name] for name in names]
+        rules.append(FusionRule(pattern, dictionary[fused_name], -1, False))
+    return rules
+
+
+def branch_target(w_lit):
+    assert isinstance(w_lit, W_IntObject)
+    return w_lit.intval
+
+
+def find_branch_targets(code, lits):
+    """Mark every index some branch word in the thread jumps to."""
+    n = len(code)
+    targets = [False] * (n + 1)
+    for i in range(n):
+        if code[i].branch:
+            target = branch_target(lits[i])
+            if 0 <= target <= n:
+                targets[target] = True
+    return targets
+
+
+def relocate_branches(code, lits, new_index):
+    """Rewrite branch targets in place, new_index maps old ips to new ones."""
+    for i in range(len(code)):
+        if code[i].branch:
+            lits[i] = wrap_int(new_index[branch_target(lits[i])])
+
+
+def fuse_superinstructions(rules, code, lits):
+    """Replace adjacent word sequences with their fused primitives."""
+    n = len(code)
+    targets = find_branch_targets(code, lits)
+    new_code = []
+    new_lits = []
+    new_index = [0] * (n + 1)
+    i = 0
+    while i < n:
+        matched = None
+        for rule in rules:
+            if rule.matches(code, lits, i, targets):
+                matched = rule
+                break
+        if matched is None:
+            new_index[i] = len(new_code)
+            new_code.append(code[i])
+            new_lits.append(lits[i])
+            i += 1
+            continue
+        for k in range(len(matched.pattern)):
+            new_index[i + k] = len(new_code)
+        new_code.append(matched.fused)
+        if matched.lit_index >= 0:
+            new_lits.append(lits[i + matched.lit_index])
+        else:
+            new_lits.append(ZERO)
+        i += len(matched.pattern)
+    new_index[n] = len(new_code)
+    # CodeThread wants fixed-size lists
+    code = [new_code[k] for k in range(len(new_code))]
+    lits = [new_lits[k] for k in range(len(new_lits))]
+    relocate_branches(code, lits, new_index)
+    return code, lits
+
+
+class PeepholeWords(object):
+    """The dictionary words the peephole pass looks for or emits."""
+    _immutable_fields_ = ['wBRANCH', 'wEXIT', 'wSWAP', 'wDUP', 'wDROP',
+                          'w0EQ', 'w0BRANCH', 'w0EQ0BRANCH', 'tail_words']
+
+    def __init__(self, dictionary):
+        self.wBRANCH = dictionary["BRANCH"]
+        self.wEXIT = dictionary["EXIT"]
+        self.wSWAP = dictionary["SWAP"]
+        self.wDUP = dictionary["DUP"]
+        self.wDROP = dictionary["DROP"]
+        self.w0EQ = dictionary["0="]
+        self.w0BRANCH = dictionary["0BRANCH"]
+        self.w0EQ0BRANCH = dictionary["(0=0BRANCH)"]
+        self.tail_words = {} # callee Word -> its tail-call Word
+        # the definition being compiled, whose thread only exists at ';'
+        self.current_word = None
+
+    def is_call(self, w):
+        """Whether w calls a colon word, counting a call to itself."""
+        return is_call(w) or w is self.current_word
+
+    def tail_word(self, w):
+        """The word that jumps to colon word w's thread without a frame.
+
+        For the word being defined the thread is bound by install_colon.
+        """
+        tail = self.tail_words.get(w, None)
+        if tail is None:
+            tail = Word("(TAIL " + w.name + ")", thread=w.thread, tail=True)
+            self.tail_words[w] = tail
+        return tail
+
+
+def is_call(w):
+    return w.prim is None and w.thread is not None and not w.tail
+
+
+def collapse_branch_chains(words, code, lits):
+    """Point branches that land on a BRANCH straight at its final target."""
+    n = len(code)
+    for i in range(n):
+        if not code[i].branch:
+            continue
+        target = branch_target(lits[i])
+        hops = 0
+        # the hop limit stops on BRANCH cycles such as an empty endless loop
+        while 0 <= target < n and code[target] is words.wBRANCH and hops < n:
+            target = branch_target(lits[target])
+            hops += 1
+        lits[i] = wrap_int(target)
+
+
+def _is_pair(code, i, first, second):
+    return code[i] is first and code[i + 1] is second
+
+
+def peephole_pass(words, code, lits):
+    """One round of local rewrites; returns (code, lits, changed).
+
+    - code after an unconditional BRANCH or EXIT that no branch jumps to is
+      dropped, as is a BRANCH to the very next word;
+    - BRANCH to BRANCH chains are collapsed;
+    - SWAP SWAP and DUP DROP are dropped;
+    - 0= 0BRANCH becomes the inverted branch (0=0BRANCH);
+    - a colon word call followed by EXIT becomes a tail call.
+    """
+    n = len(code)
+    lits = [lits[k] for k in range(n)]
+    collapse_branch_chains(words, code, lits)
+    targets = find_branch_targets(code, lits)
+    new_code = []
+    new_lits = []
+    new_index = [0] * (n + 1)
+    changed = False
+    reachable = True
+    i = 0
+    while i < n:
+        w = code[i]
+        new_index[i] = len(new_code)
+        if targets[i]:
+            reachable = True
+        if not reachable:
+            changed = True
+            i += 1
+            continue
+        if w is words.wBRANCH and branch_target(lits[i]) == i + 1:
+            changed = True
+            i += 1
+            continue
+        if i + 1 < n and not targets[i + 1]:
+            if (_is_pair(code, i, words.wSWAP, words.wSWAP) or
+                    _is_pair(code, i, words.wDUP, words.wDROP)):
+                new_index[i + 1] = len(new_code)
+                changed = True
+                i += 2
+                continue
+            if _is_pair(code, i, words.w0EQ, words.w0BRANCH):
+                new_index[i + 1] = len(new_code)
+                new_code.append(words.w0EQ0BRANCH)
+                new_lits.append(lits[i + 1])
+                changed = True
+                i += 2
+                continue
+        if i + 1 < n and words.is_call(w) and code[i + 1] is words.wEXIT:
+            # the EXIT stays only if something jumps to it
+            w = words.tail_word(w)
+            changed = True
+        new_code.append(w)
+        new_lits.append(lits[i])
+        if w is words.wBRANCH or w is words.wEXIT or w.tail:
+            reachable = False
+        i += 1
+    new_index[n] = len(new_code)
+    # CodeThread wants fixed-size lists
+    code = [new_code[k] for k in range(len(new_code))]
+    lits = [new_lits[k] for k in range(len(new_lits))]
+    relocate_branches(code, lits, new_index)
+    return code, lits, changed
+
+
+def peephole_optimize(words, code, lits):
+    """Run peephole_pass until the thread stops changing."""
+    changed = True
+    while changed:
+        code, lits, changed = peephole_pass(words, code, lits)
+    return code, lits
@@ -1,6 +1,15 @@
 from rpyforth.objects import (
-    W_StringObject, Word, CodeThread, W_IntObject, W_PtrObject, W_FloatObject, W_WordObject, ZERO, TRUE)
+    W_StringObject, Word, CodeThread, W_IntObject, W_PtrObject, W_FloatObject, W_WordObject, ZERO,
+    wrap_int, CONSTANT_WORD, VARIABLE_WORD, CREATED_WORD, DEFERRED_WORD,
+    W_CallSiteCache)
 from rpyforth.primitives import install_primitives
+from rpyforth.optimizer import (
+    make_fusion_rules, fuse_superinstructions, PeepholeWords, peephole_optimize)
+from rpyforth.stack_effects import StackChecker
+from rpyforth.constant_folding import ConstantFolder, fold_constants
+from rpyforth.bytecode import encode_thread
+from rpyforth.type_inference import TypeInference, specialize_thread
+from rpyforth.counted_loops import LoopWords, specialize_counted_loops
 from rpyforth.util import to_upper, split_whitespace
 
 from rpython.rlib.rfile import create_stdio
@@ -15,6 +24,31 @@ CTRL_ELSE = 1
 CTRL_DO   = 2
 CTRL_BEGIN = 3
 CTRL_WHILE = 4
+CTRL_CASE = 5
+CTRL_OF = 6
+
+# Colon words with at most this many words (EXIT excluded) and no control
+# flow are spliced into the caller's thread instead of being called.
+DEFAULT_INLINE_THRESHOLD = 8
+
+# A CASE whose OF selectors are all integer literals compiles to a jump
+# table when it has at least CASE_TABLE_MIN of them and they span at most
+# twice their number (and CASE_TABLE_MAX) values.
+CASE_TABLE_MIN = 3
+CASE_TABLE_MAX = 64
+
+# Words the outer interpreter runs as soon as it parses them.  In script
+# mode the top-level code compiled before one of them is run first, and
+# they cannot appear inside a top-level control structure.
+PARSE_TIME_WORDS = {}
+for _name in [":", ";", 'S"', "CHAR", "CR", "VARIABLE", "FVARIABLE",
+              "2VARIABLE", "CONSTANT", "FCONSTANT", "CREATE", "DEFER", "FIND",
+              "SOURCE", ">IN", "'", "COUNT", "WORD"]:
+    PARSE_TIME_WORDS[_name] = None
+
+# Top-level code outside control structures is run once it fills this much
+# of the compile buffer.
+SCRIPT_FLUSH_AT = 96
 
 class CtrlEntry(object):
     """Control stack entry for compilation-time control structures.
@@ -25,9 +59,20 @@ class CtrlEntry(object):
         self.kind = kind    # int: CTRL_IF, CTRL_ELSE, or CTRL_DO
         self.index = index  # int: position in scurrent_code for patching
         self.leave_addrs = []  # list of LEAVE positions to patch (for DO loops)
+        # CASE only: ENDOF branches to patch, where the current OF clause
+        # starts, and the literal selectors and clause entries seen so far
+        self.endof_addrs = []
+        self.clause_start = 0
+        self.selectors = []
+        self.clause_addrs = []
+        self.literal_selectors = True
 
 class OuterInterpreter(object):
-    _immutable_fields_ = ['wBR', 'w0BR', 'wLIT', 'wEXIT', 'wDO', 'wLOOP', 'wLEAVE', 'wTYPE']
+    _immutable_fields_ = ['wBR', 'w0BR', 'wLIT', 'wEXIT', 'wDO', 'wLOOP', 'wLEAVE', 'wTYPE',
+                          'wEXECUTE', 'wDEFER_FETCH', 'wDEFER_STORE',
+                          'wDEFER_UNSET', 'wDROP', 'wOF', 'wJUMP_TABLE',
+                          'wCASE_LOW', 'wCASE_TARGET', 'wQDO', 'wPLUSLOOP',
+                          'wMINUSLOOP']
 
     def __init__(self, inner):
         self.inner = inner
@@ -35,6 +80,8 @@ class OuterInterpreter(object):
         self.state = INTERPRET # state for compilation
         self.comment = False
         self.current_name = ''
+        # Word of the definition being compiled, called by RECURSE
+        self.current_word = None
 
         # Input source tracking for SOURCE and >IN
         self.source_buffer = ''  # Current input line
@@ -54,7 +101,57 @@ class OuterInterpreter(object):
         self.wDO = self.dict["(DO)"]
         self.wLOOP = self.dict["(LOOP)"]
         self.wLEAVE = self.dict["LEAVE"]
+        self.wQDO = self.dict["(?DO)"]
+        self.wPLUSLOOP = self.dict["(+LOOP)"]
+        self.wMINUSLOOP = self.dict["(-LOOP)"]
         self.wTYPE = self.dict["TYPE"]
+        self.wEXECUTE = self.dict["EXECUTE"]
+        self.wDEFER_FETCH = self.dict["DEFER@"]
+        self.wDEFER_STORE = self.dict["DEFER!"]
+        self.wDEFER_UNSET = self.dict["(DEFER-UNSET)"]
+        self.wDROP = self.dict["DROP"]
+        self.wOF = self.dict["(OF)"]
+        self.wJUMP_TABLE = self.dict["(JUMP-TABLE)"]
+        self.wCASE_LOW = self.dict["(CASE-LOW)"]
+        self.wCASE_TARGET = self.dict["(CASE-TARGET)"]
+
+        # peephole pass and superinstruction fusion applied when ';'
+        # finalises a definition
+        self.peephole = True
+        self.peephole_words = PeepholeWords(self.dict)
+        self.fuse = True
+        self.fusion_rules = make_fusion_rules(self.dict)
+
+        # unrolling or a (LIT-DO) entry for DO loops with literal bounds,
+        # run after the peephole pass
+        self.literal_loops = True
+        self.loop_words = LoopWords(self.dict)
+
+        # inlining of short colon words at compile time, 0 disables it
+        self.inline_threshold = DEFAULT_INLINE_THRESHOLD
+
+        # stack-effect analysis of every definition at ';'; check_stack
+        # reports the unbalanced ones, False silences them
+        self.stack_checker = StackChecker(self.dict)
+        self.check_stack = True
+
+        # evaluation of pure words applied to literals when ';' finalises
+        # a definition, run after the peephole pass
+        self.fold = True
+        self.folder = ConstantFolder(self.dict, self.stack_checker, inner)
+
+        # replacement of words by unchecked variants where type inference
+        # proves their operands, run after fusion
+        self.specialize = True
+        self.type_inference = TypeInference(self.dict, self.stack_checker)
+
+        # encode colon definitions as bytecode instead of code/lits lists
+        self.bytecode = False
+
+        # compile top-level code into anonymous threads, one per line or
+        # per top-level control structure, instead of running it word by
+        # word
+        self.script = False
 
     def reset_code(self):
         self.current_code = [None] * 128
@@ -82,8 +179,9 @@ class OuterInterpreter(object):
         self.lit_ptr -= 1
         return self.current_lits[self.lit_ptr]
 
-    def define_prim(self, name, func):
-        w = Word(name, prim=func, immediate=False, thread=None)
+    def define_prim(self, name, func, branch=False, operand=False):
+        w = Word(name, prim=func, immediate=False, thread=None, branch=branch,
+                 operand=operand)
         self.dict[to_upper(name)] = w
         return w
 
@@ -92,14 +190,88 @@ class OuterInterpreter(object):
         self.dict[to_upper(name)] = w
         return w
 
+    def install_colon(self, w, thread):
+        """Install the Word a definition calls itself through."""
+        # the thread is set once, before anything can run the word
+        w.thread = thread
+        tail = self.peephole_words.tail_words.get(w, None)
+        if tail is not None:
+            # a tail call to itself, see PeepholeWords.tail_word
+            tail.thread = thread
+        self.dict[to_upper(w.name)] = w
+        return w
+
+    def define_data(self, name, kind, w_value):
+        """Define a data word of the given Word.kind pushing w_value."""
+        # the [LIT, EXIT] thread serves EXECUTE and interpretation, compiled
+        # references use Word.data directly
+        thread = CodeThread([self.wLIT, self.wEXIT], [w_value, ZERO])
+        w = Word(name, prim=None, immediate=False, thread=thread, kind=kind,
+                 data=w_value)
+        self.dict[to_upper(name)] = w
+        return w
+
+    def define_deferred(self, name):
+        """Define a deferred word, running (DEFER-UNSET) until IS."""
+        w = Word(name, prim=None, immediate=False, thread=None,
+                 kind=DEFERRED_WORD)
+        w.target = self.wDEFER_UNSET
+        self.dict[to_upper(name)] = w
+        return w
+
+    def _find_deferred(self, name):
+        w = self.dict.get(to_upper(name), None)
+        if w is None or w.kind != DEFERRED_WORD:
+            print name + " is not a deferred word"
+            return None
+        return w
+
     def _emit_word(self, w):
         self.push_code(w)
-        self.push_lit(ZERO)
+        if w is self.wEXECUTE:
+            self.push_lit(W_CallSiteCache())
+        else:
+            self.push_lit(ZERO)
 
     def _emit_lit(self, w_n):
         self.push_code(self.wLIT)
         self.push_lit(w_n)
 
+    def _can_inline(self, w):
+        thread = w.thread
+        if w.prim is not None or thread is None or self.inline_threshold <= 0:
+            return False
+        code, _ = thread.to_lists()
+        n = len(code) - 1 # body without the trailing EXIT
+        if n < 0 or n > self.inline_threshold:
+            return False
+        if self.cc_ptr + n > len(self.current_code):
+            return False
+        if code[n] is not self.wEXIT:
+            return False
+        for k in range(n):
+            w_k = code[k]
+            # branch targets are thread-relative, and EXIT or a tail call
+            # would leave the caller
+            if w_k.branch or w_k is self.wEXIT or w_k.tail:
+                return False
+        return True
+
+    def _compile_word(self, w):
+        if w.data is not None:
+            self.push_code(self.wLIT)
+            self.push_lit(w.data)
+        elif self._can_inline(w):
+            code, lits = w.thread.to_lists()
+            for k in range(len(code) - 1):
+                if code[k] is self.wEXECUTE:
+                    self._emit_word(code[k]) # a cache of its own
+                else:
+                    self.push_code(code[k])
+                    self.push_lit(lits[k])
+        else:
+            self._emit_word(w)
+
     @elidable
     def _is_number(self, s):
         length = len(s)
@@ -130,7 +302,7 @@ class OuterInterpreter(object):
         for i in range(start_idx, length):
             n = n * 10 + (ord(s[i]) - ord('0'))
         result = sign * n
-        return W_IntObject(result)
+        return wrap_int(result)
 
     @elidable
     def _is_float(self, s):
@@ -179,10 +351,100 @@ class OuterInterpreter(object):
 
     def _emit_with_target(self, w, target_index):
         self.push_code(w)
-        self.push_lit(W_IntObject(target_index))
+        self.push_lit(wrap_int(target_index))
 
     def _patch_here(self, at_index):
-        self.current_lits[at_index] = W_IntObject(self.cc_ptr)
+        self.current_lits[at_index] = wrap_int(self.cc_ptr)
+
+    def _innermost_do(self):
+        idx = len(self.ctrl) - 1
+        while idx >= 0:
+            entry = self.ctrl[idx]
+            if entry.kind == CTRL_DO:
+                return entry
+            idx -= 1
+        return None
+
+    def _case_table_range(self, entry):
+        """(low, high) of the selectors of a CASE that fits a jump table,
+        or (0, -1) when it is compiled as a chain of tests."""
+        n = len(entry.selectors)
+        if not entry.literal_selectors or n < CASE_TABLE_MIN:
+            return 0, -1
+        low = entry.selectors[0]
+        high = low
+        for value in entry.selectors:
+            low = min(low, value)
+            high = max(high, value)
+        span = high - low + 1
+        if span > 2 * n or span > CASE_TABLE_MAX:
+            return 0, -1
+        # BRANCH, the table with its default entry, DROP and the final EXIT
+        if self.cc_ptr + span + 6 > len(self.current_code):
+            return 0, -1
+        return low, high
+
+    def _emit_case_table(self, entry, low, high):
+        """Emit the jump table of a CASE, see the ENDCASE comment."""
+        default_addr = self.cc_ptr
+        skip = self.cc_ptr
+        self._emit_with_target(self.wBR, 0)
+        self._patch_here(entry.index)
+        self.push_code(self.wJUMP_TABLE)
+        self.push_lit(wrap_int(high - low + 1))
+        self.push_code(self.wCASE_LOW)
+        self.push_lit(wrap_int(low))
+        for value in range(low, high + 1):
+            target = default_addr
+            # the first clause with a selector wins, as in the chain
+            for k in range(len(entry.selectors)):
+                if entry.selectors[k] == value:
+                    target = entry.clause_addrs[k]
+                    break
+            self._emit_with_target(self.wCASE_TARGET, target)
+        self._emit_with_target(self.wCASE_TARGET, entry.clause_start)
+        self._patch_here(skip)
+
+    def _compile_thread(self):
+        """Build the thread of the code compiled so far, ending in EXIT."""
+        self._emit_word(self.wEXIT)
+        # Create new lists with only the used portion (RPython needs proper list sizes)
+        code = [self.current_code[idx] for idx in range(self.cc_ptr)]
+        lits = [self.current_lits[idx] for idx in range(self.lit_ptr)]
+        if self.peephole:
+            self.peephole_words.current_word = self.current_word
+            code, lits = peephole_optimize(self.peephole_words, code, lits)
+        if self.literal_loops:
+            code, lits = specialize_counted_loops(self.loop_words, code, lits)
+        if self.fold:
+            code, lits = fold_constants(self.folder, code, lits)
+        if self.fuse:
+            code, lits = fuse_superinstructions(self.fusion_rules, code, lits)
+        if self.specialize:
+            code, lits = specialize_thread(self.type_inference, code, lits)
+        if self.bytecode:
+            thread = encode_thread(code, lits)
+        else:
+            thread = CodeThread(code, lits)
+        thread.effect = self.stack_checker.check(code, lits)
+        return thread
+
+    def _in_script_code(self):
+        """Whether top-level code is being compiled in script mode."""
+        return self.state == COMPILE and self.current_word is None
+
+    def _begin_script_code(self):
+        self.state = COMPILE
+        self.current_name = ''
+        self.current_word = None
+        self.reset_code()
+
+    def _run_script_code(self):
+        """Run the top-level code compiled since the last run."""
+        thread = self._compile_thread()
+        self.state = INTERPRET
+        self.reset_code()
+        self.inner.execute_thread(thread, 0)
 
     def _read_tok(self, toks, i):
         t = toks[i]
@@ -205,6 +467,23 @@ class OuterInterpreter(object):
         while i < toks_len:
             t, i = self._read_tok(toks, i)
 
+            if self.script:
+                if to_upper(t) in PARSE_TIME_WORDS:
+                    if self._in_script_code():
+                        if len(self.ctrl) > 0:
+                            print t + " inside a top-level control structure"
+                            self.ctrl = []
+                            self.state = INTERPRET
+                            self.reset_code()
+                            return
+                        self._run_script_code()
+                elif self.state == INTERPRET:
+                    self._begin_script_code()
+                elif (self._in_script_code() and len(self.ctrl) == 0 and
+                        self.cc_ptr >= SCRIPT_FLUSH_AT):
+                    self._run_script_code()
+                    self._begin_script_code()
+
             if t == 'S"':
                 sdouble_quote_str = []
                 while i < toks_len:
@@ -221,7 +500,7 @@ class OuterInterpreter(object):
                 size = len(parsed_str)
                 c_addr = self.inner.alloc_buf(parsed_str, size)
                 self.inner.push_ds(c_addr)
-                self.inner.push_ds(W_IntObject(size))
+                self.inner.push_int(size)
                 continue
 
             if t == '."':
@@ -246,7 +525,7 @@ class OuterInterpreter(object):
 
             if t == "CHAR":
                 s, i = self._read_tok(toks, i)
-                self.inner.push_ds(W_IntObject(ord(s[0])))
+                self.inner.push_int(ord(s[0]))
                 continue
 
             if t == "CR":
@@ -260,6 +539,8 @@ class OuterInterpreter(object):
                     return
                 self.state = COMPILE
                 self.current_name, i = self._read_tok(toks, i)
+                self.current_word = Word(self.current_name, prim=None,
+                                         immediate=False, thread=None)
                 self.reset_code()
                 continue
 
@@ -269,16 +550,15 @@ class OuterInterpreter(object):
                     continue
 
                 # append EXIT and install
-                self._emit_word(self.wEXIT)
-                # Create new lists with only the used portion (RPython needs proper list sizes)
-                code = [self.current_code[idx] for idx in range(self.cc_ptr)]
-                lits = [self.current_lits[idx] for idx in range(self.lit_ptr)]
-                thread = CodeThread(code, lits)
-                self.define_colon(self.current_name, thread)
+                thread = self._compile_thread()
+                if self.check_stack and thread.effect.error != '':
+                    print "Unbalanced definition " + self.current_name + ": " + thread.effect.error
+                self.install_colon(self.current_word, thread)
 
                 # reset
                 self.state = INTERPRET
                 self.current_name = ''
+                self.current_word = None
                 self.reset_code()
                 continue
 
@@ -287,8 +567,8 @@ class OuterInterpreter(object):
             # Handle control flow words
             if self.state == INTERPRET:
                 if tkey == "IF":
-                    cond = self.inner.pop_ds()
-                    if cond.intval == 0:
+                    cond = self.inner.pop_int()
+                    if cond == 0:
                         depth = 1
                         while i < toks_len and depth > 0:
                             tok = to_upper(toks[i])
@@ -329,13 +609,10 @@ class OuterInterpreter(object):
                        return
                    name, i = self._read_tok(toks, i)
 
-                   addr = W_IntObject(self.inner.here)
+                   addr = wrap_int(self.inner.here)
                    self.inner.here += self.inner.cell_size_bytes
 
-                   code = [self.wLIT, self.wEXIT]
-                   lits = [addr, ZERO]
-                   thread = CodeThread(code, lits)
-                   self.define_colon(name, thread)
+                   self.define_data(name, VARIABLE_WORD, addr)
                    continue
 
                 if tkey == "2VARIABLE":
@@ -344,16 +621,13 @@ class OuterInterpreter(object):
                         return
                     name, i = self._read_tok(toks, i)
 
-                    addr = W_IntObject(self.inner.here)
+                    addr = wrap_int(self.inner.here)
                     self.inner.here += self.inner.cell_size_bytes
 
-                    addr2 = W_IntObject(self.inner.here)
+                    addr2 = wrap_int(self.inner.here)
                     self.inner.here += self.inner.cell_size_bytes
 
-                    code = [self.wLIT, self.wEXIT]
-                    lits = [addr, ZERO]
-                    thread = CodeThread(code, lits)
-                    self.define_colon(name, thread)
+                    self.define_data(name, VARIABLE_WORD, addr)
                     continue
 
                 if tkey == "CONSTANT":
@@ -363,10 +637,7 @@ class OuterInterpreter(object):
                     name, i = self._read_tok(toks, i)
                     val = self.inner.pop_ds()
 
-                    code = [self.wLIT, self.wEXIT]
-                    lits = [val, ZERO]
-                    thread = CodeThread(code, lits)
-                    self.define_colon(name, thread)
+                    self.define_data(name, CONSTANT_WORD, val)
                     continue
 
                 if tkey == "FCONSTANT":
@@ -376,10 +647,7 @@ class OuterInterpreter(object):
                     name, i = self._read_tok(toks, i)
                     val = self.inner.pop_ds()
 
-                    code = [self.wLIT, self.wEXIT]
-                    lits = [val, ZERO]
-                    thread = CodeThread(code, lits)
-                    self.define_colon(name, thread)
+                    self.define_data(name, CONSTANT_WORD, val)
                     continue
 
                 if tkey == "CREATE":
@@ -389,14 +657,35 @@ class OuterInterpreter(object):
                     name, i = self._read_tok(toks, i)
 
                     # Allocate data space for the body
-                    addr = W_IntObject(self.inner.here)
+                    addr = wrap_int(self.inner.here)
                     # Don't increment here yet - let user use ALLOT or , to allocate
 
                     # Create a word that pushes the body address
-                    code = [self.wLIT, self.wEXIT]
-                    lits = [addr, ZERO]
-                    thread = CodeThread(code, lits)
-                    self.define_colon(name, thread)
+                    self.define_data(name, CREATED_WORD, addr)
+                    continue
+
+                if tkey == "DEFER":
+                    if i >= toks_len:
+                        print "DEFER requires a name"
+                        return
+                    name, i = self._read_tok(toks, i)
+                    self.define_deferred(name)
+                    continue
+
+                if tkey == "IS" or tkey == "ACTION-OF":
+                    # IS ( xt "name" -- ), ACTION-OF ( "name" -- xt )
+                    if i >= toks_len:
+                        print tkey + " requires a name"
+                        return
+                    name, i = self._read_tok(toks, i)
+                    w = self._find_deferred(name)
+                    if w is None:
+                        continue
+                    self.inner.push_ds(W_WordObject(w))
+                    if tkey == "IS":
+                        self.inner.execute_word_now(self.wDEFER_STORE)
+                    else:
+                        self.inner.execute_word_now(self.wDEFER_FETCH)
                     continue
 
                 if tkey == "FIND":
@@ -418,7 +707,7 @@ class OuterInterpreter(object):
                         # Unexpected type, push back and return 0
                         self.inner.push_ds(w_caddr)
                         self.inner.push_ds(w_u)
-                        self.inner.push_ds(ZERO)
+                        self.inner.push_int(0)
                         continue
 
                     name_upper = to_upper(name)
@@ -429,14 +718,14 @@ class OuterInterpreter(object):
                         self.inner.push_ds(xt)
                         # Push 1 if not immediate, -1 if immediate
                         if word.immediate:
-                            self.inner.push_ds(TRUE)  # -1 for immediate
+                            self.inner.push_int(-1)  # -1 for immediate
                         else:
-                            self.inner.push_ds(W_IntObject(1))  # 1 for non-immediate
+                            self.inner.push_int(1)  # 1 for non-immediate
                     else:
                         # Word not found, push string back and 0
                         self.inner.push_ds(w_caddr)
                         self.inner.push_ds(w_u)
-                        self.inner.push_ds(ZERO)
+                        self.inner.push_int(0)
                     continue
 
                 if tkey == "SOURCE":
@@ -445,16 +734,16 @@ class OuterInterpreter(object):
                     size = len(self.source_buffer)
                     c_addr = self.inner.alloc_buf(self.source_buffer, size)
                     self.inner.push_ds(c_addr)
-                    self.inner.push_ds(W_IntObject(size))
+                    self.inner.push_int(size)
                     continue
 
                 if tkey == ">IN":
                     # >IN ( -- a-addr )
                     # Return address of variable containing parse position
                     # For simplicity, we'll allocate a cell and store the current index
-                    addr = W_IntObject(self.inner.here)
-                    self.inner.cell_store(addr, W_IntObject(self.source_index))
-                    self.inner.push_ds(addr)
+                    addr = self.inner.here
+                    self.inner.cell_store_int(addr, self.source_index)
+                    self.inner.push_int(addr)
                     continue
 
                 if tkey == "'":
@@ -487,22 +776,19 @@ class OuterInterpreter(object):
                     # COUNT ( c-addr1 -- c-addr2 u )
                     # Convert counted string to ( addr len ) format
                     # In our implementation, count is stored in a full cell
-                    c_addr1 = self.inner.pop_ds()
-                    assert isinstance(c_addr1, W_IntObject)
+                    c_addr1 = self.inner.pop_int()
                     # Fetch the count (stored in a cell)
-                    count = self.inner.cell_fetch(c_addr1)
-                    assert isinstance(count, W_IntObject)
+                    count = self.inner.cell_fetch_int(c_addr1)
                     # c-addr2 is c-addr1 + cell_size (skip the count cell)
-                    c_addr2 = W_IntObject(c_addr1.intval + self.inner.cell_size_bytes)
-                    self.inner.push_ds(c_addr2)
-                    self.inner.push_ds(count)
+                    c_addr2 = c_addr1 + self.inner.cell_size_bytes
+                    self.inner.push_int(c_addr2)
+                    self.inner.push_int(count)
                     continue
 
                 if tkey == "WORD":
                     # WORD ( char "<chars>ccc<char>" -- c-addr )
                     # Simplified: parse next token and return as counted string
-                    char_obj = self.inner.pop_ds()
-                    assert isinstance(char_obj, W_IntObject)
+                    self.inner.pop_int() # delimiter char (ignored)
 
                     # Parse next token (simplified implementation)
                     if i >= toks_len:
@@ -513,17 +799,16 @@ class OuterInterpreter(object):
 
                     # Create counted string: length byte followed by string
                     length = len(word_str)
-                    addr = W_IntObject(self.inner.here)
+                    addr = self.inner.here
                     # Store length at HERE
-                    self.inner.cell_store(addr, W_IntObject(length))
+                    self.inner.cell_store_int(addr, length)
                     self.inner.here += self.inner.cell_size_bytes
                     # Store string characters
                     for ch in word_str:
-                        ch_addr = W_IntObject(self.inner.here)
-                        self.inner.cell_store(ch_addr, W_IntObject(ord(ch)))
+                        self.inner.cell_store_int(self.inner.here, ord(ch))
                         self.inner.here += 1
                     # Push the address (pointing to the count)
-                    self.inner.push_ds(addr)
+                    self.inner.push_int(addr)
                     continue
 
             if self.state == COMPILE:
@@ -561,15 +846,39 @@ class OuterInterpreter(object):
                     self.ctrl.append(CtrlEntry(CTRL_DO, do_body_start))
                     continue
 
-                if tkey == "LOOP":
+                if tkey == "?DO":
+                    # (?DO) branches past the loop like LEAVE
+                    qdo_addr = self.cc_ptr
+                    self._emit_with_target(self.wQDO, 0)
+                    entry = CtrlEntry(CTRL_DO, self.cc_ptr)
+                    entry.leave_addrs.append(qdo_addr)
+                    self.ctrl.append(entry)
+                    continue
+
+                if tkey == "LOOP" or tkey == "+LOOP" or tkey == "-LOOP":
                     entry = self.ctrl.pop()
                     if entry.kind != CTRL_DO:
-                        print "LOOP without DO"
+                        print "%s without DO" % tkey
                         return
-                    self._emit_with_target(self.wLOOP, entry.index)
+                    if tkey == "+LOOP":
+                        w_loop = self.wPLUSLOOP
+                    elif tkey == "-LOOP":
+                        w_loop = self.wMINUSLOOP
+                    else:
+                        w_loop = self.wLOOP
+                    self._emit_with_target(w_loop, entry.index)
                     loop_end = self.cc_ptr
                     for leave_addr in entry.leave_addrs:
-                        self.current_lits[leave_addr] = W_IntObject(loop_end)
+                        self.current_lits[leave_addr] = wrap_int(loop_end)
+                    continue
+
+                if tkey == "LEAVE":
+                    entry = self._innermost_do()
+                    if entry is None:
+                        print "LEAVE without DO"
+                        return
+                    entry.leave_addrs.append(self.cc_ptr)
+                    self._emit_with_target(self.wLEAVE, 0)
                     continue
 
                 if tkey == "BEGIN":
@@ -601,6 +910,105 @@ class OuterInterpreter(object):
                     self._patch_here(while_entry.index)
                     continue
 
+                if tkey == "RECURSE":
+                    if self.current_word is None:
+                        print "RECURSE outside definition"
+                        continue
+                    self._emit_word(self.current_word)
+                    continue
+
+                # UNTIL and AGAIN close a BEGIN with a single backward
+                # branch, which signals the JIT like every back edge
+                if tkey == "UNTIL" or tkey == "AGAIN":
+                    if len(self.ctrl) == 0 or self.ctrl[-1].kind != CTRL_BEGIN:
+                        print "%s without BEGIN" % tkey
+                        return
+                    entry = self.ctrl.pop()
+                    if tkey == "UNTIL":
+                        self._emit_with_target(self.w0BR, entry.index)
+                    else:
+                        self._emit_with_target(self.wBR, entry.index)
+                    continue
+
+                # CASE x OF ... ENDOF ... default ENDCASE compiles to
+                #     BRANCH next
+                #     next: LIT x (OF) next' DROP ... BRANCH end
+                #     next': ... default DROP
+                #     end:
+                # where (OF) drops x and branches unless it equals the
+                # selector.  With dense literal selectors the first BRANCH
+                # is pointed at a jump table emitted after the default
+                # clause, whose (CASE-TARGET)s lead to the DROPs, and the
+                # tests become unreachable for the peephole pass to drop.
+                if tkey == "CASE":
+                    orig = self.cc_ptr
+                    self._emit_with_target(self.wBR, orig + 1)
+                    entry = CtrlEntry(CTRL_CASE, orig)
+                    entry.clause_start = self.cc_ptr
+                    self.ctrl.append(entry)
+                    continue
+
+                if tkey == "OF":
+                    if len(self.ctrl) == 0 or self.ctrl[-1].kind != CTRL_CASE:
+                        print "OF without CASE"
+                        return
+                    entry = self.ctrl[-1]
+                    start = entry.clause_start
+                    w_sel = self.current_lits[start]
+                    if (self.cc_ptr == start + 1 and
+                            self.current_code[start] is self.wLIT and
+                            isinstance(w_sel, W_IntObject)):
+                        entry.selectors.append(w_sel.intval)
+                    else:
+                        entry.literal_selectors = False
+                    orig = self.cc_ptr
+                    self._emit_with_target(self.wOF, 0)
+                    entry.clause_addrs.append(self.cc_ptr)
+                    self._emit_word(self.wDROP)
+                    self.ctrl.append(CtrlEntry(CTRL_OF, orig))
+                    continue
+
+                if tkey == "ENDOF":
+                    entry = self.ctrl.pop()
+                    if entry.kind != CTRL_OF:
+                        print "ENDOF without OF"
+                        return
+                    case_entry = self.ctrl[-1]
+                    case_entry.endof_addrs.append(self.cc_ptr)
+                    self._emit_with_target(self.wBR, 0)
+                    self._patch_here(entry.index)
+                    case_entry.clause_start = self.cc_ptr
+                    continue
+
+                if tkey == "ENDCASE":
+                    entry = self.ctrl.pop()
+                    if entry.kind != CTRL_CASE:
+                        print "ENDCASE without CASE"
+                        return
+                    low, high = self._case_table_range(entry)
+                    if low <= high:
+                        self._emit_case_table(entry, low, high)
+                    self._emit_word(self.wDROP)
+                    for endof_addr in entry.endof_addrs:
+                        self._patch_here(endof_addr)
+                    continue
+
+                if tkey == "IS" or tkey == "ACTION-OF":
+                    # compiled as the deferred word's xt and DEFER! or DEFER@
+                    if i >= toks_len:
+                        print tkey + " requires a name"
+                        return
+                    name, i = self._read_tok(toks, i)
+                    w = self._find_deferred(name)
+                    if w is None:
+                        continue
+                    self._emit_lit(W_WordObject(w))
+                    if tkey == "IS":
+                        self._emit_word(self.wDEFER_STORE)
+                    else:
+                        self._emit_word(self.wDEFER_FETCH)
+                    continue
+
                 if tkey == "[CHAR]":
                     if i >= toks_len:
                         print "[CHAR] requires a following character"
@@ -610,7 +1018,7 @@ class OuterInterpreter(object):
                     char_tok_len = len(char_tok)
                     if char_tok_len > 0:
                         char_code = ord(char_tok[0])
-                        self._emit_lit(W_IntObject(char_code))
+                        self._emit_lit(wrap_int(char_code))
                     else:
                         print "[CHAR] got empty token"
                     continue
@@ -628,7 +1036,11 @@ class OuterInterpreter(object):
                     print "UNKNOWN: " + t
             elif self.state == COMPILE:
                 if w is not None:
-                    self._emit_word(w)
+                    self._compile_word(w)
+                elif tkey == to_upper(self.current_name):
+                    # the definition is only installed at ';', so until then
+                    # a new name can only mean a call to itself
+                    self._emit_word(self.current_word)
                 elif self._is_float(t):
                     self._emit_lit(self._to_float(t))
                 elif self._is_number(t):
@@ -637,3 +1049,7 @@ class OuterInterpreter(object):
                     print "UNKNOWN: " + t
             else:
                 assert 0, "unreachable state"
+
+        # a top-level control structure may continue on the next line
+        if self._in_script_code() and len(self.ctrl) == 0:
+            self._run_script_code()
@@ -1,21 +1,23 @@
 from rpython.rlib.rfile import create_stdio
 from rpython.rlib.jit import promote, unroll_safe
+from rpython.rlib.rarithmetic import intmask, r_uint
 
 from rpyforth.objects import (
     BINARY,
     OCTAL,
     DECIMAL,
     HEX,
-    TRUE,
-    ZERO,
     W_IntObject,
     W_StringObject,
     W_FloatObject,
     W_WordObject,
-    CELL_SIZE,
+    W_CallSiteCache,
+    W_LoopBounds,
+    DEFERRED_WORD,
     LONG_BIT,
 )
-from rpyforth.inner_interp import jitdriver
+from rpyforth.inner_interp import jitdriver, RETURN_IP, CALL_IP
+from rpyforth.superinstructions import PROFILED_SUPERINSTRUCTIONS
 from rpyforth.util import digit_to_char
 
 
@@ -34,33 +36,24 @@ def _maybe_enter_jit(inner, target_ip, origin_ip, thread):
 # 0= ( x -- flag )
 def prim_ZEROEQUAL(inner, cur, ip):
     """GForth core 2012: flag is true when x equals zero."""
-    w_x = inner.pop_ds()
-    if w_x.zero_equal():
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    x = inner.top_int()
+    inner.set_top_flag(x == 0)
     return ip
 
 
 # 0< ( n -- flag )
 def prim_ZEROLESS(inner, cur, ip):
     """GForth core 2012: flag is true when n is strictly negative."""
-    w_x = inner.pop_ds()
-    if w_x.zero_less():
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    x = inner.top_int()
+    inner.set_top_flag(x < 0)
     return ip
 
 
 # 0> ( n -- flag )
 def prim_ZEROGREATER(inner, cur, ip):
     """GForth core 2012: flag is true when n is strictly positive."""
-    w_x = inner.pop_ds()
-    if w_x.zero_greater():
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    x = inner.top_int()
+    inner.set_top_flag(x > 0)
     return ip
 
 
@@ -68,205 +61,207 @@ def prim_ZEROGREATER(inner, cur, ip):
 def prim_GREATER(inner, cur, ip):
     """GForth core 2012: flag is true when n1 is greater than n2."""
     # Pop in correct order: n2 is top, n1 is second
-    w_n2 = inner.pop_ds()
-    w_n1 = inner.pop_ds()
-    assert isinstance(w_n1, W_IntObject)
-    assert isinstance(w_n2, W_IntObject)
-    # Direct field access for better JIT optimization
-    if w_n1.intval > w_n2.intval:
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    n2 = inner.pop_int()
+    n1 = inner.top_int()
+    inner.set_top_flag(n1 > n2)
     return ip
 
 # < ( n1 n2 -- flag )
 def prim_LESS(inner, cur, ip):
     """GForth core 2012: flag is true when n1 is less than n2."""
     # Pop in correct order: n2 is top, n1 is second
-    w_n2 = inner.pop_ds()
-    w_n1 = inner.pop_ds()
-    assert isinstance(w_n1, W_IntObject)
-    assert isinstance(w_n2, W_IntObject)
-    # Direct field access for better JIT optimization
-    if w_n1.intval < w_n2.intval:
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    n2 = inner.pop_int()
+    n1 = inner.top_int()
+    inner.set_top_flag(n1 < n2)
     return ip
 
 
 # 0<> ( n -- flag )
 def prim_ZERONOTEQUAL(inner, cur, ip):
     """GForth core 2012: flag is true when n is non-zero."""
-    w_x = inner.pop_ds()
-    if not w_x.zero_equal():
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    x = inner.top_int()
+    inner.set_top_flag(x != 0)
     return ip
 
 
 # DUP ( x -- x x )
 def prim_DUP(inner, cur, ip):
     """GForth core 2012: duplicate x, leaving two copies on the stack."""
-    a = inner.pop_ds()
-    inner.push_ds(a)
-    inner.push_ds(a)
+    inner.dup_ds()
     return ip
 
 
 # 2DUP ( x1 x2 -- x1 x2 x1 x2 )
 def prim_2DUP(inner, cur, ip):
-    b = inner.pop_ds()
-    a = inner.pop_ds()
-    inner.push_ds(a)
-    inner.push_ds(b)
-    inner.push_ds(a)
-    inner.push_ds(b)
+    inner.over_ds()
+    inner.over_ds()
     return ip
 
 
 # ?DUP ( x -- 0 | x x )
 def prim_QUESTIONDUP(inner, cur, ip):
     """GForth core 2012: duplicate x if it is non-zero."""
-    a = inner.pop_ds()
-    inner.push_ds(a)
-    if not a.zero_equal():
-        inner.push_ds(a)
+    if inner.top_int() != 0:
+        inner.dup_ds()
     return ip
 
 
 # DROP ( x -- )
 def prim_DROP(inner, cur, ip):
     """GForth core 2012: discard the top stack item."""
-    inner.pop_ds()
+    inner.drop_ds(1)
     return ip
 
 
 # 2DROP ( x1 x2 -- )
 def prim_2DROP(inner, cur, ip):
     """GForth core 2012: discard the top two stack items."""
-    inner.pop_ds()
-    inner.pop_ds()
+    inner.drop_ds(2)
     return ip
 
 # SWAP ( x1 x2 -- x2 x1 )
 def prim_SWAP(inner, cur, ip):
     """GForth core 2012: exchange the top two stack items."""
-    a, b = inner.top2_ds()
-    inner.push_ds(b)
-    inner.push_ds(a)
+    inner.swap_top_ds()
     return ip
 
 
 # 2SWAP ( x1 x2 x3 x4 -- x3 x4 x1 x2 )
 def prim_2SWAP(inner, cur, ip):
     """GForth core 2012: exchange the top two cell pairs."""
-    c, d = inner.top2_ds()
-    a, b = inner.top2_ds()
-    inner.push_ds(c)
-    inner.push_ds(d)
-    inner.push_ds(a)
-    inner.push_ds(b)
+    inner.roll_ds(3)
+    inner.roll_ds(3)
     return ip
 
 
 # OVER ( x1 x2 -- x1 x2 x1 )
 def prim_OVER(inner, cur, ip):
     """GForth core 2012: copy the second stack item to the top."""
-    b = inner.pop_ds()
-    a = inner.pop_ds()
-    inner.push_ds(a)
-    inner.push_ds(b)
-    inner.push_ds(a)
+    inner.over_ds()
     return ip
 
 
 # 2OVER ( x1 x2 x3 x4 -- x1 x2 x3 x4 x1 x2 )
 def prim_2OVER(inner, cur, ip):
     """GForth core 2012: copy cell pair x1 x2 to the top of the stack."""
-    d = inner.pop_ds()
-    c = inner.pop_ds()
-    b = inner.pop_ds()
-    a = inner.pop_ds()
-    inner.push_ds(a)
-    inner.push_ds(b)
-    inner.push_ds(c)
-    inner.push_ds(d)
-    inner.push_ds(a)
-    inner.push_ds(b)
+    inner.over2_ds(2)
     return ip
 
 
 # ROT ( x1 x2 x3 -- x2 x3 x1 )
 def prim_ROT(inner, cur, ip):
-    c = inner.pop_ds()
-    b = inner.pop_ds()
-    a = inner.pop_ds()
-    inner.push_ds(b)
-    inner.push_ds(c)
-    inner.push_ds(a)
+    """GForth core 2012: rotate the top three stack entries."""
+    inner.roll_ds(2)
+    return ip
+
+
+# -ROT ( x1 x2 x3 -- x3 x1 x2 )
+def prim_MINUSROT(inner, cur, ip):
+    """GForth: rotate the top three stack entries the other way."""
+    inner.unroll_ds(2)
+    return ip
+
+
+# 2ROT ( x1 x2 x3 x4 x5 x6 -- x3 x4 x5 x6 x1 x2 )
+def prim_2ROT(inner, cur, ip):
+    """GForth double 2012: rotate the top three cell pairs."""
+    inner.roll_ds(5)
+    inner.roll_ds(5)
+    return ip
+
+
+# NIP ( x1 x2 -- x2 )
+def prim_NIP(inner, cur, ip):
+    """GForth core ext 2012: drop the first item below the top of stack."""
+    inner.drop_under_ds(1, 1)
+    return ip
+
+
+# 2NIP ( x1 x2 x3 x4 -- x3 x4 )
+def prim_2NIP(inner, cur, ip):
+    """GForth: drop the cell pair below the top cell pair."""
+    inner.drop_under_ds(2, 2)
+    return ip
+
+
+# TUCK ( x1 x2 -- x2 x1 x2 )
+def prim_TUCK(inner, cur, ip):
+    """GForth core ext 2012: copy the top item below the second item."""
+    inner.dup_ds()
+    inner.unroll_ds(2)
+    return ip
+
+
+# ROLL ( xu xu-1 ... x0 u -- xu-1 ... x0 xu )
+def prim_ROLL(inner, cur, ip):
+    """GForth core ext 2012: move the u-th stack item to the top."""
+    inner.roll_ds(inner.pop_int())
     return ip
 
 
 # MAX ( n1 n2 -- n3 )
 def prim_MAX(inner, cur, ip):
     """GForth core 2012: n3 is the greater of n1 and n2."""
-    a, b = inner.top2_ds()
-    if a.lt(b):
-        inner.push_ds(b)
+    b = inner.pop_int()
+    a = inner.pop_int()
+    if a < b:
+        inner.push_int(b)
     else:
-        inner.push_ds(a)
+        inner.push_int(a)
     return ip
 
 
 # MIN ( n1 n2 -- n3 )
 def prim_MIN(inner, cur, ip):
     """GForth core 2012: n3 is the lesser of n1 and n2."""
-    a, b = inner.top2_ds()
-    if a.lt(b):
-        inner.push_ds(a)
+    b = inner.pop_int()
+    a = inner.pop_int()
+    if a < b:
+        inner.push_int(a)
     else:
-        inner.push_ds(b)
+        inner.push_int(b)
     return ip
 
 
 # DEPTH ( -- +n )
 def prim_DEPTH(inner, cur, ip):
     """GForth core 2012: +n is the number of single-cell values contained in the data stack."""
-    inner.push_ds(W_IntObject(inner.ds_ptr))
+    inner.push_int(inner.ds_ptr)
     return ip
 
 
 # RSHIFT ( n1 u -- n2 )
 def prim_RSHIFT(inner, cur, ip):
     """GForth core 2012: perform a logical right shift of u bit-places on n1, giving n2."""
-    a = inner.pop_ds()
-    b = inner.pop_ds()
-    inner.push_ds(b.rshift(a))
+    u = inner.pop_int()
+    n1 = inner.top_int()
+    inner.set_top_int(n1 >> u)
     return ip
 
 
 # LSHIFT ( n1 u -- n2 )
 def prim_LSHIFT(inner, cur, ip):
     """GForth core 2012: perform a logical left shift of u bit-places on n1, giving n2."""
-    a = inner.pop_ds()
-    b = inner.pop_ds()
-    inner.push_ds(b.lshift(a))
+    u = inner.pop_int()
+    n1 = inner.top_int()
+    inner.set_top_int(n1 << u)
     return ip
 
 # S>D ( n -- d )
 def prim_S_TO_D(inner, cur, ip):
     """GForth core 2012: convert tne number n to double-cell number d."""
-    a = inner.pop_ds()
-    inner.push_ds(a)
-    inner.push_ds(a.s_to_d())
+    n = inner.pop_int()
+    inner.push_int(n)
+    if n >= 0:
+        inner.push_int(0)
+    else:
+        inner.push_int(-1)
     return ip
 
 # BL ( -- char )
 def prim_BL(inner, cur, ip):
     """GForth core 2012: char is the character value of a space."""
-    inner.push_ds(W_IntObject(ord(' ')))
+    inner.push_int(ord(' '))
     return ip
 
 # Arithmetic
@@ -275,97 +270,90 @@ def prim_BL(inner, cur, ip):
 # + ( n1 n2 -- n3 )
 def prim_ADD(inner, cur, ip):
     """GForth core 2012: add n1 and n2, leaving their sum."""
-    # top2_ds pops in correct order: second-to-top (a), then top (b)
-    a, b = inner.top2_ds()
-    assert isinstance(a, W_IntObject)
-    assert isinstance(b, W_IntObject)
-    # Direct field access for better JIT optimization
-    inner.push_ds(W_IntObject(a.intval + b.intval))
+    b = inner.pop_int()
+    a = inner.top_int()
+    inner.set_top_int(a + b)
     return ip
 
 
 # - ( n1 n2 -- n3 )
 def prim_SUB(inner, cur, ip):
     """GForth core 2012: subtract n2 from n1, leaving the difference."""
-    # top2_ds pops in correct order: second-to-top (a), then top (b)
-    a, b = inner.top2_ds()
-    assert isinstance(a, W_IntObject)
-    assert isinstance(b, W_IntObject)
-    # Direct field access for better JIT optimization
-    inner.push_ds(W_IntObject(a.intval - b.intval))
+    b = inner.pop_int()
+    a = inner.top_int()
+    inner.set_top_int(a - b)
     return ip
 
 
 # * ( n1 n2 -- n3 )
 def prim_MUL(inner, cur, ip):
     """GForth core 2012: multiply n1 by n2, leaving the product."""
-    # top2_ds pops in correct order: second-to-top (a), then top (b)
-    a, b = inner.top2_ds()
-    assert isinstance(a, W_IntObject)
-    assert isinstance(b, W_IntObject)
-    # Direct field access for better JIT optimization
-    inner.push_ds(W_IntObject(a.intval * b.intval))
+    b = inner.pop_int()
+    a = inner.top_int()
+    inner.set_top_int(a * b)
     return ip
 
 
 # ABS ( n -- u )
 def prim_ABS(inner, cur, ip):
     """GForth core 2012: u is the absolute value of n."""
-    a = inner.pop_ds()
-    inner.push_ds(a.abs())
+    a = inner.top_int()
+    inner.set_top_int(abs(a))
     return ip
 
 
 # NEGATE ( n1 -- n2 )
 def prim_NEGATE(inner, cur, ip):
     """GForth core 2012: negate n1, giving its arithmetic inverse n2."""
-    a = inner.pop_ds()
-    inner.push_ds(a.neg())
+    a = inner.top_int()
+    inner.set_top_int(-a)
     return ip
 
 
 # MOD ( n1 n2 -- n3 )
 def prim_MOD(inner, cur, ip):
     """GForth core 2012: divide n1 by n2, giving the single-cell remainder n3."""
-    a, b = inner.top2_ds()
-    inner.push_ds(a.mod(b))
+    b = inner.pop_int()
+    a = inner.top_int()
+    inner.set_top_int(a % b)
     return ip
 
 
 # 1+ ( n1 -- n2 )
 def prim_INC(inner, cur, ip):
     """GForth core 2012: add one to n1."""
-    a = inner.pop_ds()
-    inner.push_ds(a.inc())
+    a = inner.top_int()
+    inner.set_top_int(a + 1)
     return ip
 
 
 # 1- ( n1 -- n2 )
 def prim_DEC(inner, cur, ip):
     """GForth core 2012: subtract one from n1."""
-    a = inner.pop_ds()
-    inner.push_ds(a.dec())
+    a = inner.top_int()
+    inner.set_top_int(a - 1)
     return ip
 
 
 # M* ( n1 n2 -- d)
 def prim_MUL_STAR(inner, cur, ip):
     """GForth core 2012: d is the signed product of n1 times n2."""
-    a, b = inner.top2_ds()
-    c = a.mul(b)    #c is 128bits
+    b = inner.pop_int()
+    a = inner.pop_int()
+    c = a * b    #c is 128bits
 
     BIT_MASK = (1 << LONG_BIT) - 1   #111...11 64bits
     SIGN_BIT = 1 << (LONG_BIT - 1)  #100...00 64bits
 
-    low = c.intval & BIT_MASK    # get c's low 64bits
+    low = c & BIT_MASK    # get c's low 64bits
 
     if low & SIGN_BIT:  # if highest bit is 1
         low = low - (1 << LONG_BIT)  # convert to negative number
 
-    high = c.intval >> LONG_BIT # get c's high 64bits
+    high = c >> LONG_BIT # get c's high 64bits
 
-    inner.push_ds(W_IntObject(low))
-    inner.push_ds(W_IntObject(high))
+    inner.push_int(low)
+    inner.push_int(high)
 
     return ip
 
@@ -375,9 +363,9 @@ def prim_MUL_STAR(inner, cur, ip):
 # ! ( x addr -- )
 def prim_STORE(inner, cur, ip):
     """GForth core 2012: store x at cell address addr."""
-    addr_obj = inner.pop_ds()
-    val_obj = inner.pop_ds()
-    inner.cell_store(addr_obj, val_obj)
+    addr = inner.pop_int()
+    x = inner.pop_int()
+    inner.cell_store_int(addr, x)
     return ip
 
 
@@ -388,42 +376,40 @@ def prim_2STORE(inner, cur, ip):
     with x2 at a-addr and x1 at the next consecutive cell.
     It is equivalent to the sequence SWAP OVER ! CELL+ !.
     """
-    addr_obj = inner.pop_ds()
-    w_x2 = inner.pop_ds()
-    w_x1 = inner.pop_ds()
-    inner.cell_2store(addr_obj, w_x1, w_x2)
+    addr = inner.pop_int()
+    x2 = inner.pop_int()
+    x1 = inner.pop_int()
+    inner.cell_2store_int(addr, x1, x2)
     return ip
 
 # @ ( addr -- x )
 def prim_FETCH(inner, cur, ip):
     """GForth core 2012: fetch the cell contents at addr."""
-    addr_obj = inner.pop_ds()
-    inner.push_ds(inner.cell_fetch(addr_obj))
+    addr = inner.top_int()
+    inner.set_top_int(inner.cell_fetch_int(addr))
     return ip
 
 
 # ( -- n )
 def prim_CELL(inner, cur, ip):
     """push the size of one cell in address units."""
-    inner.push_ds(CELL_SIZE)
+    inner.push_int(inner.cell_size_bytes)
     return ip
 
 
 # ( n -- n )
 def prim_CELLPLUS(inner, cur, ip):
     """GForth core 2012: add one cell to an address."""
-    addr = inner.pop_ds()
-    assert isinstance(addr, W_IntObject)
-    inner.push_ds(addr.add(CELL_SIZE))
+    addr = inner.top_int()
+    inner.set_top_int(addr + inner.cell_size_bytes)
     return ip
 
 
 # ( n -- n * cell_size )
 def prim_CELLS(inner, cur, ip):
     """GForth core 2012: convert a cell count to address units."""
-    count = inner.pop_ds()
-    assert isinstance(count, W_IntObject)
-    inner.push_ds(count.mul(CELL_SIZE))
+    count = inner.top_int()
+    inner.set_top_int(count * inner.cell_size_bytes)
     return ip
 
 
@@ -434,13 +420,9 @@ def prim_CELLS(inner, cur, ip):
 def prim_0BRANCH(inner, cur, ip):
     """GForth core 2012: branch to target when flag is zero."""
     origin_ip = ip - 1
-    w_x = inner.pop_ds()
-    assert isinstance(w_x, W_IntObject)
-    # Direct field access for better optimization
-    if w_x.intval == 0:
-        w_target = promote(cur.lits[origin_ip])
-        assert isinstance(w_target, W_IntObject)
-        target_ip = w_target.intval
+    x = inner.pop_int()
+    if x == 0:
+        target_ip = promote(cur.int_at(origin_ip))
         ip = target_ip
         _maybe_enter_jit(inner, target_ip, origin_ip, cur)
     return ip
@@ -450,85 +432,146 @@ def prim_0BRANCH(inner, cur, ip):
 def prim_BRANCH(inner, cur, ip):
     """GForth core 2012: branch unconditionally to the target."""
     origin_ip = ip - 1
-    target = promote(cur.lits[origin_ip])
-    assert isinstance(target, W_IntObject)
-    target_ip = target.intval
+    target_ip = promote(cur.int_at(origin_ip))
     ip = target_ip
     _maybe_enter_jit(inner, target_ip, origin_ip, cur)
     return ip
 
 
+# CASE OF ENDOF ENDCASE
+
+
+# (OF) ( x1 x2 -- x1 ) branch unless x1 equals x2
+def prim_OF_RUNTIME(inner, cur, ip):
+    x2 = inner.pop_int()
+    return _branch_if_false(inner, cur, ip, inner.top_int() == x2)
+
+
+# (JUMP-TABLE) ( x -- x ) branch to the (CASE-TARGET) entry for x
+#
+# Compiled by ENDCASE as
+#     (JUMP-TABLE) count (CASE-LOW) low (CASE-TARGET) t0 ... (CASE-TARGET) tn
+# with one entry per value from low to low+count-1, and a last entry for
+# the values outside that range.
+def prim_JUMP_TABLE(inner, cur, ip):
+    count = promote(cur.int_at(ip - 1))
+    entries = cur.next_ip(ip, cur.word_at(ip))
+    low = promote(cur.int_at(entries - 1))
+    stride = promote(cur.next_ip(entries, cur.word_at(entries)) - entries)
+    index = inner.top_int() - low
+    if index < 0 or index > count:
+        index = count
+    index = promote(index)
+    return promote(cur.int_at(entries + (index + 1) * stride - 1))
+
+
+# (CASE-LOW) and (CASE-TARGET) only carry the operands of (JUMP-TABLE)
+def prim_CASE_OPERAND(inner, cur, ip):
+    return ip
+
+
 # Loop control primitives
 
-# (DO) ( limit start -- ) ( R: -- limit start )
+# (DO) ( limit start -- ) ( L: -- limit start )
 def prim_DO_RUNTIME(inner, cur, ip):
-    start = inner.pop_ds()
-    limit = inner.pop_ds()
-    inner.push_rs(limit)
-    inner.push_rs(start)
+    start = inner.pop_int()
+    limit = inner.pop_int()
+    inner.push_loop(limit, start)
     return ip
 
 
-# (LOOP) ( -- ) ( R: limit counter -- limit counter+1 | )
-def prim_LOOP_RUNTIME(inner, cur, ip):
-    counter = inner.pop_rs()
-    limit = inner.pop_rs()
-
-    assert isinstance(counter, W_IntObject)
-    assert isinstance(limit, W_IntObject)
-
-    # Directly access intval for better optimization
-    # The JIT can constant-fold these if they're promoted
-    counter_val = counter.intval
-    limit_val = limit.intval
-    new_counter_val = counter_val + 1
-
-    if new_counter_val < limit_val:
-        # Continue loop: push back to return stack and branch
-        new_counter = W_IntObject(new_counter_val)
-        inner.push_rs(limit)
-        inner.push_rs(new_counter)
+# (LIT-DO) ( -- ) ( L: -- limit start ) == LIT limit LIT start (DO)
+def prim_LIT_DO(inner, cur, ip):
+    w_bounds = promote(cur.lit_at(ip - 1))
+    assert isinstance(w_bounds, W_LoopBounds)
+    inner.push_loop(w_bounds.limit, w_bounds.start)
+    return ip
+
+
+# (?DO) ( limit start -- ) ( L: -- limit start | )
+def prim_QDO_RUNTIME(inner, cur, ip):
+    """Skip the loop, to the target after its end, when start is limit."""
+    start = inner.pop_int()
+    limit = inner.pop_int()
+    if start == limit:
         origin_ip = ip - 1
-        target = promote(cur.lits[origin_ip])
-        assert isinstance(target, W_IntObject)
-        target_ip = target.intval
+        target_ip = promote(cur.int_at(origin_ip))
         ip = target_ip
         _maybe_enter_jit(inner, target_ip, origin_ip, cur)
+    else:
+        inner.push_loop(limit, start)
     return ip
 
-# LEAVE ( -- ) ( R: limit counter -- )
+
+def _next_iteration(inner, cur, ip, index, done):
+    """Leave the loop when done, else store index and branch back."""
+    if done:
+        inner.drop_loop()
+        return ip
+    inner.set_loop_index(index)
+    origin_ip = ip - 1
+    target_ip = promote(cur.int_at(origin_ip))
+    _maybe_enter_jit(inner, target_ip, origin_ip, cur)
+    return target_ip
+
+
+# (LOOP) ( -- ) ( L: limit index -- limit index+1 | )
+def prim_LOOP_RUNTIME(inner, cur, ip):
+    index = inner.loop_index(0) + 1
+    return _next_iteration(inner, cur, ip, index, index >= inner.loop_limit())
+
+
+# (+LOOP) ( n -- ) ( L: limit index -- limit index+n | )
+def prim_PLUSLOOP_RUNTIME(inner, cur, ip):
+    """Add n to the index, leaving the loop when the index crosses the
+    boundary between limit-1 and limit, in either direction."""
+    n = inner.pop_int()
+    index = inner.loop_index(0)
+    offset = intmask(index - inner.loop_limit())
+    # the sign of offset flips, and not because offset + n overflowed
+    done = (offset ^ intmask(offset + n)) < 0 and (offset ^ n) < 0
+    return _next_iteration(inner, cur, ip, intmask(index + n), done)
+
+
+# (-LOOP) ( u -- ) ( L: limit index -- limit index-u | )
+def prim_MINUSLOOP_RUNTIME(inner, cur, ip):
+    """Subtract u from the index, leaving the loop when the index crosses
+    the boundary between limit+1 and limit."""
+    u = r_uint(inner.pop_int())
+    index = inner.loop_index(0)
+    offset = r_uint(index - inner.loop_limit())
+    return _next_iteration(inner, cur, ip, intmask(index - u), offset <= u)
+
+# LEAVE ( -- ) ( L: limit index -- )
 def prim_LEAVE(inner, cur, ip):
-    """Exit the current loop by cleaning up return stack and jumping to end."""
-    inner.pop_rs()  # counter
-    inner.pop_rs()  # limit
-    target = cur.lits[ip - 2]
-    assert isinstance(target, W_IntObject)
-    ip = target.intval + 1
+    """Exit the current loop by dropping its parameters and jumping to end."""
+    inner.drop_loop()
+    return promote(cur.int_at(ip - 1))
+
+# UNLOOP ( -- ) ( L: limit index -- )
+def prim_UNLOOP(inner, cur, ip):
+    """GForth core 2012: drop the loop parameters, e.g. before EXIT."""
+    inner.drop_loop()
     return ip
 
-# I ( -- n ) ( R: limit counter -- limit counter )
+# I ( -- n ) ( L: limit index -- limit index )
 def prim_I(inner, cur, ip):
     """Get the current loop counter (innermost loop)."""
-    counter = inner.pop_rs()
-    limit = inner.pop_rs()
-    inner.push_rs(limit)
-    inner.push_rs(counter)
-    inner.push_ds(counter)
+    inner.push_int(inner.loop_index(0))
     return ip
 
 
-# J ( -- n ) ( R: limit1 counter1 limit2 counter2 -- limit1 counter1 limit2 counter2 )
+# J ( -- n ) ( L: limit1 index1 limit2 index2 -- same )
 def prim_J(inner, cur, ip):
     """Get the outer loop counter (second innermost loop)."""
-    counter2 = inner.pop_rs()
-    limit2 = inner.pop_rs()
-    counter1 = inner.pop_rs()
-    limit1 = inner.pop_rs()
-    inner.push_rs(limit1)
-    inner.push_rs(counter1)
-    inner.push_rs(limit2)
-    inner.push_rs(counter2)
-    inner.push_ds(counter1)
+    inner.push_int(inner.loop_index(1))
+    return ip
+
+
+# K ( -- n ) ( L: limit1 index1 limit2 index2 limit3 index3 -- same )
+def prim_K(inner, cur, ip):
+    """Get the counter of the third innermost loop."""
+    inner.push_int(inner.loop_index(2))
     return ip
 
 
@@ -592,13 +635,12 @@ def prim_NUMSIGN(inner, cur, ip):
     if not inner._pno_active:
         inner.print_str(W_StringObject("# outside <# #>"))
         return ip
-    x = inner.pop_ds()
-    assert isinstance(x, W_IntObject)
+    x = inner.pop_int()
     base = inner.base.intval
-    q = x.getvalue() // base
-    r = x.getvalue() % base
+    q = x // base
+    r = x % base
     inner._pno_buf.insert(0, digit_to_char(r))
-    inner.push_ds(W_IntObject(q))
+    inner.push_int(q)
     return ip
 
 
@@ -611,14 +653,12 @@ def prim_NUMSIGN_S(inner, cur, ip):
         return ip
 
     # Pop double-cell number (d.lo d.hi) where d.hi is on top
-    hi = inner.pop_ds()
-    lo = inner.pop_ds()
-    assert isinstance(hi, W_IntObject)
-    assert isinstance(lo, W_IntObject)
+    hi = inner.pop_int()
+    lo = inner.pop_int()
 
     # For simplified implementation, use the low-order cell
     # (assumes the number fits in single cell)
-    value = lo.getvalue()
+    value = lo
 
     base = inner.base.intval
     # Convert all remaining digits
@@ -633,8 +673,8 @@ def prim_NUMSIGN_S(inner, cur, ip):
             value = q
 
     # Push double-cell zero (0 0)
-    inner.push_ds(W_IntObject(0))
-    inner.push_ds(W_IntObject(0))
+    inner.push_int(0)
+    inner.push_int(0)
     return ip
 
 
@@ -644,9 +684,8 @@ def prim_HOLD(inner, cur, ip):
     if not inner._pno_active:
         inner.print_str(W_StringObject("HOLD outside <# #>"))
         return ip
-    ch = inner.pop_ds()
-    assert isinstance(ch, W_IntObject)
-    inner._pno_buf.insert(0, chr(ch.getvalue()))
+    ch = inner.pop_int()
+    inner._pno_buf.insert(0, chr(ch))
     return ip
 
 
@@ -656,9 +695,8 @@ def prim_SIGN(inner, cur, ip):
     if not inner._pno_active:
         inner.print_str(W_StringObject("SIGN outside <# #>"))
         return ip
-    n = inner.pop_ds()
-    assert isinstance(n, W_IntObject)
-    if n.intval < 0:
+    n = inner.pop_int()
+    if n < 0:
         # Append to put the sign at the end (left side of the final string)
         inner._pno_buf.append('-')
     return ip
@@ -691,10 +729,9 @@ def prim_TYPE(inner, cur, ip):
 # . ( n -- )
 def prim_DOT(inner, cur, ip):
     """GForth core 2012: display n according to current BASE."""
-    x = inner.pop_ds()
-    assert isinstance(x, W_IntObject)
+    x = inner.pop_int()
     stdin, stdout, stderr = create_stdio()
-    stdout.write(str(x.getvalue()))
+    stdout.write(str(x))
     stdout.write(' ')
     #stdout.flush()
     return ip
@@ -703,10 +740,9 @@ def prim_DOT(inner, cur, ip):
 # EMIT ( char -- )
 def prim_EMIT(inner, cur, ip):
     """GForth core 2012: display character with char code."""
-    x = inner.pop_ds()
-    assert isinstance(x, W_IntObject)
+    x = inner.pop_int()
     stdin, stdout, stderr = create_stdio()
-    stdout.write(chr(x.getvalue()))
+    stdout.write(chr(x))
     stdout.flush()
     return ip
 
@@ -715,16 +751,24 @@ def prim_EMIT(inner, cur, ip):
 # LIT ( -- x )
 def prim_LIT(inner, cur, ip):
     """GForth core 2012: push the next compilation literal."""
-    lit = promote(cur.lits[ip - 1])
-    inner.push_ds(lit)
+    i = ip - 1
+    if cur.is_inline_int(i):
+        inner.push_int(promote(cur.int_at(i)))
+        return ip
+    w_lit = promote(cur.lit_at(i))
+    if isinstance(w_lit, W_IntObject):
+        inner.push_int(w_lit.intval)
+    elif isinstance(w_lit, W_FloatObject):
+        inner.push_float(w_lit.floatval)
+    else:
+        inner.push_ds(w_lit)
     return ip
 
 
 # EXIT ( -- )
 def prim_EXIT(inner, cur, ip):
     """GForth core 2012: terminate the current definition."""
-    from rpyforth.inner_interp import Exit
-    raise Exit
+    return RETURN_IP
 
 
 # Floating point operations
@@ -732,68 +776,52 @@ def prim_EXIT(inner, cur, ip):
 # F* ( f1 f2 -- f3 )
 def prim_FMUL(inner, cur, ip):
     """Multiply two floating point numbers."""
-    f2 = inner.pop_ds()
-    f1 = inner.pop_ds()
-    assert isinstance(f1, W_FloatObject)
-    assert isinstance(f2, W_FloatObject)
-    inner.push_ds(f1.mul(f2))
+    f2 = inner.pop_float()
+    f1 = inner.top_float()
+    inner.set_top_float(f1 * f2)
     return ip
 
 
 # F+ ( f1 f2 -- f3 )
 def prim_FADD(inner, cur, ip):
     """Add two floating point numbers."""
-    f2 = inner.pop_ds()
-    f1 = inner.pop_ds()
-    assert isinstance(f1, W_FloatObject)
-    assert isinstance(f2, W_FloatObject)
-    inner.push_ds(f1.add(f2))
+    f2 = inner.pop_float()
+    f1 = inner.top_float()
+    inner.set_top_float(f1 + f2)
     return ip
 
 
 # F- ( f1 f2 -- f3 )
 def prim_FSUB(inner, cur, ip):
     """Subtract f2 from f1."""
-    f2 = inner.pop_ds()
-    f1 = inner.pop_ds()
-    assert isinstance(f1, W_FloatObject)
-    assert isinstance(f2, W_FloatObject)
-    inner.push_ds(f1.sub(f2))
+    f2 = inner.pop_float()
+    f1 = inner.top_float()
+    inner.set_top_float(f1 - f2)
     return ip
 
 
 # F/ ( f1 f2 -- f3 )
 def prim_FDIV(inner, cur, ip):
     """Divide f1 by f2."""
-    f2 = inner.pop_ds()
-    f1 = inner.pop_ds()
-    assert isinstance(f1, W_FloatObject)
-    assert isinstance(f2, W_FloatObject)
-    inner.push_ds(f1.div(f2))
+    f2 = inner.pop_float()
+    f1 = inner.top_float()
+    inner.set_top_float(f1 / f2)
     return ip
 
 
 # F> ( f1 f2 -- flag )
 def prim_FGREATER(inner, cur, ip):
     """Compare if f1 > f2."""
-    f2 = inner.pop_ds()
-    f1 = inner.pop_ds()
-    assert isinstance(f1, W_FloatObject)
-    assert isinstance(f2, W_FloatObject)
-    if f1.gt(f2):
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    f2 = inner.pop_float()
+    f1 = inner.top_float()
+    inner.set_top_flag(f1 > f2)
     return ip
 
 
 # FSWAP ( f1 f2 -- f2 f1 )
 def prim_FSWAP(inner, cur, ip):
     """Exchange the top two floating point stack items."""
-    f2 = inner.pop_ds()
-    f1 = inner.pop_ds()
-    inner.push_ds(f2)
-    inner.push_ds(f1)
+    inner.swap_top_ds()
     return ip
 
 
@@ -861,29 +889,7 @@ def prim_2RFETCH(inner, cur, ip):
 # PICK ( xu ... x1 x0 u -- xu ... x1 x0 xu )
 def prim_PICK(inner, cur, ip):
     """Copy the u-th stack item to the top (0 PICK is equivalent to DUP)."""
-    u = inner.pop_ds()
-    assert isinstance(u, W_IntObject)
-    u_val = u.getvalue()
-
-    # We need to access virtualizable stack without direct indexing
-    # Pop items off, find the one we want, and push them all back
-    if u_val == 0:
-        # 0 PICK is just DUP
-        item = inner.pop_ds()
-        inner.push_ds(item)
-        inner.push_ds(item)
-    else:
-        # Pop u_val+1 items to get to the target
-        temp = []
-        for i in range(u_val + 1):
-            temp.append(inner.pop_ds())
-        # The item we want is at the end
-        item = temp[u_val]
-        # Push everything back
-        for i in range(u_val, -1, -1):
-            inner.push_ds(temp[i])
-        # Push the picked item
-        inner.push_ds(item)
+    inner.pick_ds(inner.pop_int())
     return ip
 
 
@@ -892,36 +898,31 @@ def prim_PICK(inner, cur, ip):
 # S>F ( n -- ) ( F: -- f )
 def prim_S2F(inner, cur, ip):
     """Convert signed integer to float."""
-    n = inner.pop_ds()
-    assert isinstance(n, W_IntObject)
-    inner.push_ds(W_FloatObject(float(n.getvalue())))
+    n = inner.top_int()
+    inner.set_top_float(float(n))
     return ip
 
 
 # F! ( f-addr -- ) ( F: f -- )
 def prim_FSTORE(inner, cur, ip):
     """Store float at address."""
-    addr_obj = inner.pop_ds()
-    val_obj = inner.pop_ds()
-    inner.float_store(addr_obj, val_obj)
+    addr = inner.pop_int()
+    inner.float_store(addr, inner.pop_float())
     return ip
 
 
 # F@ ( f-addr -- ) ( F: -- f )
 def prim_FFETCH(inner, cur, ip):
     """Fetch float from address."""
-    addr_obj = inner.pop_ds()
-    inner.push_ds(inner.float_fetch(addr_obj))
+    addr = inner.top_int()
+    inner.set_top_float(inner.float_fetch(addr))
     return ip
 
 
 # FDUP ( F: f -- f f )
 def prim_FDUP(inner, cur, ip):
     """Duplicate float on stack."""
-    f = inner.pop_ds()
-    assert isinstance(f, W_FloatObject)
-    inner.push_ds(f)
-    inner.push_ds(f)
+    inner.dup_ds()
     return ip
 
 
@@ -933,7 +934,59 @@ def prim_EXECUTE(inner, cur, ip):
     xt = inner.pop_ds()
     assert isinstance(xt, W_WordObject)
     word = xt.word
-    inner.execute_word_now(word)
+    # compiled EXECUTEs carry an inline cache, see W_CallSiteCache
+    w_cache = promote(cur.lit_at(ip - 1))
+    if isinstance(w_cache, W_CallSiteCache) and not w_cache.megamorphic:
+        # promoted first, so that a hit is constant-folded in a trace
+        word = promote(word)
+        w_cache.lookup(word)
+    if word.kind == DEFERRED_WORD:
+        word = word.deferred_target()
+    if word.data is not None:
+        inner.push_ds(word.data)
+        return ip
+    prim = word.prim
+    if prim is None:
+        # let execute_thread push a frame, instead of recursing into it
+        inner.callee = word
+        return CALL_IP
+    if word.operand:
+        # reads its own lits slot, which EXECUTE cannot supply
+        inner.execute_word_now(word)
+        return ip
+    next_ip = prim(inner, cur, ip)
+    if next_ip == RETURN_IP:
+        return ip # EXIT ends only the executed word
+    return next_ip
+
+
+# DEFER@ ( xt1 -- xt2 )
+def prim_DEFER_FETCH(inner, cur, ip):
+    """GForth core ext 2012: xt2 is the word deferred word xt1 executes."""
+    xt = inner.pop_ds()
+    assert isinstance(xt, W_WordObject)
+    deferred = xt.word
+    assert deferred.kind == DEFERRED_WORD
+    inner.push_ds(W_WordObject(deferred.target))
+    return ip
+
+
+# DEFER! ( xt2 xt1 -- )
+def prim_DEFER_STORE(inner, cur, ip):
+    """GForth core ext 2012: make deferred word xt1 execute xt2."""
+    xt1 = inner.pop_ds()
+    xt2 = inner.pop_ds()
+    assert isinstance(xt1, W_WordObject)
+    assert isinstance(xt2, W_WordObject)
+    deferred = xt1.word
+    assert deferred.kind == DEFERRED_WORD
+    deferred.target = xt2.word
+    return ip
+
+
+# (DEFER-UNSET) ( -- ), the target of a deferred word before IS
+def prim_DEFER_UNSET(inner, cur, ip):
+    inner.print_str(W_StringObject("Deferred word not set"))
     return ip
 
 
@@ -944,14 +997,16 @@ def prim_TOBODY(inner, cur, ip):
     assert isinstance(xt, W_WordObject)
     word = xt.word
     # For words created with CREATE, VARIABLE, CONSTANT, etc.,
-    # the body is in the first literal of the code thread
-    if word.thread is not None and len(word.thread.lits) > 0:
-        body = word.thread.lits[0]
+    # the body is the value they push
+    if word.data is not None:
+        inner.push_ds(word.data)
+    elif word.thread is not None and word.thread.length() > 0:
+        body = word.thread.lit_at(0)
         inner.push_ds(body)
     else:
         # For primitive words, there's no body
         # Push 0 or raise an error
-        inner.push_ds(W_IntObject(0))
+        inner.push_int(0)
     return ip
 
 
@@ -960,72 +1015,59 @@ def prim_TOBODY(inner, cur, ip):
 # +! ( n|u a-addr -- )
 def prim_PLUSSTORE(inner, cur, ip):
     """GForth core 2012: add n to the value stored at a-addr."""
-    addr_obj = inner.pop_ds()
-    n = inner.pop_ds()
-    assert isinstance(addr_obj, W_IntObject)
-    assert isinstance(n, W_IntObject)
+    addr = inner.pop_int()
+    n = inner.pop_int()
     # Fetch current value, add n, store back
-    current = inner.cell_fetch(addr_obj)
-    assert isinstance(current, W_IntObject)
-    new_val = W_IntObject(current.intval + n.intval)
-    inner.cell_store(addr_obj, new_val)
+    inner.cell_store_int(addr, inner.cell_fetch_int(addr) + n)
     return ip
 
 
 # 2@ ( a-addr -- x1 x2 )
 def prim_2FETCH(inner, cur, ip):
     """GForth core 2012: fetch the cell pair stored at a-addr."""
-    addr_obj = inner.pop_ds()
-    assert isinstance(addr_obj, W_IntObject)
+    addr = inner.pop_int()
     # Actual storage from cell_2store: x1 at addr, x2 at addr+cell
-    x1 = inner.cell_fetch(addr_obj)
-    addr2 = W_IntObject(addr_obj.intval + inner.cell_size_bytes)
-    x2 = inner.cell_fetch(addr2)
+    x1 = inner.cell_fetch_int(addr)
+    x2 = inner.cell_fetch_int(addr + inner.cell_size_bytes)
     # Push x1 first, then x2 to get stack ( x1 x2 )
-    inner.push_ds(x1)
-    inner.push_ds(x2)
+    inner.push_int(x1)
+    inner.push_int(x2)
     return ip
 
 
 # C! ( char c-addr -- )
 def prim_C_STORE(inner, cur, ip):
     """GForth core 2012: store char at c-addr."""
-    addr_obj = inner.pop_ds()
-    char = inner.pop_ds()
-    assert isinstance(addr_obj, W_IntObject)
-    assert isinstance(char, W_IntObject)
+    addr = inner.pop_int()
+    char = inner.pop_int()
     # Store just the character (we'll use cell_store for simplicity)
-    inner.cell_store(addr_obj, char)
+    inner.cell_store_int(addr, char)
     return ip
 
 
 # C@ ( c-addr -- char )
 def prim_C_FETCH(inner, cur, ip):
     """GForth core 2012: fetch the character stored at c-addr."""
-    addr_obj = inner.pop_ds()
-    assert isinstance(addr_obj, W_IntObject)
-    char = inner.cell_fetch(addr_obj)
-    inner.push_ds(char)
+    addr = inner.top_int()
+    inner.set_top_int(inner.cell_fetch_int(addr))
     return ip
 
 
 # CHAR+ ( c-addr1 -- c-addr2 )
 def prim_CHAR_PLUS(inner, cur, ip):
     """GForth core 2012: add the size of a character to c-addr1."""
-    addr = inner.pop_ds()
-    assert isinstance(addr, W_IntObject)
+    addr = inner.pop_int()
     # In our implementation, characters are 1 byte
-    inner.push_ds(W_IntObject(addr.intval + 1))
+    inner.push_int(addr + 1)
     return ip
 
 
 # CHARS ( n1 -- n2 )
 def prim_CHARS(inner, cur, ip):
     """GForth core 2012: convert n1 characters to address units."""
-    n = inner.pop_ds()
-    assert isinstance(n, W_IntObject)
+    n = inner.pop_int()
     # In our implementation, 1 char = 1 address unit
-    inner.push_ds(n)
+    inner.push_int(n)
     return ip
 
 
@@ -1042,13 +1084,11 @@ def prim_ALIGN(inner, cur, ip):
 # ALIGNED ( addr -- a-addr )
 def prim_ALIGNED(inner, cur, ip):
     """GForth core 2012: return the aligned address."""
-    addr = inner.pop_ds()
-    assert isinstance(addr, W_IntObject)
-    addr_val = addr.intval
+    addr_val = inner.pop_int()
     remainder = addr_val % inner.cell_size_bytes
     if remainder != 0:
         addr_val += (inner.cell_size_bytes - remainder)
-    inner.push_ds(W_IntObject(addr_val))
+    inner.push_int(addr_val)
     return ip
 
 
@@ -1057,16 +1097,15 @@ def prim_ALIGNED(inner, cur, ip):
 # HERE ( -- addr )
 def prim_HERE(inner, cur, ip):
     """GForth core 2012: return the address of the next available data space location."""
-    inner.push_ds(W_IntObject(inner.here))
+    inner.push_int(inner.here)
     return ip
 
 
 # , ( x -- )
 def prim_COMMA(inner, cur, ip):
     """GForth core 2012: reserve one cell of data space and store x in it."""
-    x = inner.pop_ds()
-    addr = W_IntObject(inner.here)
-    inner.cell_store(addr, x)
+    x = inner.pop_int()
+    inner.cell_store_int(inner.here, x)
     inner.here += inner.cell_size_bytes
     return ip
 
@@ -1074,12 +1113,9 @@ def prim_COMMA(inner, cur, ip):
 # C, ( char -- )
 def prim_C_COMMA(inner, cur, ip):
     """GForth core 2012: reserve one character of data space and store char in it."""
-    char = inner.pop_ds()
-    assert isinstance(char, W_IntObject)
+    char = inner.pop_int()
     # For simplicity, we'll use cell_store but only increment by 1 byte
-    addr = W_IntObject(inner.here)
-    assert isinstance(char, W_IntObject)
-    inner.cell_store(addr, char)
+    inner.cell_store_int(inner.here, char)
     inner.here += 1
     return ip
 
@@ -1087,9 +1123,8 @@ def prim_C_COMMA(inner, cur, ip):
 # ALLOT ( n -- )
 def prim_ALLOT(inner, cur, ip):
     """GForth core 2012: reserve n address units of data space."""
-    n = inner.pop_ds()
-    assert isinstance(n, W_IntObject)
-    inner.here += n.intval
+    n = inner.pop_int()
+    inner.here += n
     return ip
 
 
@@ -1097,12 +1132,207 @@ def prim_ALLOT(inner, cur, ip):
 
 # = ( x1 x2 -- flag )
 def prim_EQUAL(inner, cur, ip):
-    x2 = inner.pop_ds()
-    x1 = inner.pop_ds()
-    if x1.eq(x2):
-        inner.push_ds(TRUE)
-    else:
-        inner.push_ds(ZERO)
+    x2 = inner.pop_int()
+    x1 = inner.top_int()
+    inner.set_top_flag(x1 == x2)
+    return ip
+
+
+# Superinstructions
+#
+# Fused replacements for common adjacent word sequences, substituted by
+# rpyforth.optimizer when a colon definition is finalised.  Each one saves
+# the dispatches of the words it replaces and the intermediate push/pop.
+
+def _branch_if_false(inner, cur, ip, flag):
+    if not flag:
+        origin_ip = ip - 1
+        target_ip = promote(cur.int_at(origin_ip))
+        ip = target_ip
+        _maybe_enter_jit(inner, target_ip, origin_ip, cur)
+    return ip
+
+
+# (LIT+) ( n1 -- n2 ) == LIT n +
+def prim_LIT_ADD(inner, cur, ip):
+    n = promote(cur.int_at(ip - 1))
+    inner.set_top_int(inner.top_int() + n)
+    return ip
+
+
+# (LIT@) ( -- x ) == LIT addr @
+def prim_LIT_FETCH(inner, cur, ip):
+    addr = promote(cur.int_at(ip - 1))
+    inner.push_int(inner.cell_fetch_int(addr))
+    return ip
+
+
+# (LIT!) ( x -- ) == LIT addr !
+def prim_LIT_STORE(inner, cur, ip):
+    addr = promote(cur.int_at(ip - 1))
+    inner.cell_store_int(addr, inner.pop_int())
+    return ip
+
+
+# (LITF@) ( -- ) ( F: -- f ) == LIT f-addr F@
+def prim_LIT_FFETCH(inner, cur, ip):
+    addr = promote(cur.int_at(ip - 1))
+    inner.push_float(inner.float_fetch(addr))
+    return ip
+
+
+# (LITF!) ( -- ) ( F: f -- ) == LIT f-addr F!
+def prim_LIT_FSTORE(inner, cur, ip):
+    addr = promote(cur.int_at(ip - 1))
+    inner.float_store(addr, inner.pop_float())
+    return ip
+
+
+# (DUP*) ( n -- n*n ) == DUP *
+def prim_DUP_MUL(inner, cur, ip):
+    n = inner.top_int()
+    inner.set_top_int(n * n)
+    return ip
+
+
+# (OVER+) ( n1 n2 -- n1 n1+n2 ) == OVER +
+def prim_OVER_ADD(inner, cur, ip):
+    n2 = inner.pop_int()
+    n1 = inner.pop_int()
+    inner.push_int(n1)
+    inner.push_int(n1 + n2)
+    return ip
+
+
+# (IJ*) ( -- n ) ( L: limit1 index1 limit2 index2 -- same ) == I J *
+def prim_I_J_MUL(inner, cur, ip):
+    inner.push_int(inner.loop_index(0) * inner.loop_index(1))
+    return ip
+
+
+# (F@F*) ( f1 f-addr -- f2 ) == F@ F*
+def prim_FFETCH_FMUL(inner, cur, ip):
+    addr = inner.pop_int()
+    f1 = inner.top_float()
+    inner.set_top_float(f1 * inner.float_fetch(addr))
+    return ip
+
+
+# (<0BRANCH) ( n1 n2 -- ) == < 0BRANCH
+def prim_LESS_0BRANCH(inner, cur, ip):
+    n2 = inner.pop_int()
+    n1 = inner.pop_int()
+    return _branch_if_false(inner, cur, ip, n1 < n2)
+
+
+# (>0BRANCH) ( n1 n2 -- ) == > 0BRANCH
+def prim_GREATER_0BRANCH(inner, cur, ip):
+    n2 = inner.pop_int()
+    n1 = inner.pop_int()
+    return _branch_if_false(inner, cur, ip, n1 > n2)
+
+
+# (=0BRANCH) ( x1 x2 -- ) == = 0BRANCH
+def prim_EQUAL_0BRANCH(inner, cur, ip):
+    x2 = inner.pop_int()
+    x1 = inner.pop_int()
+    return _branch_if_false(inner, cur, ip, x1 == x2)
+
+
+# (F>0BRANCH) ( f1 f2 -- ) == F> 0BRANCH
+def prim_FGREATER_0BRANCH(inner, cur, ip):
+    f2 = inner.pop_float()
+    f1 = inner.pop_float()
+    return _branch_if_false(inner, cur, ip, f1 > f2)
+
+
+# (0=0BRANCH) ( x -- ) == 0= 0BRANCH, i.e. branch when x is non-zero.
+# Produced by the peephole pass rather than the fusion table.
+def prim_ZEROEQUAL_0BRANCH(inner, cur, ip):
+    x = inner.pop_int()
+    return _branch_if_false(inner, cur, ip, x == 0)
+
+
+# Specialised variants
+#
+# Unchecked versions of arithmetic and comparison words, substituted by
+# rpyforth.type_inference where the operand cells are proven to hold
+# unboxed integers or unboxed floats.  They skip the tag checks.
+
+# (RAW+) ( n1 n2 -- n3 ) == + on unboxed integers
+def prim_RAW_ADD(inner, cur, ip):
+    b = inner.pop_raw_int()
+    inner.set_top_int(inner.top_raw_int() + b)
+    return ip
+
+
+# (RAW-) ( n1 n2 -- n3 ) == - on unboxed integers
+def prim_RAW_SUB(inner, cur, ip):
+    b = inner.pop_raw_int()
+    inner.set_top_int(inner.top_raw_int() - b)
+    return ip
+
+
+# (RAW*) ( n1 n2 -- n3 ) == * on unboxed integers
+def prim_RAW_MUL(inner, cur, ip):
+    b = inner.pop_raw_int()
+    inner.set_top_int(inner.top_raw_int() * b)
+    return ip
+
+
+# (RAW<) ( n1 n2 -- flag ) == < on unboxed integers
+def prim_RAW_LESS(inner, cur, ip):
+    b = inner.pop_raw_int()
+    inner.set_top_flag(inner.top_raw_int() < b)
+    return ip
+
+
+# (RAW>) ( n1 n2 -- flag ) == > on unboxed integers
+def prim_RAW_GREATER(inner, cur, ip):
+    b = inner.pop_raw_int()
+    inner.set_top_flag(inner.top_raw_int() > b)
+    return ip
+
+
+# (RAW=) ( n1 n2 -- flag ) == = on unboxed integers
+def prim_RAW_EQUAL(inner, cur, ip):
+    b = inner.pop_raw_int()
+    inner.set_top_flag(inner.top_raw_int() == b)
+    return ip
+
+
+# (RAWF+) ( f1 f2 -- f3 ) == F+ on unboxed floats
+def prim_RAW_FADD(inner, cur, ip):
+    f2 = inner.pop_raw_float()
+    inner.set_top_raw_float(inner.top_raw_float() + f2)
+    return ip
+
+
+# (RAWF-) ( f1 f2 -- f3 ) == F- on unboxed floats
+def prim_RAW_FSUB(inner, cur, ip):
+    f2 = inner.pop_raw_float()
+    inner.set_top_raw_float(inner.top_raw_float() - f2)
+    return ip
+
+
+# (RAWF*) ( f1 f2 -- f3 ) == F* on unboxed floats
+def prim_RAW_FMUL(inner, cur, ip):
+    f2 = inner.pop_raw_float()
+    inner.set_top_raw_float(inner.top_raw_float() * f2)
+    return ip
+
+
+# (RAWF/) ( f1 f2 -- f3 ) == F/ on unboxed floats
+def prim_RAW_FDIV(inner, cur, ip):
+    f2 = inner.pop_raw_float()
+    inner.set_top_raw_float(inner.top_raw_float() / f2)
+    return ip
+
+
+# (RAWF>) ( f1 f2 -- flag ) == F> on unboxed floats
+def prim_RAW_FGREATER(inner, cur, ip):
+    f2 = inner.pop_raw_float()
+    inner.set_top_flag(inner.top_raw_float() > f2)
     return ip
 
 
@@ -1127,6 +1357,12 @@ def install_primitives(outer):
     outer.define_prim("?DUP", prim_QUESTIONDUP)
 
     outer.define_prim("ROT", prim_ROT)
+    outer.define_prim("-ROT", prim_MINUSROT)
+    outer.define_prim("2ROT", prim_2ROT)
+    outer.define_prim("NIP", prim_NIP)
+    outer.define_prim("2NIP", prim_2NIP)
+    outer.define_prim("TUCK", prim_TUCK)
+    outer.define_prim("ROLL", prim_ROLL)
     outer.define_prim("MAX", prim_MAX)
     outer.define_prim("MIN", prim_MIN)
 
@@ -1190,16 +1426,26 @@ def install_primitives(outer):
     outer.define_prim("TYPE", prim_TYPE)  # for testing output
 
     # loop
-    outer.define_prim("0BRANCH", prim_0BRANCH)
-    outer.define_prim("BRANCH", prim_BRANCH)
+    outer.define_prim("0BRANCH", prim_0BRANCH, branch=True)
+    outer.define_prim("BRANCH", prim_BRANCH, branch=True)
+    outer.define_prim("(OF)", prim_OF_RUNTIME, branch=True)
+    outer.define_prim("(JUMP-TABLE)", prim_JUMP_TABLE, operand=True)
+    outer.define_prim("(CASE-LOW)", prim_CASE_OPERAND, operand=True)
+    outer.define_prim("(CASE-TARGET)", prim_CASE_OPERAND, branch=True)
     outer.define_prim("(DO)", prim_DO_RUNTIME)
-    outer.define_prim("(LOOP)", prim_LOOP_RUNTIME)
-    outer.define_prim("LEAVE", prim_LEAVE)
+    outer.define_prim("(LIT-DO)", prim_LIT_DO, operand=True)
+    outer.define_prim("(?DO)", prim_QDO_RUNTIME, branch=True)
+    outer.define_prim("(LOOP)", prim_LOOP_RUNTIME, branch=True)
+    outer.define_prim("(+LOOP)", prim_PLUSLOOP_RUNTIME, branch=True)
+    outer.define_prim("(-LOOP)", prim_MINUSLOOP_RUNTIME, branch=True)
+    outer.define_prim("UNLOOP", prim_UNLOOP)
+    outer.define_prim("LEAVE", prim_LEAVE, branch=True)
     outer.define_prim("I", prim_I)
     outer.define_prim("J", prim_J)
+    outer.define_prim("K", prim_K)
 
     # thread ops
-    outer.define_prim("LIT", prim_LIT)
+    outer.define_prim("LIT", prim_LIT, operand=True)
     outer.define_prim("EXIT", prim_EXIT)
 
     # floating point
@@ -1226,7 +1472,10 @@ def install_primitives(outer):
     outer.define_prim("2R@", prim_2RFETCH)
 
     # dictionary
-    outer.define_prim("EXECUTE", prim_EXECUTE)
+    outer.define_prim("EXECUTE", prim_EXECUTE, operand=True)
+    outer.define_prim("DEFER@", prim_DEFER_FETCH)
+    outer.define_prim("DEFER!", prim_DEFER_STORE)
+    outer.define_prim("(DEFER-UNSET)", prim_DEFER_UNSET)
     outer.define_prim(">BODY", prim_TOBODY)
 
     # data space
@@ -1237,3 +1486,36 @@ def install_primitives(outer):
 
     # comparison
     outer.define_prim("=", prim_EQUAL)
+
+    # superinstructions
+    outer.define_prim("(LIT+)", prim_LIT_ADD, operand=True)
+    outer.define_prim("(LIT@)", prim_LIT_FETCH, operand=True)
+    outer.define_prim("(LIT!)", prim_LIT_STORE, operand=True)
+    outer.define_prim("(LITF@)", prim_LIT_FFETCH, operand=True)
+    outer.define_prim("(LITF!)", prim_LIT_FSTORE, operand=True)
+    outer.define_prim("(DUP*)", prim_DUP_MUL)
+    outer.define_prim("(OVER+)", prim_OVER_ADD)
+    outer.define_prim("(IJ*)", prim_I_J_MUL)
+    outer.define_prim("(F@F*)", prim_FFETCH_FMUL)
+    outer.define_prim("(<0BRANCH)", prim_LESS_0BRANCH, branch=True)
+    outer.define_prim("(>0BRANCH)", prim_GREATER_0BRANCH, branch=True)
+    outer.define_prim("(=0BRANCH)", prim_EQUAL_0BRANCH, branch=True)
+    outer.define_prim("(F>0BRANCH)", prim_FGREATER_0BRANCH, branch=True)
+    outer.define_prim("(0=0BRANCH)", prim_ZEROEQUAL_0BRANCH, branch=True)
+
+    # specialised variants
+    outer.define_prim("(RAW+)", prim_RAW_ADD)
+    outer.define_prim("(RAW-)", prim_RAW_SUB)
+    outer.define_prim("(RAW*)", prim_RAW_MUL)
+    outer.define_prim("(RAW<)", prim_RAW_LESS)
+    outer.define_prim("(RAW>)", prim_RAW_GREATER)
+    outer.define_prim("(RAW=)", prim_RAW_EQUAL)
+    outer.define_prim("(RAWF+)", prim_RAW_FADD)
+    outer.define_prim("(RAWF-)", prim_RAW_FSUB)
+    outer.define_prim("(RAWF*)", prim_RAW_FMUL)
+    outer.define_prim("(RAWF/)", prim_RAW_FDIV)
+    outer.define_prim("(RAWF>)", prim_RAW_FGREATER)
+
+    # profile-guided superinstructions generated at translation time
+    for name, func, _ in PROFILED_SUPERINSTRUCTIONS:
+        outer.define_prim(name, func)
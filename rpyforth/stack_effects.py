@@ -0,0 +1,328 @@
+"""Static stack-effect analysis of compiled threads.
+
+Every primitive installed by install_primitives declares its effect on the
+data and return stacks in STACK_EFFECTS.  When ';' finalises a colon
+definition, StackChecker walks the thread from ip 0, following both edges
+of every branch, and tracks the stack depths relative to the word's entry.
+A thread checks out when every ip is reached with one depth and every EXIT
+leaves the same depths; the result is kept on the CodeThread so callers of
+the word can use it in turn.
+"""
+
+from rpyforth.optimizer import branch_target, find_branch_targets
+from rpyforth.superinstructions import PROFILED_SUPERINSTRUCTIONS
+
+
+# name: (data stack in, data stack out, return stack in, return stack out)
+# as the primitive actually behaves here (floats live on the data stack,
+# #> leaves a single string cell).  None marks an effect that depends on
+# runtime values; threads using such words are left unchecked.
+STACK_EFFECTS = {
+    # comparison
+    "0=": (1, 1, 0, 0), "0<": (1, 1, 0, 0), "0>": (1, 1, 0, 0),
+    ">": (2, 1, 0, 0), "<": (2, 1, 0, 0), "0<>": (1, 1, 0, 0),
+    "=": (2, 1, 0, 0),
+    # stack manipulation
+    "DUP": (1, 2, 0, 0), "DROP": (1, 0, 0, 0), "SWAP": (2, 2, 0, 0),
+    "OVER": (2, 3, 0, 0), "2DUP": (2, 4, 0, 0), "2DROP": (2, 0, 0, 0),
+    "2SWAP": (4, 4, 0, 0), "2OVER": (4, 6, 0, 0), "?DUP": None,
+    "ROT": (3, 3, 0, 0), "PICK": None, "DEPTH": (0, 1, 0, 0),
+    "-ROT": (3, 3, 0, 0), "2ROT": (6, 6, 0, 0), "NIP": (2, 1, 0, 0),
+    "2NIP": (4, 2, 0, 0), "TUCK": (2, 3, 0, 0), "ROLL": None,
+    # arithmetic
+    "MAX": (2, 1, 0, 0), "MIN": (2, 1, 0, 0),
+    "RSHIFT": (2, 1, 0, 0), "LSHIFT": (2, 1, 0, 0), "S>D": (1, 2, 0, 0),
+    "BL": (0, 1, 0, 0), "+": (2, 1, 0, 0), "-": (2, 1, 0, 0),
+    "*": (2, 1, 0, 0), "ABS": (1, 1, 0, 0), "NEGATE": (1, 1, 0, 0),
+    "MOD": (2, 1, 0, 0), "1+": (1, 1, 0, 0), "1-": (1, 1, 0, 0),
+    "M*": (2, 2, 0, 0),
+    # I/O
+    ".": (1, 0, 0, 0), "EMIT": (1, 0, 0, 0), "TYPE": (1, 0, 0, 0),
+    # memory
+    "!": (2, 0, 0, 0), "2!": (3, 0, 0, 0), "@": (1, 1, 0, 0),
+    "CELL": (0, 1, 0, 0), "CELL+": (1, 1, 0, 0), "CELLS": (1, 1, 0, 0),
+    "+!": (2, 0, 0, 0), "2@": (1, 2, 0, 0), "C!": (2, 0, 0, 0),
+    "C@": (1, 1, 0, 0), "CHAR+": (1, 1, 0, 0), "CHARS": (1, 1, 0, 0),
+    "ALIGN": (0, 0, 0, 0), "ALIGNED": (1, 1, 0, 0),
+    "HERE": (0, 1, 0, 0), ",": (1, 0, 0, 0), "C,": (1, 0, 0, 0),
+    "ALLOT": (1, 0, 0, 0),
+    # BASE and pictured numeric output
+    "BASE@": (0, 1, 0, 0), "BASE!": (1, 0, 0, 0), "DECIMAL": (0, 0, 0, 0),
+    "HEX": (0, 0, 0, 0), "OCTAL": (0, 0, 0, 0), "BINARY": (0, 0, 0, 0),
+    "<#": (0, 0, 0, 0), "#": (1, 1, 0, 0), "#S": (2, 2, 0, 0),
+    "#>": (1, 1, 0, 0), "HOLD": (1, 0, 0, 0), "SIGN": (1, 0, 0, 0),
+    # control flow; the loop parameters live on the inner interpreter's
+    # loop stack but are counted here as two return stack cells per loop,
+    # the standard's loop-sys.  (?DO) is given for its fall-through edge
+    # and the loop ends for theirs; the branch of (?DO) skips the loop
+    # without its parameters, the backward edges keep them
+    "0BRANCH": (1, 0, 0, 0), "BRANCH": (0, 0, 0, 0),
+    "(DO)": (2, 0, 0, 2), "(?DO)": (2, 0, 0, 2), "(LIT-DO)": (0, 0, 0, 2),
+    "(LOOP)": (0, 0, 2, 0), "(+LOOP)": (1, 0, 2, 0), "(-LOOP)": (1, 0, 2, 0),
+    "LEAVE": (0, 0, 2, 0), "UNLOOP": (0, 0, 2, 0),
+    "I": (0, 1, 2, 2), "J": (0, 1, 4, 4), "K": (0, 1, 6, 6),
+    "(OF)": (2, 1, 0, 0), "(JUMP-TABLE)": (1, 1, 0, 0),
+    "(CASE-LOW)": (0, 0, 0, 0), "(CASE-TARGET)": (0, 0, 0, 0),
+    "LIT": (0, 1, 0, 0), "EXIT": (0, 0, 0, 0),
+    # floating point
+    "F*": (2, 1, 0, 0), "F+": (2, 1, 0, 0), "F-": (2, 1, 0, 0),
+    "F/": (2, 1, 0, 0), "F>": (2, 1, 0, 0), "FSWAP": (2, 2, 0, 0),
+    "S>F": (1, 1, 0, 0), "F!": (2, 0, 0, 0), "F@": (1, 1, 0, 0),
+    "FDUP": (1, 2, 0, 0),
+    # return stack
+    ">R": (1, 0, 0, 1), "R>": (0, 1, 1, 0), "R@": (0, 1, 1, 1),
+    "2>R": (2, 0, 0, 2), "2R>": (0, 2, 2, 0), "2R@": (0, 2, 2, 2),
+    # dictionary
+    "EXECUTE": None, ">BODY": (1, 1, 0, 0),
+    "DEFER@": (1, 1, 0, 0), "DEFER!": (2, 0, 0, 0), "(DEFER-UNSET)": (0, 0, 0, 0),
+    # superinstructions
+    "(LIT+)": (1, 1, 0, 0), "(LIT@)": (0, 1, 0, 0), "(LIT!)": (1, 0, 0, 0),
+    "(LITF@)": (0, 1, 0, 0), "(LITF!)": (1, 0, 0, 0), "(DUP*)": (1, 1, 0, 0),
+    "(OVER+)": (2, 2, 0, 0), "(IJ*)": (0, 1, 4, 4), "(F@F*)": (2, 1, 0, 0),
+    "(<0BRANCH)": (2, 0, 0, 0), "(>0BRANCH)": (2, 0, 0, 0),
+    "(=0BRANCH)": (2, 0, 0, 0), "(F>0BRANCH)": (2, 0, 0, 0),
+    "(0=0BRANCH)": (1, 0, 0, 0),
+    # specialised variants
+    "(RAW+)": (2, 1, 0, 0), "(RAW-)": (2, 1, 0, 0), "(RAW*)": (2, 1, 0, 0),
+    "(RAW<)": (2, 1, 0, 0), "(RAW>)": (2, 1, 0, 0), "(RAW=)": (2, 1, 0, 0),
+    "(RAWF+)": (2, 1, 0, 0), "(RAWF-)": (2, 1, 0, 0),
+    "(RAWF*)": (2, 1, 0, 0), "(RAWF/)": (2, 1, 0, 0),
+    "(RAWF>)": (2, 1, 0, 0),
+}
+
+
+class StackEffect(object):
+    """Cells a word needs on entry and leaves on exit, per stack."""
+    _immutable_fields_ = ['ds_in', 'ds_out', 'rs_in', 'rs_out']
+
+    def __init__(self, ds_in, ds_out, rs_in, rs_out):
+        self.ds_in = ds_in
+        self.ds_out = ds_out
+        self.rs_in = rs_in
+        self.rs_out = rs_out
+
+    def then(self, other):
+        """The effect of running self followed by other."""
+        ds_carry = self.ds_out - other.ds_in
+        rs_carry = self.rs_out - other.rs_in
+        return StackEffect(self.ds_in + max(0, -ds_carry),
+                           other.ds_out + max(0, ds_carry),
+                           self.rs_in + max(0, -rs_carry),
+                           other.rs_out + max(0, rs_carry))
+
+    def to_string(self):
+        s = "( %d -- %d )" % (self.ds_in, self.ds_out)
+        if self.rs_in != 0 or self.rs_out != 0:
+            s += " ( R: %d -- %d )" % (self.rs_in, self.rs_out)
+        return s
+
+
+class BasicBlock(object):
+    """A straight-line run of a thread and its net stack depth changes."""
+
+    def __init__(self, start, end, ds_delta, rs_delta):
+        self.start = start        # int: first ip
+        self.end = end            # int: ip after the last word
+        self.ds_delta = ds_delta  # int
+        self.rs_delta = rs_delta  # int
+
+
+class ThreadEffect(StackEffect):
+    """Result of checking one thread.
+
+    ``checked`` is False when the thread uses a word whose effect is not
+    known statically; ``error`` is set when the thread is unbalanced.
+    """
+
+    def __init__(self, ds_in, ds_out, rs_in, rs_out, max_ds, max_rs, blocks,
+                 checked, error):
+        StackEffect.__init__(self, ds_in, ds_out, rs_in, rs_out)
+        self.max_ds = max_ds    # int: deepest data stack, counted from entry
+        self.max_rs = max_rs    # int: deepest return stack, counted from entry
+        self.blocks = blocks    # list of BasicBlock
+        self.checked = checked  # bool
+        self.error = error      # str, '' when balanced
+
+
+def unchecked_effect():
+    return ThreadEffect(0, 0, 0, 0, 0, 0, [], False, '')
+
+
+def unbalanced_effect(error):
+    return ThreadEffect(0, 0, 0, 0, 0, 0, [], True, error)
+
+
+# the known entries of STACK_EFFECTS, prebuilt at import time
+DECLARED_EFFECTS = {}
+for _name, _effect in STACK_EFFECTS.items():
+    if _effect is not None:
+        DECLARED_EFFECTS[_name] = StackEffect(*_effect)
+
+
+def make_effect_table(dictionary):
+    """Map the primitive Words of dictionary to their StackEffect."""
+    effects = {}
+    for name, effect in DECLARED_EFFECTS.items():
+        if name in dictionary:
+            effects[dictionary[name]] = effect
+    for fused_name, _, names in PROFILED_SUPERINSTRUCTIONS:
+        effect = StackEffect(0, 0, 0, 0)
+        for name in names:
+            component = DECLARED_EFFECTS.get(name, None)
+            if component is None:
+                effect = None
+                break
+            effect = effect.then(component)
+        if effect is not None:
+            effects[dictionary[fused_name]] = effect
+    return effects
+
+
+class StackChecker(object):
+    _immutable_fields_ = ['effects', 'wBRANCH', 'wEXIT', 'wLEAVE', 'wQDO',
+                          'loop_ends[*]']
+
+    def __init__(self, dictionary):
+        self.effects = make_effect_table(dictionary)
+        self.wBRANCH = dictionary["BRANCH"]
+        self.wEXIT = dictionary["EXIT"]
+        self.wLEAVE = dictionary["LEAVE"]
+        self.wQDO = dictionary["(?DO)"]
+        self.wCASE_TARGET = dictionary["(CASE-TARGET)"]
+        self.loop_ends = [dictionary["(LOOP)"], dictionary["(+LOOP)"],
+                          dictionary["(-LOOP)"]]
+
+    def effect_of(self, w):
+        """StackEffect of calling w, or None when it is not known."""
+        if w.prim is not None:
+            return self.effects.get(w, None)
+        thread = w.thread
+        if thread is None:
+            return None
+        if thread.effect is None:
+            # threads built outside ';' (CONSTANT, VARIABLE, ...)
+            code, lits = thread.to_lists()
+            thread.effect = self.check(code, lits)
+        effect = thread.effect
+        if not effect.checked or effect.error != '':
+            return None
+        return effect
+
+    def _ends_flow(self, code, i):
+        w = code[i]
+        if w is self.wCASE_TARGET:
+            # (JUMP-TABLE) only goes to the entries of its table, which
+            # are chained here, so the last entry does not fall through
+            return i + 1 == len(code) or code[i + 1] is not w
+        return (w is self.wBRANCH or w is self.wEXIT or w is self.wLEAVE or
+                w.tail)
+
+    def _blocks(self, code, targets):
+        blocks = []
+        n = len(code)
+        start = 0
+        ds_delta = 0
+        rs_delta = 0
+        for i in range(n):
+            if i > start and targets[i]:
+                blocks.append(BasicBlock(start, i, ds_delta, rs_delta))
+                start = i
+                ds_delta = 0
+                rs_delta = 0
+            w = code[i]
+            effect = self.effect_of(w)
+            if effect is not None:
+                ds_delta += effect.ds_out - effect.ds_in
+                rs_delta += effect.rs_out - effect.rs_in
+            if w.branch or self._ends_flow(code, i):
+                blocks.append(BasicBlock(start, i + 1, ds_delta, rs_delta))
+                start = i + 1
+                ds_delta = 0
+                rs_delta = 0
+        if start < n:
+            blocks.append(BasicBlock(start, n, ds_delta, rs_delta))
+        return blocks
+
+    def check(self, code, lits):
+        """Compute the ThreadEffect of the thread code/lits."""
+        n = len(code)
+        seen = [False] * (n + 1)
+        ds_at = [0] * (n + 1)
+        rs_at = [0] * (n + 1)
+        seen[0] = True
+        todo = [0]
+        min_ds = 0
+        max_ds = 0
+        min_rs = 0
+        max_rs = 0
+        exited = False
+        exit_ds = 0
+        exit_rs = 0
+        while todo:
+            ip = todo.pop()
+            ds = ds_at[ip]
+            rs = rs_at[ip]
+            if ip == n:
+                w = self.wEXIT # running off the end returns
+            else:
+                w = code[ip]
+            effect = self.effect_of(w)
+            if effect is None:
+                return unchecked_effect()
+            ds -= effect.ds_in
+            rs -= effect.rs_in
+            min_ds = min(min_ds, ds)
+            min_rs = min(min_rs, rs)
+            ds += effect.ds_out
+            rs += effect.rs_out
+            max_ds = max(max_ds, ds)
+            max_rs = max(max_rs, rs)
+
+            if w is self.wEXIT or w.tail:
+                if not exited:
+                    exited = True
+                    exit_ds = ds
+                    exit_rs = rs
+                elif ds != exit_ds or rs != exit_rs:
+                    return unbalanced_effect(
+                        "exits with different stack depths (%d and %d)"
+                        % (exit_ds, ds))
+                continue
+
+            # successors: (ip, data depth, return depth)
+            succ = []
+            if w.branch:
+                target = branch_target(lits[ip])
+                if w in self.loop_ends:
+                    # the backward edge keeps limit and counter
+                    succ.append((target, ds, rs + 2))
+                elif w is self.wQDO:
+                    # skipping the loop pushes no parameters
+                    succ.append((target, ds, rs - 2))
+                else:
+                    succ.append((target, ds, rs))
+            if not self._ends_flow(code, ip):
+                succ.append((ip + 1, ds, rs))
+            for next_ip, next_ds, next_rs in succ:
+                if not 0 <= next_ip <= n:
+                    return unbalanced_effect("branch out of the thread")
+                if not seen[next_ip]:
+                    seen[next_ip] = True
+                    ds_at[next_ip] = next_ds
+                    rs_at[next_ip] = next_rs
+                    todo.append(next_ip)
+                elif ds_at[next_ip] != next_ds or rs_at[next_ip] != next_rs:
+                    return unbalanced_effect(
+                        "stack depth at ip %d differs between paths "
+                        "(%d and %d)" % (next_ip, ds_at[next_ip], next_ds))
+
+        if not exited:
+            # never returns, e.g. an endless loop
+            exit_ds = min_ds
+            exit_rs = min_rs
+        if exit_rs != 0:
+            return unbalanced_effect(
+                "changes the return stack depth by %d" % exit_rs)
+        blocks = self._blocks(code, find_branch_targets(code, lits))
+        return ThreadEffect(-min_ds, exit_ds - min_ds, -min_rs, exit_rs - min_rs,
+                            max_ds, max_rs, blocks, True, '')
@@ -0,0 +1,161 @@
+"""Profile-guided superinstruction selection.
+
+Workflow:
+
+1. Run a workload with ``--profile-pairs FILE``.  While it runs,
+   ``InnerInterpreter.execute_thread`` feeds every dispatched word to a
+   PairProfiler, which counts how often each pair and triple of adjacent
+   words in a thread executed back to back.  At exit the counts are written
+   to FILE as a ranked table, one ``count word word [word]`` line each.
+
+2. Translate with ``--superinstructions FILE [--top N]`` after the target
+   file.  ``load_superinstructions`` reads the table at translation time and
+   generates a fused primitive for each of the N most frequent sequences that
+   can be fused.  install_primitives installs them and the ';' fusion stage in
+   rpyforth.optimizer picks them up next to the hand-written ones.
+"""
+
+from rpython.rlib import jit
+from rpython.rlib.listsort import make_timsort_class
+from rpython.rlib.streamio import open_file_as_stream
+from rpython.rlib.unroll import unrolling_iterable
+
+DEFAULT_TOP_N = 8
+
+# (fused word name, prim function, list of pattern word names), filled in at
+# translation time by load_superinstructions()
+PROFILED_SUPERINSTRUCTIONS = []
+
+
+class ProfileEntry(object):
+    def __init__(self, key, count):
+        self.key = key      # str: space separated word names
+        self.count = count  # int
+
+
+def _count_greater(a, b):
+    return a.count > b.count
+
+ProfileSort = make_timsort_class(lt=_count_greater)
+
+
+class PairProfiler(object):
+    """Counts adjacent word pairs and triples executed in sequence."""
+
+    def __init__(self):
+        self.counts = {}
+        self.last_thread = None
+        self.next_ip = -1
+        self.last_name = ''
+        self.prev_name = ''
+
+    def _bump(self, key):
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    @jit.dont_look_inside
+    def record(self, thread, ip, w):
+        if thread is self.last_thread and ip == self.next_ip:
+            pair = self.last_name + ' ' + w.name
+            self._bump(pair)
+            if self.prev_name != '':
+                self._bump(self.prev_name + ' ' + pair)
+            self.prev_name = self.last_name
+        else:
+            self.prev_name = ''
+        self.last_thread = thread
+        self.next_ip = thread.next_ip(ip, w)
+        self.last_name = w.name
+
+    def ranked(self):
+        entries = [ProfileEntry(key, count)
+                   for key, count in self.counts.items()]
+        ProfileSort(entries).sort()
+        return entries
+
+    def format_table(self):
+        lines = ["# count  words (rpyforth adjacent-word profile)\n"]
+        for entry in self.ranked():
+            lines.append("%d %s\n" % (entry.count, entry.key))
+        return ''.join(lines)
+
+    def write_table(self, path):
+        f = open_file_as_stream(path, 'w')
+        f.write(self.format_table())
+        f.close()
+
+
+# Translation-time side: plain Python, never seen by the annotator.
+
+def read_table(text):
+    """Parse a profile table into a list of (count, [names]) in file order."""
+    table = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split()
+        table.append((int(parts[0]), parts[1:]))
+    return table
+
+
+class _PrimCollector(object):
+    """Stand-in for OuterInterpreter that records define_prim calls."""
+
+    def __init__(self):
+        self.prims = {}
+
+    def define_prim(self, name, func, branch=False, operand=False):
+        self.prims[name] = (func, branch or operand)
+
+
+def _fusable_prims():
+    from rpyforth.primitives import install_primitives
+    collector = _PrimCollector()
+    install_primitives(collector)
+    prims = {}
+    for name, (func, reads_lit) in collector.prims.items():
+        # EXIT leaves the thread; operand/branch words read their own lits
+        # slot, which a fused word does not have per component
+        if name != "EXIT" and not reads_lit:
+            prims[name] = func
+    return prims
+
+
+def make_superinstruction(funcs):
+    steps = unrolling_iterable(funcs)
+
+    def prim_fused(inner, cur, ip):
+        for func in steps:
+            ip = func(inner, cur, ip)
+        return ip
+    return prim_fused
+
+
+def superinstruction_name(names):
+    return "(" + " ".join(names) + ")"
+
+
+def load_superinstructions(table, top_n=DEFAULT_TOP_N):
+    """Generate fused primitives for the top_n fusable sequences of table."""
+    from rpyforth.optimizer import SUPERINSTRUCTIONS
+    prims = _fusable_prims()
+    hand_written = [names for names, _, _ in SUPERINSTRUCTIONS]
+    ranked = sorted(table, key=lambda entry: -entry[0])
+    del PROFILED_SUPERINSTRUCTIONS[:]
+    for count, names in ranked:
+        if len(PROFILED_SUPERINSTRUCTIONS) >= top_n:
+            break
+        if names in hand_written:
+            continue
+        if not all(name in prims for name in names):
+            continue
+        func = make_superinstruction([prims[name] for name in names])
+        func.__name__ = 'prim_fused_%d' % len(PROFILED_SUPERINSTRUCTIONS)
+        PROFILED_SUPERINSTRUCTIONS.append(
+            (superinstruction_name(names), func, names))
+    return PROFILED_SUPERINSTRUCTIONS
+
+
+def load_superinstructions_file(path, top_n=DEFAULT_TOP_N):
+    with open(path) as f:
+        return load_superinstructions(read_table(f.read()), top_n)
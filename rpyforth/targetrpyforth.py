@@ -1,7 +1,9 @@
 import sys
 
 from rpyforth.inner_interp import InnerInterpreter
-from rpyforth.outer_interp import OuterInterpreter
+from rpyforth.outer_interp import OuterInterpreter, DEFAULT_INLINE_THRESHOLD
+from rpyforth.superinstructions import (
+    PairProfiler, DEFAULT_TOP_N, load_superinstructions_file)
 
 from rpython.rlib import jit
 from rpython.rlib.streamio import open_file_as_stream
@@ -17,21 +19,123 @@ def entry_point(argv):
             jit.set_user_param(None, jitarg)
             break
 
+    profile_path = None
+    for i in range(len(argv)):
+        if argv[i] == "--profile-pairs":
+            if len(argv) == i + 1:
+                print("missing argument after --profile-pairs")
+                return 2
+            profile_path = argv[i + 1]
+            del argv[i:i+2]
+            break
+
+    peephole = True
+    for i in range(len(argv)):
+        if argv[i] == "--no-peephole":
+            peephole = False
+            del argv[i]
+            break
+
+    fold = True
+    for i in range(len(argv)):
+        if argv[i] == "--no-fold":
+            fold = False
+            del argv[i]
+            break
+
+    specialize = True
+    for i in range(len(argv)):
+        if argv[i] == "--no-specialize":
+            specialize = False
+            del argv[i]
+            break
+
+    literal_loops = True
+    for i in range(len(argv)):
+        if argv[i] == "--no-literal-loops":
+            literal_loops = False
+            del argv[i]
+            break
+
+    inline_threshold = DEFAULT_INLINE_THRESHOLD
+    for i in range(len(argv)):
+        if argv[i] == "--inline":
+            if len(argv) == i + 1:
+                print("missing argument after --inline")
+                return 2
+            inline_threshold = int(argv[i + 1])
+            del argv[i:i+2]
+            break
+
+    cache_tos = False
+    for i in range(len(argv)):
+        if argv[i] == "--cache-tos":
+            cache_tos = True
+            del argv[i]
+            break
+
+    bytecode = False
+    for i in range(len(argv)):
+        if argv[i] == "--bytecode":
+            bytecode = True
+            del argv[i]
+            break
+
+    script = False
+    for i in range(len(argv)):
+        if argv[i] == "--script":
+            script = True
+            del argv[i]
+            break
+
+    check_stack = True
+    for i in range(len(argv)):
+        if argv[i] == "--no-check-stack":
+            check_stack = False
+            del argv[i]
+            break
+
     if len(argv) < 2:
-        print("Usage: %s filename x" % (argv[0],))
+        print("Usage: %s [--jit ARG] [--profile-pairs FILE] [--no-peephole] [--no-fold] [--no-specialize] [--no-literal-loops] [--inline N] [--cache-tos] [--bytecode] [--script] [--no-check-stack] filename" % (argv[0],))
         return 2
 
-    inner = InnerInterpreter()
+    inner = InnerInterpreter(cache_tos)
     outer = OuterInterpreter(inner)
+    outer.peephole = peephole
+    outer.fold = fold
+    outer.specialize = specialize
+    outer.literal_loops = literal_loops
+    outer.inline_threshold = inline_threshold
+    outer.check_stack = check_stack
+    outer.bytecode = bytecode
+    outer.script = script
+    if profile_path is not None:
+        # profile the words as written, not the already fused, folded or
+        # specialised threads
+        outer.fuse = False
+        outer.fold = False
+        outer.specialize = False
+        outer.literal_loops = False
+        inner.profiler = PairProfiler()
     path = argv[1]
     f = open_file_as_stream(path)
     for line in f.readall().split('\n'):
         outer.interpret_line(line)
     f.close()
+    if profile_path is not None:
+        inner.profiler.write_table(profile_path)
     return 0
 
 def target(driver, args):
     driver.exe_name = "rpyforth-%(backend)s"
+    # translation-time options: --superinstructions FILE [--top N]
+    top_n = DEFAULT_TOP_N
+    if "--top" in args:
+        top_n = int(args[args.index("--top") + 1])
+    if "--superinstructions" in args:
+        path = args[args.index("--superinstructions") + 1]
+        for name, _, _ in load_superinstructions_file(path, top_n):
+            print("superinstruction: %s" % (name,))
     return entry_point, None
 
 if __name__ == '__main__':
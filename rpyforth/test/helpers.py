@@ -0,0 +1,31 @@
+"""Interpreter setup and inspection shared by the tests."""
+
+from rpyforth.outer_interp import OuterInterpreter
+from rpyforth.inner_interp import InnerInterpreter
+
+
+def make(cache_tos=False, **options):
+    """An inner and outer interpreter, the options set on the outer one."""
+    inner = InnerInterpreter(cache_tos)
+    outer = OuterInterpreter(inner)
+    for name, value in options.items():
+        assert hasattr(outer, name), name
+        setattr(outer, name, value)
+    return inner, outer
+
+def run(line, **options):
+    inner, outer = make(**options)
+    outer.interpret_line(line)
+    return inner
+
+def compile_src(src, **options):
+    inner, outer = make(**options)
+    outer.interpret_line(src)
+    return outer
+
+def stack_of(inner):
+    return [inner.pop_ds().getvalue() for _ in range(inner.ds_ptr)][::-1]
+
+def code_names(outer, name):
+    # to_lists also decodes bytecode threads
+    return [w.name for w in outer.dict[name].thread.to_lists()[0]]
@@ -0,0 +1,94 @@
+import sys
+
+from rpyforth.objects import CodeThread, W_IntObject, W_FloatObject, wrap_int
+from rpyforth.bytecode import BytecodeThread, encode_thread
+from rpyforth.superinstructions import PairProfiler
+from helpers import make, stack_of
+
+PROGRAMS = [
+    ": T 0 SWAP 0 DO I + DUP 10 > IF LEAVE THEN LOOP ; 7 T",
+    ": T DUP 0< IF NEGATE ELSE 1+ THEN ; -3 T 4 T",
+    ": SQ DUP * ; : T SQ SQ ; 3 T",
+    ": A 1+ ; : B A A ; : T B B ; 0 T",
+    "VARIABLE X 5 X ! : T X @ 2 * X ! ; T T X @",
+    "FVARIABLE Z 1.5 Z F! : T Z F@ 2.0 F* ; T",
+    ": T EXECUTE 1+ ; 41 ' 1+ T",
+    ": T 10 0 DO 5 0 DO I J * DROP LOOP LOOP 1 ; T",
+    ": T 0 20 0 ?DO I + 3 +LOOP 0 10 DO I + 2 -LOOP ; T",
+]
+
+def values(lits):
+    # pooled objects decode to themselves, integers are rebuilt
+    return [w_lit.getvalue() if isinstance(w_lit, W_IntObject) else w_lit
+            for w_lit in lits]
+
+def test_bytecode_runs_like_code_lists():
+    for src in PROGRAMS:
+        results = []
+        for bytecode in (False, True):
+            inner, outer = make(bytecode=bytecode)
+            outer.interpret_line(src)
+            results.append(stack_of(inner))
+        assert results[0] == results[1], src
+
+def test_definitions_are_bytecode():
+    inner, outer = make(bytecode=True)
+    outer.interpret_line(": T 1 2 + ;")
+    assert isinstance(outer.dict["T"].thread, BytecodeThread)
+
+def test_round_trip():
+    for src in PROGRAMS:
+        inner, outer = make()
+        outer.interpret_line(src)
+        thread = outer.dict["T"].thread
+        code, lits = encode_thread(thread.code, thread.lits).to_lists()
+        assert code == thread.code, src
+        assert values(lits) == values(thread.lits), src
+
+def test_operands_are_inline_or_pooled():
+    inner, outer = make()
+    code = [outer.dict["LIT"], outer.dict["LIT"], outer.dict["LIT"],
+            outer.dict["DROP"], outer.dict["EXIT"]]
+    big = sys.maxint
+    lits = [wrap_int(-5), W_FloatObject(2.5), W_IntObject(big),
+            wrap_int(0), wrap_int(0)]
+    thread = encode_thread(code, lits)
+    # one slot per word plus one per operand
+    assert thread.length() == 8
+    assert thread.is_inline_int(1) and thread.int_at(1) == -5
+    assert not thread.is_inline_int(3)
+    assert thread.lit_at(3).getvalue() == 2.5
+    assert thread.int_at(5) == big
+    assert len(thread.consts) == 2
+    assert thread.words == [outer.dict["LIT"], outer.dict["DROP"],
+                            outer.dict["EXIT"]]
+
+def test_branch_targets_are_slot_offsets():
+    inner, outer = make(bytecode=True)
+    outer.interpret_line(": T IF 1 ELSE 2 THEN ;")
+    thread = outer.dict["T"].thread
+    names = [w.name for w in thread.to_lists()[0]]
+    assert names == ["0BRANCH", "LIT", "BRANCH", "LIT", "EXIT"]
+    # 0BRANCH jumps over LIT 1 and BRANCH to LIT 2 at slot 6
+    assert thread.int_at(1) == 6
+    assert thread.int_at(5) == 8
+
+def test_bytecode_is_smaller_than_code_lists():
+    src = ": T 0 100 0 DO I 3 * + DUP 50 > IF 2/ THEN LOOP ;"
+    inner, outer = make()
+    outer.interpret_line(src)
+    n = len(outer.dict["T"].thread.code)
+    inner, outer = make(bytecode=True)
+    outer.interpret_line(src)
+    assert outer.dict["T"].thread.length() < 2 * n
+
+def test_profiler_sees_words_across_operand_slots():
+    inner, outer = make(bytecode=True)
+    outer.fuse = False
+    outer.fold = False
+    outer.specialize = False
+    outer.literal_loops = False
+    inner.profiler = PairProfiler()
+    outer.interpret_line(": T 10 0 DO 1 DUP + DROP LOOP ; T")
+    assert inner.profiler.counts["LIT DUP"] == 10
+    assert inner.profiler.counts["DUP +"] == 10
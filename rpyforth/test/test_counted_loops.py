@@ -0,0 +1,71 @@
+from rpyforth.objects import W_LoopBounds
+from helpers import make, stack_of, code_names, compile_src
+
+PROGRAMS = [
+    ": T 0 4 0 DO I + LOOP ; T",
+    ": T 0 1000 0 DO I + LOOP ; T",
+    ": T 3 0 DO 2 0 DO I J 10 * + LOOP LOOP ; T",
+    ": T 2 0 DO 2 0 DO 2 0 DO K J I LOOP LOOP LOOP ; T",
+    ": T 20 10 DO I DUP 13 = IF LEAVE THEN LOOP ; T",
+    ": T 4 0 DO I >R R@ R> * LOOP ; T",
+    ": SQ DUP * ; : T 0 5 0 DO I SQ + LOOP ; T",
+    ": T 0 8 -2 DO I + LOOP 0 9 0 DO I + LOOP ; T",
+]
+
+# the code whose shape is checked is rewritten by the loop pass alone
+LOOPS_ONLY = {"fold": False, "fuse": False, "specialize": False}
+
+def test_specialized_loops_run_like_generic_ones():
+    for src in PROGRAMS:
+        for bytecode in (False, True):
+            results = []
+            for literal_loops in (False, True):
+                inner, outer = make(literal_loops=literal_loops,
+                                    bytecode=bytecode)
+                outer.interpret_line(src)
+                results.append(stack_of(inner))
+                assert inner.ls_ptr == 0
+            assert results[0] == results[1], src
+
+def test_literal_bounds_enter_with_one_word():
+    outer = compile_src(": T 100000 0 DO LOOP ;", **LOOPS_ONLY)
+    assert code_names(outer, "T") == ["(LIT-DO)", "(LOOP)", "EXIT"]
+    w_bounds = outer.dict["T"].thread.lits[0]
+    assert isinstance(w_bounds, W_LoopBounds)
+    assert (w_bounds.limit, w_bounds.start) == (100000, 0)
+    effect = outer.dict["T"].thread.effect
+    assert effect.checked and effect.error == ''
+
+def test_small_loops_are_unrolled():
+    outer = compile_src(": T 3 1 DO I DUP * LOOP ;", **LOOPS_ONLY)
+    assert code_names(outer, "T") == ["LIT", "DUP", "*", "LIT", "DUP", "*",
+                                      "EXIT"]
+    assert [w.getvalue() for w in outer.dict["T"].thread.lits[:4:3]] == [1, 2]
+
+def test_unrolled_loops_fold():
+    inner, outer = make()
+    outer.interpret_line(": T 0 4 0 DO I + LOOP ; T")
+    assert code_names(outer, "T") == ["LIT", "EXIT"]
+    assert inner.pop_int() == 6
+
+def test_nested_loops_unroll_innermost_first():
+    outer = compile_src(": T 2 0 DO 2 0 DO I J LOOP LOOP ;", **LOOPS_ONLY)
+    names = code_names(outer, "T")
+    assert "(DO)" not in names and "(LIT-DO)" not in names
+    assert names == ["LIT", "LIT"] * 4 + ["EXIT"]
+
+def test_outer_index_of_unrolled_loop():
+    # J of the unrolled loop is I of the loop around it
+    outer = compile_src(": T 100 0 DO 2 0 DO J LOOP LOOP ;", **LOOPS_ONLY)
+    assert code_names(outer, "T") == ["(LIT-DO)", "I", "I", "(LOOP)", "EXIT"]
+
+def test_loops_that_stay_loops():
+    for src in [": T 9 0 DO I LOOP ;",
+                ": T 4 0 DO I IF 1 THEN LOOP ;",
+                ": A IF 1 THEN ; : T 4 0 DO I A LOOP ;",
+                ": T 4 0 DO I 3 = IF LEAVE THEN LOOP ;"]:
+        names = code_names(compile_src(src, **LOOPS_ONLY), "T")
+        assert "(LIT-DO)" in names, src
+    outer = compile_src(": T 0 DO I LOOP ;", **LOOPS_ONLY)
+    names = code_names(outer, "T")
+    assert "(DO)" in names
@@ -0,0 +1,224 @@
+from rpyforth.objects import W_IntObject, W_FloatObject, W_CallSiteCache
+from rpyforth.outer_interp import OuterInterpreter
+from rpyforth.inner_interp import InnerInterpreter, FRAME_STACK_SIZE, \
+    UNBOXED_FLOATS, UNBOXED_FLOAT
+from helpers import run, stack_of
+
+
+def test_push_pop_int_is_unboxed():
+    inner = InnerInterpreter()
+    inner.push_int(42)
+    # a None in ds tags the slot as a raw integer
+    assert inner.ds[0] is None
+    assert inner.ds_int[0] == 42
+    assert inner.pop_int() == 42
+    assert inner.ds_ptr == 0
+
+def test_pop_ds_boxes_unboxed_int():
+    inner = InnerInterpreter()
+    inner.push_int(-7)
+    w_x = inner.pop_ds()
+    assert isinstance(w_x, W_IntObject)
+    assert w_x.intval == -7
+
+def test_pop_int_accepts_boxed_int():
+    inner = InnerInterpreter()
+    inner.push_ds(W_IntObject(5))
+    assert inner.pop_int() == 5
+    assert inner.ds[0] is None
+
+def test_mixed_int_and_float_cells():
+    inner = InnerInterpreter()
+    inner.push_int(1)
+    inner.push_ds(W_FloatObject(2.5))
+    inner.push_int(3)
+    assert inner.pop_int() == 3
+    assert inner.pop_ds().floatval == 2.5
+    assert inner.pop_int() == 1
+
+def test_arithmetic_leaves_unboxed_results():
+    inner = run("3 4 + 2 * DUP 1- SWAP OVER")
+    assert inner.ds_ptr == 3
+    for i in range(inner.ds_ptr):
+        assert inner.ds[i] is None
+    assert inner.pop_int() == 13
+    assert inner.pop_int() == 14
+    assert inner.pop_int() == 13
+
+def test_shuffles_keep_float_cells_boxed():
+    inner = run("1.5 2 SWAP DUP")
+    assert inner.pop_ds().floatval == 1.5
+    assert inner.pop_ds().floatval == 1.5
+    assert inner.pop_int() == 2
+
+def test_float_words_leave_unboxed_floats():
+    inner = run(": T S>F 1.5 2.0 F* F+ ; 3 T")
+    if UNBOXED_FLOATS:
+        # UNBOXED_FLOAT tags ds_int as the bits of a float
+        assert inner.ds[0] is UNBOXED_FLOAT
+    assert inner.top_float() == 6.0
+    w_f = inner.pop_ds()
+    assert isinstance(w_f, W_FloatObject) and w_f.floatval == 6.0
+    assert inner.ds[0] is None
+
+def test_float_words_accept_boxed_floats():
+    inner = InnerInterpreter()
+    inner.push_ds(W_FloatObject(0.5))
+    inner.push_float(0.25)
+    assert inner.pop_float() == 0.25
+    assert inner.pop_float() == 0.5
+    assert inner.ds_ptr == 0
+
+def test_calls_do_not_recurse_in_python():
+    # each W<k> has a branch, so it is called rather than inlined
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.peephole = False # no tail calls
+    outer.interpret_line(": W0 1+ ;")
+    depth = 3000
+    for k in range(1, depth + 1):
+        outer.interpret_line(": W%d DUP IF W%d THEN ;" % (k, k - 1))
+    outer.interpret_line("5 W%d" % depth)
+    assert inner.pop_int() == 6
+    assert inner.fp == 0
+
+def test_exit_returns_to_caller():
+    inner = run(": A 1 EXIT 2 ; : B DUP IF A 3 THEN ; -1 B")
+    assert inner.pop_int() == 3
+    assert inner.pop_int() == 1
+    assert inner.pop_int() == -1
+    assert inner.fp == 0
+
+def test_execute_runs_nested_call():
+    inner = run(": A DUP IF 1+ THEN ; : B EXECUTE 10 ; 4 ' A B")
+    assert inner.pop_int() == 10
+    assert inner.pop_int() == 5
+    assert inner.fp == 0
+
+def test_execute_does_not_recurse_in_python():
+    # R calls itself through its xt, 3000 frames deep
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.peephole = False # no tail calls
+    outer.interpret_line(": R DUP IF 1- OVER EXECUTE 1+ THEN ;")
+    outer.interpret_line("' R 3000 R")
+    assert inner.pop_int() == 3000
+    assert inner.fp == 0
+
+def test_execute_primitives_and_data_words():
+    inner = run("7 CONSTANT SEVEN : T EXECUTE ; "
+                "2 3 ' + T ' SEVEN T ' EXIT T 1 ' DUP T")
+    assert stack_of(inner) == [5, 7, 1, 1]
+
+def test_execute_inline_cache():
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.interpret_line(": T EXECUTE ; 1 ' 1+ T ' 1+ T ' 1- T")
+    w_cache = outer.dict["T"].thread.lits[0]
+    assert isinstance(w_cache, W_CallSiteCache)
+    assert len(w_cache.words) == 2 and not w_cache.megamorphic
+    for name in ["NEGATE", "ABS", "DUP", "DROP"]:
+        outer.interpret_line("' %s T" % name)
+    assert w_cache.megamorphic
+    # the fifth target is not recorded, so EXECUTE does not promote it
+    assert not w_cache.lookup(outer.dict["DUP"])
+    assert w_cache.lookup(outer.dict["1+"])
+    assert stack_of(inner) == [2]
+
+def test_execute_inline_cache_hits_do_not_write():
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.interpret_line(": T EXECUTE ; 1 ' 1+ T ' 1- T")
+    w_cache = outer.dict["T"].thread.lits[0]
+    words = w_cache.words
+    outer.interpret_line("' 1+ T ' 1- T ' 1+ T")
+    # the quasi-immutable list is only replaced on a miss
+    assert w_cache.words is words
+    assert words == [outer.dict["1+"], outer.dict["1-"]]
+    assert stack_of(inner) == [2]
+
+def test_tail_calls_run_in_constant_frame_space():
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.interpret_line(": W0 1+ ;")
+    depth = 3000
+    for k in range(1, depth + 1):
+        outer.interpret_line(": W%d DUP IF W%d THEN ;" % (k, k - 1))
+    outer.interpret_line("5 W%d" % depth)
+    assert inner.pop_int() == 6
+    assert inner.fp == 0
+    # the frame stack never had to grow
+    assert len(inner.frame_threads) == FRAME_STACK_SIZE
+
+def test_tail_recursion_runs_in_constant_frame_space():
+    for bytecode in (False, True):
+        inner = InnerInterpreter()
+        outer = OuterInterpreter(inner)
+        outer.bytecode = bytecode
+        outer.interpret_line(": CD DUP IF 1- RECURSE THEN ; "
+                             ": CE DUP IF 1- CE THEN ;")
+        code, _ = outer.dict["CD"].thread.to_lists()
+        assert code[-2].name == "(TAIL CD)"
+        assert code[-2].thread is outer.dict["CD"].thread
+        outer.interpret_line("100000 CD 100000 CE")
+        assert stack_of(inner) == [0, 0]
+        assert inner.fp == 0
+        assert len(inner.frame_threads) == FRAME_STACK_SIZE
+
+def run_tos_modes(line):
+    results = []
+    for cache_tos in (False, True):
+        inner = InnerInterpreter(cache_tos)
+        outer = OuterInterpreter(inner)
+        outer.interpret_line(line)
+        results.append(stack_of(inner))
+    assert results[0] == results[1]
+    return results[1]
+
+def test_cached_tos_stack_words():
+    assert run_tos_modes("1 2 3 OVER SWAP ROT DUP 2DUP DROP") == \
+        [1, 2, 3, 2, 2, 2]
+    assert run_tos_modes("1 2 3 4 2SWAP 2OVER 2DROP") == [3, 4, 1, 2]
+
+def test_cached_tos_deep_shuffles():
+    src = ("1 2 3 4 5 6 2ROT -ROT TUCK NIP 2NIP 1.5 3 ROLL 4 PICK "
+           "2SWAP 2OVER ROT")
+    assert run_tos_modes(src) == [3, 1, 4, 3, 1, 4, 3, 1.5]
+
+def test_deep_shuffles_keep_cells_unboxed():
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.fold = False
+    outer.interpret_line(": T 1 2 3 4 5 ROT 2SWAP TUCK -ROT NIP 3 PICK "
+                         "2 ROLL 2OVER 2NIP ; T")
+    assert inner.ds_ptr == 6
+    for i in range(inner.ds_ptr):
+        assert inner.ds[i] is None
+
+def test_cached_tos_arithmetic_and_flags():
+    assert run_tos_modes("3 4 + 2 * 1- NEGATE ABS 5 MOD 0= 7 3 > 2 5 <") == \
+        [0, -1, -1]
+
+def test_cached_tos_mixed_cells():
+    assert run_tos_modes("1.5 2 SWAP DUP F+ 3 OVER") == [2, 3.0, 3, 3.0]
+
+def test_cached_tos_unboxed_floats():
+    src = ("FVARIABLE Z 2.0 Z F! : T Z F@ FDUP F* 1.5 FSWAP F- Z F@ F> ; "
+           "T 1 S>F 0.5 F/")
+    assert run_tos_modes(src) == [0, 2.0]
+
+def test_cached_tos_keeps_top_out_of_arrays():
+    inner = InnerInterpreter(cache_tos=True)
+    inner.push_int(1)
+    inner.push_int(2)
+    assert inner.tos is None and inner.tos_int == 2
+    assert inner.ds_int[0] == 1
+    assert inner.pop_int() == 2
+    assert inner.tos_int == 1
+    assert inner.pop_int() == 1
+    assert inner.ds_ptr == 0
+
+def test_cached_tos_colon_words():
+    src = (": SQ DUP * ; : T 0 10 0 DO I SQ + LOOP ; "
+           ": F 0= IF 1 ELSE 2 THEN ; T 0 F 5 F")
+    assert run_tos_modes(src) == [285, 1, 2]
@@ -0,0 +1,38 @@
+from rpyforth.objects import (
+    W_IntObject, wrap_int, ZERO, TRUE, SMALL_INT_MIN, SMALL_INT_MAX)
+from rpyforth.inner_interp import InnerInterpreter
+
+
+def test_wrap_int_shares_small_ints():
+    assert wrap_int(5) is wrap_int(5)
+    assert wrap_int(SMALL_INT_MIN) is wrap_int(SMALL_INT_MIN)
+    assert wrap_int(SMALL_INT_MAX) is wrap_int(SMALL_INT_MAX)
+    assert wrap_int(0) is ZERO
+    assert wrap_int(-1) is TRUE
+
+def test_wrap_int_allocates_large_ints():
+    big = SMALL_INT_MAX + 1
+    w_a = wrap_int(big)
+    w_b = wrap_int(big)
+    assert w_a is not w_b
+    assert w_a.intval == big
+    assert wrap_int(SMALL_INT_MIN - 1).intval == SMALL_INT_MIN - 1
+
+def test_cache_entries_hold_their_value():
+    for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1):
+        assert wrap_int(i).intval == i
+
+def test_eq_is_by_value_not_identity():
+    assert wrap_int(7).eq(W_IntObject(7))
+    assert W_IntObject(7).eq(wrap_int(7))
+    assert wrap_int(100000).eq(wrap_int(100000))
+    assert not wrap_int(7).eq(wrap_int(8))
+
+def test_arithmetic_results_come_from_cache():
+    assert wrap_int(2).add(wrap_int(3)) is wrap_int(5)
+    assert wrap_int(2).s_to_d() is ZERO
+
+def test_boxing_from_data_stack_uses_cache():
+    inner = InnerInterpreter()
+    inner.push_int(12)
+    assert inner.pop_ds() is wrap_int(12)
@@ -0,0 +1,291 @@
+from helpers import make, stack_of, code_names
+
+
+def run_both(src):
+    results = []
+    for fuse in (False, True):
+        inner, outer = make(fuse=fuse, peephole=fuse, fold=fuse)
+        outer.interpret_line(src)
+        results.append(stack_of(inner))
+    assert results[0] == results[1]
+    return results[1]
+
+def test_fuse_dup_mul():
+    inner, outer = make()
+    outer.interpret_line(": SQUARE DUP * ; 7 SQUARE")
+    assert code_names(outer, "SQUARE") == ["(DUP*)", "EXIT"]
+    assert inner.pop_int() == 49
+
+def test_fuse_lit_add_and_over_add():
+    inner, outer = make()
+    outer.interpret_line(": T 5 + OVER + ; 1 2 T")
+    assert code_names(outer, "T") == ["(LIT+)", "(OVER+)", "EXIT"]
+    assert stack_of(inner) == [1, 8]
+
+def test_fuse_lit_fetch():
+    inner, outer = make()
+    outer.interpret_line("99 16 !  : T 16 @ ; T")
+    assert code_names(outer, "T") == ["(LIT@)", "EXIT"]
+    assert inner.pop_int() == 99
+
+def test_fuse_float_literal_is_not_int_fused():
+    inner, outer = make()
+    outer.interpret_line(": T 1.5 + ;")
+    assert code_names(outer, "T") == ["LIT", "+", "EXIT"]
+
+def test_fuse_i_j_mul():
+    src = ": NESTED 3 0 DO 3 0 DO I J * LOOP LOOP ; NESTED"
+    inner, outer = make(literal_loops=False)
+    outer.interpret_line(src)
+    assert "(IJ*)" in code_names(outer, "NESTED")
+    assert run_both(src) == [0, 0, 0, 0, 1, 2, 0, 2, 4]
+
+def test_fuse_compare_branch_remaps_targets():
+    src = ": T 0 BEGIN DUP 5 < WHILE 1+ REPEAT ; T"
+    inner, outer = make()
+    outer.interpret_line(src)
+    names = code_names(outer, "T")
+    assert "(<0BRANCH)" in names
+    assert "0BRANCH" not in names
+    assert run_both(src) == [5]
+
+def test_fuse_float_compare_branch():
+    src = ": T F> IF 1 ELSE 2 THEN ; 5.0 3.0 T 2.0 8.0 T"
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert code_names(outer, "T")[0] == "(F>0BRANCH)"
+    assert run_both(src) == [1, 2]
+
+def test_fuse_ffetch_fmul():
+    src = "FVARIABLE X 2.5 X F!  : T F@ F* ; 4.0 X T"
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert "(F@F*)" in code_names(outer, "T")
+    assert run_both(src) == [10.0]
+
+def test_no_fusion_into_branch_target():
+    src = ": T 1 SWAP IF 2 THEN + ; 5 0 T 5 -1 T"
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert "(LIT+)" not in code_names(outer, "T")
+    assert run_both(src) == [6, 5, 3]
+
+def test_fusion_disabled():
+    inner, outer = make(fuse=False)
+    outer.interpret_line(": SQUARE DUP * ;")
+    assert code_names(outer, "SQUARE") == ["DUP", "*", "EXIT"]
+
+def test_leave_jumps_past_loop():
+    src = ": T 10 0 DO I 3 = IF LEAVE THEN I LOOP 100 ; T"
+    assert run_both(src) == [0, 1, 2, 100]
+
+def test_leave_in_nested_loop_exits_inner_only():
+    src = ": T 3 0 DO 10 0 DO I 2 = IF LEAVE THEN I LOOP LOOP ; T"
+    assert run_both(src) == [0, 1, 0, 1, 0, 1]
+
+def test_peephole_drops_swap_swap_and_dup_drop():
+    src = ": T SWAP SWAP DUP DROP - ; 7 3 T"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["-", "EXIT"]
+    assert run_both(src) == [4]
+
+def test_peephole_keeps_pair_split_by_branch_target():
+    src = ": T IF SWAP THEN SWAP ; 1 2 0 T 1 2 -1 T"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    assert code_names(outer, "T").count("SWAP") == 2
+    assert run_both(src) == [2, 1, 1, 2]
+
+def test_peephole_inverts_zero_equal_branch():
+    src = ": T 0= IF 10 ELSE 20 THEN ; 0 T 3 T"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    names = code_names(outer, "T")
+    assert names[0] == "(0=0BRANCH)"
+    assert "0=" not in names
+    assert run_both(src) == [10, 20]
+
+def test_peephole_removes_dead_code_after_exit():
+    src = ": T 1 EXIT 2 3 ; T"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["LIT", "EXIT"]
+    assert run_both(src) == [1]
+
+def test_peephole_collapses_branch_chains():
+    # the inner ELSE branch lands on the outer ELSE branch
+    src = ": T IF IF 1 ELSE 2 THEN ELSE 3 THEN ; -1 -1 T 0 -1 T 0 T"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    thread = outer.dict["T"].thread
+    for ip in range(len(thread.code)):
+        if thread.code[ip].branch:
+            target = thread.lits[ip].intval
+            assert target >= len(thread.code) or \
+                thread.code[target] is not outer.dict["BRANCH"]
+    assert run_both(src) == [1, 2, 3]
+
+def test_peephole_drops_branch_to_next_word():
+    src = ": T IF 1 ELSE THEN 2 ; -1 T 0 T"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    assert "BRANCH" not in code_names(outer, "T")
+    assert run_both(src) == [1, 2, 2]
+
+def test_peephole_disabled():
+    inner, outer = make(fuse=False, peephole=False)
+    outer.interpret_line(": T SWAP SWAP 0= IF 1 THEN ;")
+    assert code_names(outer, "T") == \
+        ["SWAP", "SWAP", "0=", "0BRANCH", "LIT", "EXIT"]
+
+def test_inline_short_colon_word():
+    src = ": SQUARE DUP * ; : T 3 SQUARE 1+ ; T"
+    inner, outer = make(fuse=False, fold=False, specialize=False)
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["LIT", "DUP", "*", "1+", "EXIT"]
+    assert inner.pop_int() == 10
+
+def test_inline_keeps_lits_of_inlined_body():
+    src = "VARIABLE X 42 X ! : T X @ ; T"
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["(LIT@)", "EXIT"]
+    assert inner.pop_int() == 42
+
+def test_no_inline_of_word_with_branches():
+    src = ": ABS2 DUP 0< IF NEGATE THEN ; : T ABS2 ; -5 T"
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["(TAIL ABS2)"]
+    assert inner.pop_int() == 5
+
+def test_no_inline_above_threshold():
+    inner, outer = make(fuse=False)
+    outer.inline_threshold = 2
+    outer.interpret_line(": A DUP DUP ; : B DUP DUP DUP ; : T A B ;")
+    assert code_names(outer, "T") == ["DUP", "DUP", "(TAIL B)"]
+
+def test_inline_disabled():
+    inner, outer = make(fuse=False)
+    outer.inline_threshold = 0
+    outer.interpret_line(": SQUARE DUP * ; : T SQUARE 1+ ;")
+    assert code_names(outer, "T") == ["SQUARE", "1+", "EXIT"]
+
+def test_tail_call_replaces_call_and_exit():
+    src = ": A DUP 0< IF NEGATE THEN ; : B 1+ A ; -5 B"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    assert code_names(outer, "B") == ["1+", "(TAIL A)"]
+    assert inner.pop_int() == 4
+    assert inner.fp == 0
+
+def test_tail_call_keeps_exit_that_is_jumped_to():
+    src = ": A 1+ DUP IF 1+ THEN ; : B DUP IF A THEN ; 0 B 1 B"
+    inner, outer = make(fuse=False)
+    outer.interpret_line(src)
+    assert code_names(outer, "B") == ["DUP", "0BRANCH", "(TAIL A)", "EXIT"]
+    assert stack_of(inner) == [0, 3]
+
+def test_no_tail_call_without_peephole():
+    inner, outer = make(fuse=False, peephole=False)
+    outer.interpret_line(": A DUP IF 1+ THEN ; : B A ;")
+    assert code_names(outer, "B") == ["A", "EXIT"]
+
+def test_fold_constant_expression():
+    inner, outer = make()
+    outer.interpret_line("80 CONSTANT WIDTH : T WIDTH 2 * 1+ ; T")
+    assert code_names(outer, "T") == ["LIT", "EXIT"]
+    assert inner.pop_int() == 161
+
+def test_fold_float_expression():
+    src = ("-2.0e0 FCONSTANT XMIN 1.0e0 FCONSTANT XMAX 80 CONSTANT WIDTH "
+           ": T XMAX XMIN F- WIDTH S>F F/ ; T")
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["LIT", "EXIT"]
+    assert inner.pop_ds().getvalue() == 3.0 / 80
+
+def test_fold_pure_colon_word():
+    src = ": CLAMP DUP 0< IF DROP 0 THEN ; : T -5 CLAMP 7 CLAMP + ; T"
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["LIT", "EXIT"]
+    assert inner.pop_int() == 7
+
+def test_fold_colon_word_with_literal_arithmetic():
+    # INC2 is stored fused, as (LIT+) 2
+    for inline_threshold in (0, 8):
+        inner, outer = make()
+        outer.inline_threshold = inline_threshold
+        outer.interpret_line(": INC2 2 + ; : T 5 INC2 ; T : B DUP INC2 ; "
+                             ": U 1 B + ; U")
+        assert code_names(outer, "INC2") == ["(LIT+)", "EXIT"]
+        assert code_names(outer, "T") == ["LIT", "EXIT"]
+        assert code_names(outer, "U") == ["LIT", "EXIT"]
+        assert stack_of(inner) == [7, 4]
+
+def test_fold_float_colon_word():
+    for inline_threshold in (0, 8):
+        inner, outer = make()
+        outer.inline_threshold = inline_threshold
+        outer.interpret_line(": HALF 0.5E0 F* ; : T 3.0E0 HALF HALF ; T")
+        assert code_names(outer, "T") == ["LIT", "EXIT"]
+        assert stack_of(inner) == [0.75]
+
+def test_no_fold_of_mixed_operand_kinds():
+    inner, outer = make()
+    outer.inline_threshold = 0
+    outer.interpret_line(": TOF 2 * S>F 0.5E0 F* ; : T 3 TOF ; T")
+    assert code_names(outer, "T") == ["LIT", "(TAIL TOF)"]
+    assert stack_of(inner) == [3.0]
+
+def test_fold_keeps_partial_literal_inputs():
+    inner, outer = make(fuse=False)
+    outer.interpret_line(": T 2 3 * + ; 1 T")
+    assert code_names(outer, "T") == ["LIT", "+", "EXIT"]
+    assert inner.pop_int() == 7
+
+def test_no_fold_across_branch_target():
+    assert run_both(": T IF 1 ELSE 2 THEN 3 + ; 0 T 1 T") == [5, 4]
+
+def test_no_fold_of_impure_words():
+    inner, outer = make()
+    outer.inline_threshold = 0
+    outer.interpret_line("VARIABLE X : SET 5 X ! 1 ; : T SET 2 + ; T X @")
+    assert code_names(outer, "T") == ["SET", "(LIT+)", "EXIT"]
+    assert stack_of(inner) == [3, 5]
+
+def test_no_fold_of_division_by_zero():
+    inner, outer = make()
+    outer.interpret_line(": T 7 0 MOD ;")
+    assert code_names(outer, "T") == ["LIT", "LIT", "MOD", "EXIT"]
+
+def test_fold_disabled():
+    inner, outer = make(fold=False, specialize=False)
+    outer.interpret_line(": T 2 3 * ; T")
+    assert code_names(outer, "T") == ["LIT", "LIT", "*", "EXIT"]
+    assert inner.pop_int() == 6
+
+def test_data_words_compile_to_literals():
+    src = "VARIABLE X 5 X ! 3 CONSTANT THREE : T X @ THREE + X ! ; T X @"
+    inner, outer = make()
+    outer.inline_threshold = 0
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["(LIT@)", "(LIT+)", "(LIT!)", "EXIT"]
+    assert inner.pop_int() == 8
+
+def test_float_variables_fuse_fetch_and_store():
+    src = "FVARIABLE Z 1.5 Z F! : T Z F@ FDUP F* Z F! ; T Z F@"
+    inner, outer = make(specialize=False)
+    outer.interpret_line(src)
+    assert code_names(outer, "T") == ["(LITF@)", "FDUP", "F*", "(LITF!)",
+                                      "EXIT"]
+    assert inner.pop_ds().getvalue() == 2.25
+
+def test_data_words_keep_their_body():
+    src = ("CREATE BUF 7 , VARIABLE X 4 CONSTANT FOUR "
+           "' BUF >BODY @ ' X >BODY X - ' FOUR EXECUTE")
+    inner, outer = make()
+    outer.interpret_line(src)
+    assert stack_of(inner) == [7, 0, 4]
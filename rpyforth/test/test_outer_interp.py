@@ -1,16 +1,11 @@
 from rpyforth.objects import W_StringObject, CELL_SIZE_BYTES, W_IntObject, W_FloatObject, W_WordObject
 from rpyforth.outer_interp import OuterInterpreter
 from rpyforth.inner_interp import InnerInterpreter
+from helpers import run, stack_of, code_names
 
 
 import pytest
 
-def run(line):
-    inner = InnerInterpreter()
-    outer = OuterInterpreter(inner)
-    outer.interpret_line(line)
-    return inner
-
 def run_and_pop(line):
     return run(line).pop_ds()
 
@@ -237,6 +232,105 @@ def test_leave_in_loop():
     while inner.ds_ptr > 0:
         results.append(inner.pop_ds().intval)
     assert results == [5, 4, 3, 2, 1, 0]
+    assert inner.ls_ptr == 0
+
+def test_k_in_triple_loop():
+    inner = run(": T 0 2 0 DO 3 0 DO 4 0 DO K 100 * J 10 * + I + + "
+                "LOOP LOOP LOOP ; T")
+    assert inner.pop_int() == sum(100 * k + 10 * j + i for k in range(2)
+                                  for j in range(3) for i in range(4))
+    assert inner.ls_ptr == 0
+
+def test_qdo_skips_empty_loop():
+    inner = run(": T 0 SWAP 0 ?DO I + LOOP ; 0 T 4 T")
+    assert [inner.pop_int() for _ in range(2)] == [6, 0]
+    assert inner.ls_ptr == 0
+    inner = run(": T 5 5 ?DO 1 LEAVE LOOP 2 ; T")
+    assert stack_of(inner) == [2]
+
+def test_plus_loop():
+    inner = run(": T 10 0 DO I 3 +LOOP ; T")
+    assert stack_of(inner) == [0, 3, 6, 9]
+    # a negative step runs down to the limit included
+    inner = run(": T 0 10 DO I -4 +LOOP ; T")
+    assert stack_of(inner) == [10, 6, 2]
+    inner = run(": T 0 0 DO I -1 +LOOP ; T")
+    assert stack_of(inner) == [0]
+    assert inner.ls_ptr == 0
+
+def test_minus_loop():
+    inner = run(": T 0 10 DO I 3 -LOOP ; T")
+    assert stack_of(inner) == [10, 7, 4, 1]
+    inner = run(": T 0 3 DO I 1 -LOOP ; T")
+    assert stack_of(inner) == [3, 2, 1]
+    assert inner.ls_ptr == 0
+
+def test_unloop_exit():
+    inner = run(": T 10 0 DO I 3 = IF I UNLOOP EXIT THEN LOOP -1 ; "
+                ": U 2 0 DO T LOOP ; T U")
+    assert stack_of(inner) == [3, 3, 3]
+    assert inner.ls_ptr == 0
+    outer = OuterInterpreter(InnerInterpreter())
+    outer.interpret_line(": T 10 0 DO I 3 = IF I UNLOOP EXIT THEN LOOP -1 ; "
+                         ": U 0 SWAP 0 ?DO I + 2 +LOOP ;")
+    for name in ["T", "U"]:
+        effect = outer.dict[name].thread.effect
+        assert effect.checked and effect.error == ''
+
+def test_begin_until():
+    inner = run(": T BEGIN DUP 1- DUP 0= UNTIL ; 3 T")
+    assert stack_of(inner) == [3, 2, 1, 0]
+    # the body runs at least once
+    inner = run(": T 0 BEGIN 1+ DUP 5 > UNTIL ; T")
+    assert stack_of(inner) == [6]
+
+def test_begin_again():
+    inner = run(": T 1 BEGIN 2 * DUP 100 > IF EXIT THEN AGAIN ; T")
+    assert stack_of(inner) == [128]
+    inner = run(": T BEGIN DUP 0= IF EXIT THEN 1- 0 BEGIN 1+ DUP 3 = "
+                "UNTIL DROP AGAIN ; 4 T")
+    assert stack_of(inner) == [0]
+
+def test_until_is_one_backward_branch():
+    outer = OuterInterpreter(InnerInterpreter())
+    outer.interpret_line(": T BEGIN 1- DUP 0< UNTIL ;")
+    thread = outer.dict["T"].thread
+    code, lits = thread.to_lists()
+    names = [w.name for w in code]
+    assert names == ["1-", "DUP", "0<", "0BRANCH", "EXIT"]
+    assert lits[3].intval == 0
+    assert thread.effect.checked and thread.effect.error == ''
+
+def test_recurse():
+    inner = run(": FIB DUP 2 < IF EXIT THEN DUP 1- RECURSE SWAP 2 - RECURSE "
+                "+ ; 10 FIB 1 FIB")
+    assert stack_of(inner) == [55, 1]
+
+def test_recursion_by_name():
+    inner = run(": ACK OVER 0= IF NIP 1+ EXIT THEN DUP 0= IF DROP 1- 1 ACK "
+                "EXIT THEN OVER SWAP 1- ACK SWAP 1- SWAP ACK ; 2 3 ACK")
+    assert stack_of(inner) == [9]
+    inner = run(": SUM DUP IF DUP 1- SUM + THEN ; 30 SUM")
+    assert inner.pop_int() == 465
+
+def test_redefinition_calls_previous_word():
+    # a name that is already defined keeps its old meaning until ';'
+    inner = run(": T 1 ; : T T 10 + ; T")
+    assert stack_of(inner) == [11]
+
+def test_recursive_words_in_bytecode():
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.bytecode = True
+    outer.interpret_line(": FIB DUP 2 < IF EXIT THEN DUP 1- FIB SWAP 2 - "
+                         "RECURSE + ; 15 FIB")
+    assert inner.pop_int() == 610
+    assert outer.dict["FIB"] in outer.dict["FIB"].thread.to_lists()[0]
+
+def test_loop_parameters_are_not_on_return_stack():
+    inner = run(": T 3 0 DO I >R I R> + LOOP ; T")
+    assert [inner.pop_int() for _ in range(3)] == [4, 2, 0]
+    assert inner.rs_ptr == 0 and inner.ls_ptr == 0
 
 def test_compare_op():
     assert run_and_pop("5 3 >").intval == -1  # True
@@ -256,6 +350,34 @@ def test_pick():
     assert run_and_pop("10 20 30 1 PICK").intval == 20
     assert run_and_pop("10 20 30 2 PICK").intval == 10
 
+def test_deep_pick():
+    src = "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 "
+    assert run_and_pop(src + "19 PICK").intval == 1
+    assert run_and_pop(src + ": T 0 10 0 DO I 1+ PICK + LOOP ; T").intval == \
+        sum(range(11, 21))
+
+def test_roll():
+    inner = run("1 2 3 4 3 ROLL")
+    assert [inner.pop_ds().intval for _ in range(4)] == [1, 4, 3, 2]
+    assert run_and_pop("1 2 0 ROLL").intval == 2
+    inner = run("1 2 3 2 ROLL")
+    assert [inner.pop_ds().intval for _ in range(3)] == [1, 3, 2]
+
+def test_nip_tuck_minus_rot():
+    inner = run("1 2 NIP")
+    assert inner.pop_ds().intval == 2 and inner.ds_ptr == 0
+    inner = run("1 2 TUCK")
+    assert [inner.pop_ds().intval for _ in range(3)] == [2, 1, 2]
+    inner = run("1 2 3 -ROT")
+    assert [inner.pop_ds().intval for _ in range(3)] == [2, 1, 3]
+
+def test_2rot_2nip():
+    inner = run("1 2 3 4 5 6 2ROT")
+    assert [inner.pop_ds().intval for _ in range(6)] == [2, 1, 6, 5, 4, 3]
+    inner = run("1 2 3 4 2NIP")
+    assert [inner.pop_ds().intval for _ in range(2)] == [4, 3]
+    assert inner.ds_ptr == 0
+
 def test_char_bracket():
     # [CHAR] A should compile character code for 'A'
     assert run_and_pop(": TEST [CHAR] A ; TEST").intval == ord('A')
@@ -728,3 +850,116 @@ def test_sign_in_pno():
     outer = OuterInterpreter(inner)
     # Complete PNO example with SIGN
     outer.interpret_line("<# -5 SIGN 0 0 #>")
+
+def test_defer_is():
+    inner = run(": DOUBLE 2 * ; : SQUARE DUP * ; DEFER OP : T OP 1+ ; "
+                "' DOUBLE IS OP 5 T ' SQUARE IS OP 5 T")
+    assert inner.pop_int() == 26
+    assert inner.pop_int() == 11
+
+def test_is_and_action_of_compiled():
+    inner = run(": DOUBLE 2 * ; DEFER OP "
+                ": INSTALL IS OP ; : GET ACTION-OF OP ; "
+                "' DOUBLE INSTALL 4 OP 5 GET EXECUTE")
+    assert inner.pop_int() == 10
+    assert inner.pop_int() == 8
+
+def test_defer_fetch_store_and_chains():
+    inner = run("DEFER A DEFER B ' 1+ ' B DEFER! ' B ' A DEFER! "
+                "1 A ' A DEFER@")
+    assert inner.pop_ds().word.name == "B"
+    assert inner.pop_int() == 2
+
+def test_execute_of_deferred_word():
+    inner = run("DEFER OP ' NEGATE IS OP : T EXECUTE ; 3 ' OP T")
+    assert inner.pop_int() == -3
+
+def test_unset_deferred_word(capfd):
+    run("DEFER OP OP")
+    assert "Deferred word not set" in capfd.readouterr()[0]
+
+CASE_TABLE = (": T CASE 1 OF 10 ENDOF 2 OF 20 ENDOF 4 OF 40 ENDOF "
+              "3 OF 30 ENDOF DUP 100 + SWAP ENDCASE ; ")
+
+def test_case_jump_table():
+    for bytecode in (False, True):
+        inner = InnerInterpreter()
+        outer = OuterInterpreter(inner)
+        outer.bytecode = bytecode
+        outer.interpret_line(CASE_TABLE + "0 T 1 T 2 T 3 T 4 T 5 T -7 T")
+        # the default clause sees the selector
+        assert stack_of(inner) == [100, 10, 20, 30, 40, 105, 93]
+        names = code_names(outer, "T")
+        assert "(JUMP-TABLE)" in names
+        assert "(OF)" not in names
+        assert outer.dict["T"].thread.effect.checked
+
+def test_case_chain():
+    # too few, sparse or computed selectors are tested one by one
+    for src, expected in [
+            (": T CASE 1 OF 10 ENDOF 2 OF 20 ENDOF 0 SWAP ENDCASE ; ",
+             [10, 20, 0]),
+            (": T CASE 1 OF 10 ENDOF 50 OF 20 ENDOF 99 OF 30 ENDOF "
+             "0 SWAP ENDCASE ; ", [10, 0, 0]),
+            (": T CASE 1 OF 10 ENDOF 1 1+ OF 20 ENDOF 3 OF 30 ENDOF "
+             "0 SWAP ENDCASE ; ", [10, 20, 30])]:
+        inner = InnerInterpreter()
+        outer = OuterInterpreter(inner)
+        outer.interpret_line(src + "1 T 2 T 3 T")
+        names = code_names(outer, "T")
+        assert "(JUMP-TABLE)" not in names
+        assert "(OF)" in names
+        assert stack_of(inner) == expected
+
+def test_case_first_clause_wins():
+    inner = run(": T CASE 1 OF 10 ENDOF 2 OF 20 ENDOF 1 OF 11 ENDOF "
+                "3 OF 30 ENDOF ENDCASE ; 1 T 3 T")
+    assert stack_of(inner) == [10, 30]
+
+def test_case_in_loop_with_leave():
+    inner = run(": T 0 10 0 DO I CASE 1 OF 1+ ENDOF 2 OF 2 + ENDOF "
+                "3 OF 3 + ENDOF 5 OF LEAVE ENDOF ENDCASE LOOP ; T")
+    assert inner.pop_int() == 6
+
+def test_nested_case():
+    inner = run(": T CASE 1 OF CASE 1 OF 11 ENDOF 2 OF 12 ENDOF 3 OF 13 "
+                "ENDOF 0 SWAP ENDCASE ENDOF 2 OF DROP 2 ENDOF ENDCASE ; "
+                "3 1 T 7 2 T")
+    assert stack_of(inner) == [13, 2]
+
+def run_script(lines, script=True):
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.script = script
+    for line in lines:
+        outer.interpret_line(line)
+    return inner
+
+def test_script_mode_runs_like_interpretation():
+    for src in ["1 2 + 3 *", "5 0> IF 1 ELSE 2 THEN 0 IF 3 ELSE 4 THEN",
+                "VARIABLE X 7 X ! X @ 1+ X ! X @",
+                ": SQ DUP * ; 4 SQ 1 CHAR A 3 CONSTANT C C SQ",
+                "1.5 2.0 F* 3 S>F F+", "DEFER OP ' 1+ IS OP 3 OP"]:
+        results = []
+        for script in (False, True):
+            results.append(stack_of(run_script([src], script)))
+        assert results[0] == results[1], src
+
+def test_script_top_level_loops():
+    inner = run_script(["0 10 0 DO I + LOOP",
+                        "0 BEGIN 1+ DUP 5 = UNTIL",
+                        "3 CASE 1 OF 10 ENDOF 3 OF 30 ENDOF ENDCASE"])
+    assert stack_of(inner) == [45, 5, 30]
+
+def test_script_control_structure_across_lines():
+    inner = run_script(["0 5 0 DO", "  I 2 * +", "LOOP 1"])
+    assert stack_of(inner) == [20, 1]
+
+def test_script_long_line():
+    inner = run_script(["0 " + "1+ " * 150])
+    assert inner.pop_int() == 150
+
+def test_script_parse_time_word_in_loop(capfd):
+    inner = run_script(["3 0 DO VARIABLE X LOOP", "42"])
+    assert "inside a top-level control structure" in capfd.readouterr()[0]
+    assert stack_of(inner) == [42]
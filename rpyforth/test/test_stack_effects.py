@@ -0,0 +1,91 @@
+from rpyforth.outer_interp import OuterInterpreter
+from rpyforth.inner_interp import InnerInterpreter
+from rpyforth.stack_effects import STACK_EFFECTS, StackEffect
+from helpers import compile_src
+
+
+def effect(outer, name):
+    return outer.dict[name].thread.effect
+
+def test_every_primitive_declares_an_effect():
+    outer = compile_src("")
+    for name, w in outer.dict.items():
+        if w.prim is not None:
+            assert name in STACK_EFFECTS, name
+
+def test_straight_line_effect():
+    outer = compile_src(": T DUP ROT ;")
+    e = effect(outer, "T")
+    assert e.checked and e.error == ''
+    assert (e.ds_in, e.ds_out) == (2, 3)
+    assert e.max_ds == 1
+    assert e.to_string() == "( 2 -- 3 )"
+
+def test_branches_and_loops_balance():
+    outer = compile_src(": T 0 SWAP 0 DO I + DUP 10 > IF LEAVE THEN LOOP ;")
+    e = effect(outer, "T")
+    assert e.error == ''
+    assert (e.ds_in, e.ds_out, e.rs_in, e.rs_out) == (1, 1, 0, 0)
+    assert e.max_rs == 2
+
+def test_callee_effect_is_used():
+    outer = compile_src(": A DUP 0< IF NEGATE THEN ; : B A A + ;")
+    assert effect(outer, "A").to_string() == "( 1 -- 1 )"
+    assert effect(outer, "B").to_string() == "( 2 -- 1 )"
+
+def test_constant_and_variable_words():
+    outer = compile_src("5 CONSTANT FIVE VARIABLE X : T FIVE X ! ;")
+    assert effect(outer, "T").to_string() == "( 0 -- 0 )"
+
+def test_unbalanced_branches_are_reported(capsys):
+    outer = compile_src(": T IF 1 2 ELSE 3 THEN ;")
+    e = effect(outer, "T")
+    assert e.checked
+    assert "differs between paths" in e.error
+    assert "Unbalanced definition T" in capsys.readouterr().out
+
+def test_case_jump_table_balances(capsys):
+    outer = compile_src(": E CASE 1 OF 10 ENDOF 2 OF 20 ENDOF 3 OF 30 ENDOF "
+                        "0 SWAP ENDCASE ;")
+    code = [w.name for w in outer.dict["E"].thread.code]
+    assert "(JUMP-TABLE)" in code
+    e = effect(outer, "E")
+    assert e.checked and e.error == ''
+    assert e.to_string() == "( 1 -- 1 )"
+    assert capsys.readouterr().out == ''
+
+def test_unbalanced_exits_are_reported():
+    outer = compile_src(": T IF 1 EXIT THEN ;")
+    assert "exits with different stack depths" in effect(outer, "T").error
+
+def test_return_stack_leak_is_reported():
+    outer = compile_src(": T >R ;")
+    assert "return stack" in effect(outer, "T").error
+
+def test_runtime_dependent_words_are_unchecked():
+    outer = compile_src(": T ?DUP ; : U T 1 ;")
+    assert not effect(outer, "T").checked
+    assert not effect(outer, "U").checked
+
+def test_basic_blocks():
+    outer = compile_src(": T DUP IF 1+ ELSE DROP 0 THEN 2 * ;")
+    blocks = [(b.start, b.end, b.ds_delta)
+              for b in effect(outer, "T").blocks]
+    code = [w.name for w in outer.dict["T"].thread.code]
+    assert code == ["DUP", "0BRANCH", "1+", "BRANCH", "DROP", "LIT",
+                    "LIT", "*", "EXIT"]
+    assert blocks == [(0, 2, 0), (2, 4, 0), (4, 6, 0), (6, 9, 0)]
+
+def test_effect_composition():
+    dup = StackEffect(1, 2, 0, 0)
+    add = StackEffect(2, 1, 0, 0)
+    assert dup.then(add).to_string() == "( 1 -- 1 )"
+    assert add.then(dup).to_string() == "( 2 -- 2 )"
+    assert StackEffect(0, 1, 0, 0).then(add).to_string() == "( 1 -- 1 )"
+
+def test_unbalanced_definitions_can_be_silenced(capsys):
+    outer = OuterInterpreter(InnerInterpreter())
+    outer.check_stack = False
+    outer.interpret_line(": T IF 1 2 ELSE 3 THEN ;")
+    assert effect(outer, "T").error != ''
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,70 @@
+import pytest
+
+from rpyforth.outer_interp import OuterInterpreter
+from rpyforth.inner_interp import InnerInterpreter
+from rpyforth.superinstructions import (
+    PairProfiler, PROFILED_SUPERINSTRUCTIONS, read_table,
+    load_superinstructions)
+
+
+@pytest.fixture
+def restore_profiled():
+    saved = PROFILED_SUPERINSTRUCTIONS[:]
+    yield
+    PROFILED_SUPERINSTRUCTIONS[:] = saved
+
+def profile(src):
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.fuse = False
+    outer.fold = False
+    outer.specialize = False
+    outer.literal_loops = False
+    inner.profiler = PairProfiler()
+    outer.interpret_line(src)
+    return inner.profiler
+
+def test_profiler_counts_adjacent_pairs_and_triples():
+    profiler = profile(": T 100 0 DO 1 2 SWAP DROP DROP LOOP ; T")
+    assert profiler.counts["SWAP DROP"] == 100
+    assert profiler.counts["SWAP DROP DROP"] == 100
+    assert profiler.counts["DROP DROP"] == 100
+    # (DO) runs once, so the pair across the loop entry is counted once
+    assert profiler.counts["(DO) LIT"] == 1
+
+def test_profiler_does_not_pair_across_calls():
+    profiler = profile(": A DUP ; : B A DROP ; 1 B")
+    assert "DUP DROP" not in profiler.counts
+    assert "EXIT DROP" not in profiler.counts
+
+def test_profile_table_is_ranked():
+    profiler = profile(": T 10 0 DO 1 DUP + DROP LOOP ; T")
+    table = read_table(profiler.format_table())
+    counts = [count for count, _ in table]
+    assert counts == sorted(counts, reverse=True)
+    assert (10, ["DUP", "+"]) in table
+
+def test_load_superinstructions_skips_unfusable(restore_profiled):
+    table = read_table("""
+# count words
+900 LIT +
+800 BRANCH DUP
+700 DUP *
+600 SWAP DROP
+500 ROT ROT
+400 DUP EXIT
+""")
+    loaded = load_superinstructions(table, 2)
+    names = [name for name, _, _ in loaded]
+    # LIT/BRANCH/EXIT cannot be fused, DUP * is hand-written already
+    assert names == ["(SWAP DROP)", "(ROT ROT)"]
+
+def test_generated_superinstruction_is_fused(restore_profiled):
+    load_superinstructions(read_table("50 SWAP DROP"), 1)
+    inner = InnerInterpreter()
+    outer = OuterInterpreter(inner)
+    outer.interpret_line(": NIP2 SWAP DROP ; 1 2 NIP2")
+    assert [w.name for w in outer.dict["NIP2"].thread.code] == \
+        ["(SWAP DROP)", "EXIT"]
+    assert inner.pop_int() == 2
+    assert inner.ds_ptr == 0
@@ -0,0 +1,66 @@
+from rpyforth.inner_interp import UNBOXED_FLOATS
+from helpers import make, stack_of, code_names, compile_src
+
+PROGRAMS = [
+    ": T 2 3 + 4 * 5 < ; T",
+    ": T 0 SWAP 0 DO I + DUP 10 > IF LEAVE THEN LOOP ; 7 T",
+    ": T DUP 1+ OVER 2DUP * - = ; 4 T",
+    "FVARIABLE Z 1.5 Z F! : T Z F@ FDUP F* 0.25 F+ FDUP Z F! ; T",
+    "FVARIABLE Z 1.0 Z F! : T Z F@ 2.0 F/ 3.0 F- 0.5 FSWAP F> ; T",
+    ": T S>F 2.0 F* 1.0 F+ ; 3 T",
+    ": T F+ F* ; 1.0 2.0 3.0 T",
+    ": T IF 1.5 ELSE 2.5 THEN 1.0 F+ ; 0 T -1 T",
+]
+
+# the code whose shape is checked is not folded or fused
+TYPES_ONLY = {"fold": False, "fuse": False}
+
+def test_specialized_threads_run_like_generic_ones():
+    for src in PROGRAMS:
+        for cache_tos in (False, True):
+            results = []
+            for specialize in (False, True):
+                inner, outer = make(cache_tos, specialize=specialize)
+                outer.interpret_line(src)
+                results.append(stack_of(inner))
+            assert results[0] == results[1], src
+
+def test_literal_operands_are_proven():
+    outer = compile_src(": T 2 3 + 4 * 5 < ;", **TYPES_ONLY)
+    assert code_names(outer, "T") == ["LIT", "LIT", "(RAW+)", "LIT",
+                                      "(RAW*)", "LIT", "(RAW<)", "EXIT"]
+
+def test_shuffles_carry_types():
+    outer = compile_src(": T 1 DUP + 2 SWAP - ;", **TYPES_ONLY)
+    assert code_names(outer, "T") == ["LIT", "DUP", "(RAW+)", "LIT",
+                                      "SWAP", "(RAW-)", "EXIT"]
+
+def test_unknown_operands_stay_generic():
+    # the inputs of T and the result of a call are not known
+    outer = compile_src(": A 1+ ; : T + A 1 + ;", **TYPES_ONLY)
+    outer.inline_threshold = 0
+    outer.interpret_line(": U A 1 + ;")
+    assert code_names(outer, "T")[0] == "+"
+    assert code_names(outer, "U") == ["A", "LIT", "+", "EXIT"]
+
+def test_loop_indices_are_raw():
+    outer = compile_src(": T 5 0 DO 5 0 DO I J + DROP LOOP LOOP ;",
+                        **TYPES_ONLY)
+    assert "(RAW+)" in code_names(outer, "T")
+
+def test_types_restart_at_branch_targets():
+    outer = compile_src(": T 1 IF 2 ELSE 3 THEN 4 + ;", **TYPES_ONLY)
+    assert "+" in code_names(outer, "T")
+
+def test_float_kernels_use_unboxed_variants():
+    if not UNBOXED_FLOATS:
+        return
+    outer = compile_src(
+        "FVARIABLE Z : T Z F@ FDUP F* 2.0 F/ 1.0 F- 4.0 F> ;", **TYPES_ONLY)
+    assert code_names(outer, "T") == ["LIT", "F@", "FDUP", "(RAWF*)", "LIT",
+                                      "(RAWF/)", "LIT", "(RAWF-)", "LIT",
+                                      "(RAWF>)", "EXIT"]
+
+def test_integers_are_not_floats():
+    outer = compile_src(": T 1 2 F+ ;", **TYPES_ONLY)
+    assert code_names(outer, "T") == ["LIT", "LIT", "F+", "EXIT"]
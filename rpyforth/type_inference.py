@@ -0,0 +1,152 @@
+"""
+Compile-time type inference and primitive specialisation.
+
+The data stack tags every cell: a raw integer in ds_int, an unboxed float
+(see InnerInterpreter.push_float) or a boxed W_Object.  Generic primitives
+such as + and F* check the tag of each operand.  At ``;``, after fusion,
+this pass walks every thread with the types of the top cells, seeded from
+literal kinds and the signatures in PRIMITIVE_TYPES, and replaces a word
+whose operands are proven raw by its unchecked variant in VARIANTS.  In
+``Z F@ FDUP F* 0.25 F+`` F* and F+ become (RAWF*) and (RAWF+), and the floats
+between them never get boxed.
+
+Only straight-line code is typed: the types start over at branch targets,
+and a word with an unknown stack effect forgets everything below it.
+"""
+
+from rpyforth.objects import W_IntObject, W_FloatObject
+from rpyforth.optimizer import find_branch_targets
+from rpyforth.inner_interp import UNBOXED_FLOATS
+
+
+ANY = 'x'    # boxed, or not known
+INT = 'i'    # raw integer
+FLOAT = 'f'  # unboxed float
+
+
+# name: (operand types, result types) of the primitives whose results are
+# always raw.  The operand types are the ones the variant needs.
+PRIMITIVE_TYPES = {
+    "+": ("ii", "i"), "-": ("ii", "i"), "*": ("ii", "i"),
+    "<": ("ii", "i"), ">": ("ii", "i"), "=": ("ii", "i"),
+    "0=": ("x", "i"), "0<": ("x", "i"), "0>": ("x", "i"),
+    "1+": ("x", "i"), "1-": ("x", "i"), "NEGATE": ("x", "i"),
+    "ABS": ("x", "i"), "@": ("x", "i"), "CELL": ("", "i"),
+    "CELLS": ("x", "i"), "CELL+": ("x", "i"),
+    "(LIT+)": ("x", "i"), "(LIT@)": ("", "i"), "(DUP*)": ("x", "i"),
+    "(OVER+)": ("xx", "ii"), "(IJ*)": ("", "i"),
+    "I": ("", "i"), "J": ("", "i"), "K": ("", "i"),
+    "F+": ("ff", "f"), "F-": ("ff", "f"), "F*": ("ff", "f"),
+    "F/": ("ff", "f"), "F>": ("ff", "i"),
+    "S>F": ("x", "f"), "F@": ("x", "f"), "(LITF@)": ("", "f"),
+    "(F@F*)": ("xx", "f"),
+}
+
+# name: unchecked variant, used when the operands have the types above
+VARIANTS = {
+    "+": "(RAW+)", "-": "(RAW-)", "*": "(RAW*)",
+    "<": "(RAW<)", ">": "(RAW>)", "=": "(RAW=)",
+    "F+": "(RAWF+)", "F-": "(RAWF-)", "F*": "(RAWF*)",
+    "F/": "(RAWF/)", "F>": "(RAWF>)",
+}
+
+# name: (cells taken, where each result comes from) for the shuffles that
+# move cells without boxing them
+SHUFFLES = {
+    "DUP": (1, [0, 0]), "DROP": (1, []), "SWAP": (2, [1, 0]),
+    "OVER": (2, [0, 1, 0]), "2DUP": (2, [0, 1, 0, 1]), "2DROP": (2, []),
+    "ROT": (3, [1, 2, 0]), "-ROT": (3, [2, 0, 1]), "NIP": (2, [1]),
+    "TUCK": (2, [1, 0, 1]), "2SWAP": (4, [2, 3, 0, 1]),
+    "2OVER": (4, [0, 1, 2, 3, 0, 1]), "2ROT": (6, [2, 3, 4, 5, 0, 1]),
+    "2NIP": (4, [2, 3]), "FDUP": (1, [0, 0]), "FSWAP": (2, [1, 0]),
+}
+
+
+def literal_type(w_lit):
+    if isinstance(w_lit, W_IntObject):
+        return INT
+    if isinstance(w_lit, W_FloatObject):
+        return FLOAT
+    return ANY
+
+
+def take(types, n):
+    """Pop the types of the top n cells, padding unknown ones with ANY."""
+    top = [ANY] * n
+    k = n - 1
+    while k >= 0 and len(types) > 0:
+        top[k] = types.pop()
+        k -= 1
+    return top
+
+
+def proven(types, wanted):
+    """Whether the top cells have the types in wanted, deepest first."""
+    n = len(wanted)
+    if len(types) < n:
+        return False
+    base = len(types) - n
+    for k in range(n):
+        if wanted[k] != ANY and types[base + k] != wanted[k]:
+            return False
+    return True
+
+
+class TypeInference(object):
+    """Specialises the words of a thread on the types of their operands."""
+
+    def __init__(self, dictionary, checker):
+        self.signatures = {}
+        for name, signature in PRIMITIVE_TYPES.items():
+            if name in dictionary:
+                self.signatures[dictionary[name]] = signature
+        self.variants = {}
+        for name, variant in VARIANTS.items():
+            if name in dictionary and variant in dictionary:
+                self.variants[dictionary[name]] = dictionary[variant]
+        self.shuffles = {}
+        for name, shuffle in SHUFFLES.items():
+            if name in dictionary:
+                self.shuffles[dictionary[name]] = shuffle
+        self.checker = checker # stack_effects.StackChecker
+        self.wLIT = dictionary["LIT"]
+
+    def push(self, types, t):
+        if t == FLOAT and not UNBOXED_FLOATS:
+            t = ANY
+        types.append(t)
+
+
+def specialize_thread(inference, code, lits):
+    """Replace words whose operand types are proven by their variants."""
+    n = len(code)
+    targets = find_branch_targets(code, lits)
+    new_code = [code[k] for k in range(n)]
+    types = [] # types of the top cells, deepest first
+    for i in range(n):
+        w = code[i]
+        if targets[i]:
+            types = []
+        if w is inference.wLIT:
+            inference.push(types, literal_type(lits[i]))
+        elif w in inference.shuffles:
+            n_in, picks = inference.shuffles[w]
+            top = take(types, n_in)
+            for k in picks:
+                types.append(top[k])
+        elif w in inference.signatures:
+            operands, results = inference.signatures[w]
+            if w in inference.variants and proven(types, operands):
+                new_code[i] = inference.variants[w]
+            take(types, len(operands))
+            for t in results:
+                inference.push(types, t)
+        else:
+            effect = inference.checker.effect_of(w)
+            if effect is None:
+                types = []
+            else:
+                take(types, effect.ds_in)
+                for k in range(effect.ds_out):
+                    types.append(ANY)
+    return new_code, lits